@@ -0,0 +1,114 @@
+"""Bench commands for frappe_whatsapp."""
+import hashlib
+import hmac
+import json
+import time
+
+import click
+from frappe.commands import get_site, pass_context
+
+
+@click.command("whatsapp-backfill-call-rollups")
+@click.option("--chunk-size", default=1000, help="Calls processed per transaction")
+@pass_context
+def backfill_call_rollups(context, chunk_size):
+	"""Rebuild WhatsApp Call Rollup from the WhatsApp Call history."""
+	import frappe
+	from frappe_whatsapp.utils.call_analytics import backfill_call_rollups as backfill
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		processed = backfill(chunk_size=chunk_size)
+		click.echo(f"Processed {processed} calls")
+	finally:
+		frappe.destroy()
+
+
+def run_benchmark(app, requests, method, path, site, body=None, headers=None):
+	"""Call a WSGI app in-process and return (requests per second, p50 ms, p99 ms)."""
+	from werkzeug.test import Client
+
+	client = Client(app)
+	headers = {"X-Frappe-Site-Name": site, **(headers or {})}
+	latencies = []
+	for _ in range(requests):
+		start = time.perf_counter()
+		response = client.open(path, method=method, data=body, headers=headers)
+		response.close()
+		latencies.append(time.perf_counter() - start)
+
+	latencies.sort()
+	return (
+		requests / sum(latencies),
+		latencies[len(latencies) // 2] * 1000,
+		latencies[int(len(latencies) * 0.99)] * 1000,
+	)
+
+
+@click.command("whatsapp-benchmark-webhook")
+@click.option("--requests", default=2000, help="Requests per scenario")
+@click.option("--frappe-post", is_flag=True, default=False,
+	help="Also POST to the Frappe endpoint (creates webhook logs)")
+@pass_context
+def benchmark_webhook(context, requests, frappe_post):
+	"""Compare the ingest app with the Frappe webhook endpoint, in-process."""
+	import frappe
+	from frappe.app import application as frappe_application
+	from frappe_whatsapp import ingest
+
+	site = get_site(context)
+	frappe.init(site=site)
+	frappe.connect()
+	try:
+		from frappe_whatsapp.utils.webhook import publish_ingest_config
+
+		publish_ingest_config()
+		frappe.db.commit()
+		settings = frappe.get_cached_doc("WhatsApp Settings")
+		verify_token = settings.webhook_verify_token
+		app_secret = settings.get_password("app_secret", raise_exception=False)
+	finally:
+		frappe.destroy()
+
+	if not verify_token or not app_secret:
+		click.echo("Set the webhook verify token and app secret in WhatsApp Settings first")
+		return
+
+	# a template status update for an unknown template changes nothing when processed
+	body = json.dumps({
+		"object": "whatsapp_business_account",
+		"entry": [{"changes": [{
+			"field": "message_template_status_update",
+			"value": {"event": "APPROVED", "message_template_id": "benchmark"},
+		}]}],
+	}).encode()
+	signed = {
+		"Content-Type": "application/json",
+		"X-Hub-Signature-256": "sha256=" + hmac.new(app_secret.encode(), body, hashlib.sha256).hexdigest(),
+	}
+	verify = f"?hub.verify_token={verify_token}&hub.challenge=1"
+	frappe_path = "/api/method/frappe_whatsapp.utils.webhook.webhook"
+	benchmark_queue = "whatsapp_webhook_benchmark"
+	ingest_app = ingest.make_application(queue_key=benchmark_queue, wake=False)
+
+	scenarios = [
+		("ingest GET", ingest_app, "GET", "/" + verify, None, None),
+		("ingest POST", ingest_app, "POST", "/", body, signed),
+		("frappe GET", frappe_application, "GET", frappe_path + verify, None, None),
+	]
+	if frappe_post:
+		scenarios.append(("frappe POST", frappe_application, "POST", frappe_path, body, signed))
+
+	click.echo(f"{'scenario':<14}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}")
+	try:
+		for label, app, method, path, data, headers in scenarios:
+			rps, p50, p99 = run_benchmark(app, requests, method, path, site, data, headers)
+			click.echo(f"{label:<14}{rps:>10.0f}{p50:>10.2f}{p99:>10.2f}")
+	finally:
+		redis_site = ingest.get_site(site)
+		redis_site["redis"].delete(f"{redis_site['prefix']}{benchmark_queue}")
+
+
+commands = [backfill_call_rollups, benchmark_webhook]
@@ -53,6 +53,43 @@ frappe.ui.form.on('Bulk WhatsApp Message', {
                     }
                 });
             }).addClass('btn-danger');
+
+            frm.add_custom_button(__('Export Results'), function() {
+                frappe.prompt({
+                    fieldname: 'file_format',
+                    fieldtype: 'Select',
+                    label: __('File Format'),
+                    options: 'CSV\nExcel',
+                    default: 'CSV'
+                }, function(values) {
+                    frappe.call({
+                        method: 'frappe_whatsapp.utils.export.start_export',
+                        args: {
+                            bulk_message: frm.doc.name,
+                            file_format: values.file_format
+                        },
+                        callback: function(r) {
+                            let export_id = r.message;
+                            frappe.realtime.off('whatsapp_export_progress');
+                            frappe.realtime.on('whatsapp_export_progress', function(data) {
+                                if (data.export_id !== export_id) return;
+                                if (data.error) {
+                                    frappe.hide_progress();
+                                    frappe.msgprint(__('Export failed, see the Error Log'));
+                                } else if (data.file_url) {
+                                    frappe.hide_progress();
+                                    frappe.msgprint(__('Exported {0} messages: <a href="{1}">Download</a>',
+                                        [data.rows, encodeURI(data.file_url)]));
+                                    frm.reload_doc();
+                                } else {
+                                    frappe.show_progress(__('Exporting'), data.rows, data.total);
+                                }
+                            });
+                            frappe.show_alert({message: __('Export queued'), indicator: 'green'});
+                        }
+                    });
+                }, __('Export Results'));
+            });
         }
     },
     validate: function(frm) {
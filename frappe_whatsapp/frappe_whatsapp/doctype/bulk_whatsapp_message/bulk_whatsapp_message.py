@@ -4,10 +4,14 @@
 import frappe
 from frappe import _
 import json
-from frappe.utils import cint, get_datetime, now
+from frappe.utils import cint, get_datetime, now_datetime
 from frappe.model.document import Document
 from frappe.model.naming import make_autoname
 
+from frappe_whatsapp.utils.metrics import inc
+from frappe_whatsapp.utils.scheduled_send import get_quiet_hours, get_send_time, schedule_after_commit
+from frappe_whatsapp.utils.timings import dump_timings, now_ts
+
 # Add these files to your frappe_whatsapp app
 
 # 1. First, create a new DocType for Bulk WhatsApp Messaging
@@ -41,16 +45,80 @@ class BulkWhatsAppMessage(Document):
             self.recipient_count = len(self.recipients)
     
     def on_submit(self):
+        if self.schedule_sends():
+            self.db_set("status", "Scheduled")
+            return
         self.db_set("status", "Queued")
         self.queue_messages()
-    
-    def queue_messages(self):
-        """Queue messages for sending"""
+
+    def get_recipient_time_zones(self):
+        if self.recipient_type == 'Recipient List' and self.recipient_list:
+            time_zones = frappe.get_all(
+                "WhatsApp Recipient",
+                filters={"parent": self.recipient_list},
+                pluck="time_zone",
+                distinct=True,
+            )
+        else:
+            time_zones = [recipient.time_zone for recipient in self.recipients]
+        return {time_zone or "" for time_zone in time_zones}
+
+    def schedule_sends(self):
+        """Schedule one send per recipient time zone.
+
+        Returns:
+            bool: False if every recipient can be messaged right away
+        """
+        quiet_hours = get_quiet_hours() if self.respect_quiet_hours else None
+        if not self.scheduled_time and not quiet_hours:
+            return False
+
+        schedule = {
+            time_zone: {
+                "send_at": str(get_send_time(
+                    self.scheduled_time, time_zone, self.send_in_recipient_time_zone, quiet_hours
+                )),
+                "released": 0,
+            }
+            for time_zone in self.get_recipient_time_zones()
+        }
+        now = now_datetime()
+        if all(get_datetime(group["send_at"]) <= now for group in schedule.values()):
+            return False
+
+        self.db_set("send_schedule", json.dumps(schedule, indent=1))
+        for time_zone, group in schedule.items():
+            schedule_after_commit(f"{self.doctype}|{self.name}|{time_zone}", group["send_at"])
+        return True
+
+    def release_scheduled(self, time_zone=""):
+        """Queue the messages of a time zone group when it is due."""
+        # locked and read again, so a group released twice is queued once
+        self.send_schedule = frappe.db.get_value(self.doctype, self.name, "send_schedule", for_update=True)
+        schedule = json.loads(self.send_schedule or "{}")
+        group = schedule.get(time_zone)
+        if self.docstatus != 1 or not group or group["released"]:
+            return
+
+        group["released"] = 1
+        pending = any(not group["released"] for group in schedule.values())
+        self.db_set({
+            "send_schedule": json.dumps(schedule, indent=1),
+            "status": "Scheduled" if pending else "Queued",
+        })
+        self.queue_messages(time_zone)
+
+    def queue_messages(self, time_zone=None):
+        """Queue messages for sending, only to recipients of `time_zone` if given"""
+        triggered_at = now_ts()
         if self.recipient_type == 'Recipient List' and self.recipient_list:
             # Fetch recipients from the recipient list
+            filters = {"parent": self.recipient_list}
+            if time_zone is not None:
+                filters["time_zone"] = time_zone or ("is", "not set")
             recipients = frappe.get_all(
                 "WhatsApp Recipient", 
-                filters={"parent": self.recipient_list},
+                filters=filters,
                 fields=["mobile_number", "name", "recipient_name", "recipient_data"]
             )
             
@@ -59,19 +127,23 @@ class BulkWhatsAppMessage(Document):
                     self.doctype, self.name,
                     "create_single_message",
                     "long", 4000,
-                    recipient=recipient
+                    recipient=recipient,
+                    triggered_at=triggered_at,
                 )
         else:
             # Use recipients from the current document
             for recipient in self.recipients:
+                if time_zone is not None and (recipient.time_zone or "") != time_zone:
+                    continue
                 frappe.enqueue_doc(
                     self.doctype, self.name,
                     "create_single_message",
                     "long", 4000,
-                    recipient=recipient
+                    recipient=recipient,
+                    triggered_at=triggered_at,
                 )
     
-    def create_single_message(self, recipient):
+    def create_single_message(self, recipient, triggered_at=None):
         """Create a single message in the queue"""
         # message_content = self.message_content
         
@@ -93,6 +165,8 @@ class BulkWhatsAppMessage(Document):
         # wa_message.message = message_content
         wa_message.flags.custom_ref_doc = json.loads(recipient.get("recipient_data", "{}"))
         wa_message.bulk_message_reference = self.name
+        if triggered_at:
+            wa_message.timings = dump_timings({"triggered": triggered_at})
         
         # If template is being used
         if self.use_template:
@@ -107,7 +181,9 @@ class BulkWhatsAppMessage(Document):
         wa_message.status = "Queued"
         try:
             wa_message.insert(ignore_permissions=True)
+            inc("whatsapp_bulk_messages_total", {"status": "queued"})
         except Exception:
+            inc("whatsapp_bulk_messages_total", {"status": "failed"})
             self.db_set("status", "Partially Failed")
         # Update message count
         self.db_set("sent_count", cint(self.sent_count) + 1)
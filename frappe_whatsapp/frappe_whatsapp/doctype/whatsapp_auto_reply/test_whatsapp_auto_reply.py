@@ -0,0 +1,34 @@
+# Copyright (c) 2026, Shridhar Patil and Contributors
+# See license.txt
+
+from frappe.tests import UnitTestCase
+
+from frappe_whatsapp.utils.auto_reply import ReplyMatcher, get_regex_error
+
+
+class TestWhatsAppAutoReply(UnitTestCase):
+	def setUp(self):
+		self.matcher = ReplyMatcher([
+			{"name": "Stop", "match_type": "Exact", "keywords": "STOP\nunsubscribe"},
+			{"name": "Hours", "match_type": "Keyword", "keywords": "opening hours\nopen"},
+			{"name": "Order", "match_type": "Regex", "keywords": r"order\s*#?\d+"},
+			{"name": "Greeting", "match_type": "Keyword", "keywords": "hi\nhello"},
+		])
+
+	def test_exact(self):
+		self.assertEqual(self.matcher.match("  Stop "), "Stop")
+		self.assertIsNone(self.matcher.match("please stop"))
+
+	def test_keyword_matches_whole_words(self):
+		self.assertEqual(self.matcher.match("When are you OPEN?"), "Hours")
+		self.assertIsNone(self.matcher.match("reopen"))
+		self.assertIsNone(self.matcher.match("history"))
+
+	def test_priority(self):
+		self.assertEqual(self.matcher.match("Hi, opening hours?"), "Hours")
+		self.assertEqual(self.matcher.match("hello, where is order #123"), "Order")
+
+	def test_regex_errors(self):
+		self.assertIsNone(get_regex_error(r"(?i:order)\s*#?\d+"))
+		for pattern in ("(?i)order", r"(a)\1", "(?P<number>\\d+)", "order ("):
+			self.assertTrue(get_regex_error(pattern), pattern)
@@ -0,0 +1,24 @@
+# Copyright (c) 2026, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+
+from frappe_whatsapp.utils.auto_reply import clear_rules_cache, get_regex_error, split_keywords
+
+
+class WhatsAppAutoReply(Document):
+	def validate(self):
+		if self.match_type != "Regex":
+			return
+		for pattern in split_keywords(self.keywords):
+			error = get_regex_error(pattern)
+			if error:
+				frappe.throw(_("Invalid regular expression {0}: {1}").format(frappe.bold(pattern), error))
+
+	def on_update(self):
+		clear_rules_cache()
+
+	def on_trash(self):
+		clear_rules_cache()
@@ -46,3 +46,22 @@ class TestWhatsAppCall(unittest.TestCase):
         call.update_call_status("answered")
         self.assertEqual(call.status, "answered")
         self.assertIsNotNone(call.started_at)
+    
+    def test_call_status_transitions(self):
+        call = frappe.new_doc("WhatsApp Call")
+        call.type = "Incoming"
+        call.from_number = "1234567890"
+        call.to_number = "0987654321"
+        call.status = "ringing"
+        call.insert()
+        
+        call.update_call_status("ended")
+        self.assertEqual(call.status, "ended")
+        
+        # finished calls cannot be reopened by late webhook events
+        call.update_call_status("answered")
+        self.assertEqual(call.status, "ended")
+        
+        call.status = "ringing"
+        with self.assertRaises(frappe.ValidationError):
+            call.save()
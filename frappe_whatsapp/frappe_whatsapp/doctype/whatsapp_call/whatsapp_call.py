@@ -5,7 +5,16 @@ import frappe
 from frappe.model.document import Document
 import requests
 import json
-from datetime import datetime
+from frappe.utils import now_datetime
+
+from frappe_whatsapp.utils.call_analytics import record_call
+from frappe_whatsapp.utils.calling import (
+    CALL_TRANSITIONS,
+    FINAL_CALL_STATUSES,
+    can_transition,
+    get_duration,
+    sync_call_registry,
+)
 
 
 class WhatsAppCall(Document):
@@ -14,9 +23,19 @@ class WhatsAppCall(Document):
         if not self.from_number and not self.to_number:
             frappe.throw("Either 'From Number' or 'To Number' is required")
         
-        if self.status not in ["initiated", "ringing", "answered", "ended", "missed", "failed"]:
+        if self.status not in CALL_TRANSITIONS:
             frappe.throw("Invalid call status")
+
+        previous_status = self.get_db_value("status") if not self.is_new() else None
+        if previous_status and previous_status != self.status and not can_transition(previous_status, self.status):
+            frappe.throw(f"Call cannot move from {previous_status} to {self.status}")
     
+    def on_update(self):
+        """Keep the active call registry and rollups in sync."""
+        sync_call_registry(self.as_dict(), self.flags.last_event_at)
+        if self.status in FINAL_CALL_STATUSES and self.has_value_changed("status"):
+            record_call(self.as_dict())
+
     def after_insert(self):
         """Actions after inserting the call record."""
         if self.type == "Outgoing" and self.status == "initiated":
@@ -80,11 +99,8 @@ class WhatsAppCall(Document):
             frappe.throw("Call is not active")
         
         self.status = "ended"
-        self.ended_at = datetime.now()
-        
-        if self.started_at and self.ended_at:
-            duration = (self.ended_at - self.started_at).total_seconds()
-            self.duration = int(duration)
+        self.ended_at = now_datetime()
+        self.duration = get_duration(self.started_at, self.ended_at)
         
         self.save(ignore_permissions=True)
         frappe.msgprint("Call ended")
@@ -92,19 +108,25 @@ class WhatsAppCall(Document):
     @frappe.whitelist()
     def update_call_status(self, status, **kwargs):
         """Update call status from webhook."""
+        if not can_transition(self.status, status):
+            return
+
         self.status = status
         
         if status == "answered":
-            self.started_at = datetime.now()
-        elif status in ["ended", "missed", "failed"]:
-            self.ended_at = datetime.now()
-            if self.started_at and self.ended_at:
-                duration = (self.ended_at - self.started_at).total_seconds()
-                self.duration = int(duration)
+            self.started_at = now_datetime()
+        elif status in FINAL_CALL_STATUSES:
+            self.ended_at = now_datetime()
+            self.duration = get_duration(self.started_at, self.ended_at)
         
         # Update any additional fields from webhook
         for key, value in kwargs.items():
-            if hasattr(self, key):
-                setattr(self, key, value)
+            if self.meta.has_field(key):
+                self.set(key, value)
         
         self.save(ignore_permissions=True)
+
+
+def on_doctype_update():
+    frappe.db.add_index("WhatsApp Call", ["status"])
+    frappe.db.add_index("WhatsApp Call", ["call_id"])
@@ -0,0 +1,30 @@
+# Copyright (c) 2026, Shridhar Patil and Contributors
+# See license.txt
+
+from frappe.tests import UnitTestCase
+
+from frappe_whatsapp.utils.call_analytics import get_call_stats, get_percentile, merge_histograms
+
+
+class TestWhatsAppCallRollup(UnitTestCase):
+	def test_call_stats(self):
+		key, stats = get_call_stats({
+			"type": "Incoming",
+			"from_number": "+91 98765 43210",
+			"status": "ended",
+			"started_at": "2026-01-01 10:15:00",
+			"duration": 45,
+		})
+		self.assertEqual(key[1:], ("919876543210", "Incoming"))
+		self.assertEqual(key[0].hour, 10)
+		self.assertEqual(key[0].minute, 0)
+		self.assertEqual(stats["answered_count"], 1)
+		self.assertEqual(stats["total_duration"], 45)
+
+	def test_percentile(self):
+		# 19 short calls and one long call: p95 stays in the short bucket
+		short = get_call_stats({"type": "Incoming", "status": "ended", "started_at": "2026-01-01", "duration": 4})[1]
+		long = get_call_stats({"type": "Incoming", "status": "ended", "started_at": "2026-01-01", "duration": 500})[1]
+		histogram = merge_histograms(*([short["histogram"]] * 19 + [long["histogram"]]))
+		self.assertEqual(get_percentile(histogram, 95), 5)
+		self.assertEqual(get_percentile(histogram, 100), 600)
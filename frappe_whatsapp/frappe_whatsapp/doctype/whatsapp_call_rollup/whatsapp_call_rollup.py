@@ -0,0 +1,16 @@
+# Copyright (c) 2026, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class WhatsAppCallRollup(Document):
+	"""Call counts and durations per hour, number and direction."""
+
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("WhatsApp Call Rollup", ["period_start"])
+	frappe.db.add_index("WhatsApp Call Rollup", ["number", "period_start"])
@@ -0,0 +1,36 @@
+# Copyright (c) 2026, Shridhar Patil and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from frappe_whatsapp.utils import normalize_number
+from frappe_whatsapp.utils.conversation import get_conversation
+
+
+class TestWhatsAppConversation(IntegrationTestCase):
+	def test_normalize_number(self):
+		self.assertEqual(normalize_number("+91 98765-43210"), "919876543210")
+		self.assertEqual(normalize_number("0091 9876543210"), "919876543210")
+		self.assertIsNone(normalize_number(""))
+
+	def test_incoming_message_updates_conversation(self):
+		number = "919000000001"
+		for body in ("hello", "are you there?"):
+			frappe.get_doc({
+				"doctype": "WhatsApp Message",
+				"type": "Incoming",
+				"from": number,
+				"message": body,
+				"content_type": "text",
+			}).insert(ignore_permissions=True)
+
+		conversation = frappe.get_doc("WhatsApp Conversation", number)
+		self.assertEqual(conversation.message_count, 2)
+		self.assertEqual(conversation.unread_count, 2)
+		self.assertEqual(conversation.last_message_preview, "are you there?")
+
+		page = get_conversation("+" + number, limit=1)
+		self.assertEqual(len(page["messages"]), 1)
+		self.assertEqual(page["messages"][0].message, "are you there?")
+		self.assertTrue(page["next_before"])
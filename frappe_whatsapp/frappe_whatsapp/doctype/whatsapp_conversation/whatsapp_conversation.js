@@ -0,0 +1,63 @@
+// Copyright (c) 2026, Shridhar Patil and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('WhatsApp Conversation', {
+	refresh: function(frm) {
+		frm.chat_messages = [];
+		frm.chat_before = null;
+		frm.trigger("load_chat");
+
+		if (frm.doc.unread_count) {
+			frappe.call({
+				method: "frappe_whatsapp.utils.conversation.mark_as_read",
+				args: {number: frm.doc.number}
+			});
+		}
+
+		frm.add_custom_button(__("Reply"), function() {
+			frappe.new_doc("WhatsApp Message", {"type": "Outgoing", "to": frm.doc.number});
+		});
+
+		// the form is subscribed to its document room, which receives our updates
+		frappe.realtime.off("whatsapp_conversation_update");
+		frappe.realtime.on("whatsapp_conversation_update", function(data) {
+			if (cur_frm !== frm) return;
+			(data.updates || []).forEach((update) => {
+				let existing = frm.chat_messages.find((m) => m.name === update.name);
+				if (existing) {
+					existing.status = update.status;
+				} else if (update.event === "new_message" && update.contact_number === frm.doc.number) {
+					frm.chat_messages.unshift(update);
+				}
+			});
+			frm.events.render_chat(frm);
+		});
+	},
+
+	load_chat: function(frm) {
+		frappe.call({
+			method: "frappe_whatsapp.utils.conversation.get_conversation",
+			args: {number: frm.doc.number, before: frm.chat_before},
+			callback: function(r) {
+				frm.chat_messages = frm.chat_messages.concat(r.message.messages);
+				frm.chat_before = r.message.next_before;
+				frm.events.render_chat(frm);
+			}
+		});
+	},
+
+	render_chat: function(frm) {
+		let wrapper = frm.get_field("chat_html").$wrapper;
+		let rows = frm.chat_messages.slice().reverse().map((m) => `
+			<div class="text-${m.type === "Incoming" ? "left" : "right"} mb-2">
+				<div class="d-inline-block p-2 rounded ${m.type === "Incoming" ? "bg-light" : "bg-success text-white"}"
+					style="max-width: 70%; white-space: pre-wrap;">${frappe.utils.escape_html(m.message || "")}</div>
+				<div class="text-muted small">${frappe.datetime.comment_when(m.creation)} ${m.status || ""}</div>
+			</div>`).join("");
+
+		wrapper.html(`
+			${frm.chat_before ? `<button class="btn btn-xs btn-default load-older mb-3">${__("Load older messages")}</button>` : ""}
+			<div>${rows}</div>`);
+		wrapper.find(".load-older").on("click", () => frm.trigger("load_chat"));
+	}
+});
@@ -0,0 +1,15 @@
+# Copyright (c) 2026, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class WhatsAppConversation(Document):
+	"""One row per contact number, maintained from WhatsApp Message inserts."""
+
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("WhatsApp Conversation", ["last_message_at"])
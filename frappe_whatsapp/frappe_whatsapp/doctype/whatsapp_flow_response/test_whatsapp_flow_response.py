@@ -0,0 +1,14 @@
+# Copyright (c) 2026, Shridhar Patil and Contributors
+# See license.txt
+
+from frappe.tests import UnitTestCase
+
+from frappe_whatsapp.utils.flow_responses import get_values
+
+
+class TestWhatsAppFlowResponse(UnitTestCase):
+	def test_values(self):
+		self.assertEqual(
+			get_values({"flow_token": "t1", "rating": 4, "topics": ["a", "b"], "address": {"city": "Pune"}}),
+			[("rating", "4"), ("topics", "a"), ("topics", "b"), ("address.city", "Pune")],
+		)
@@ -0,0 +1,16 @@
+# Copyright (c) 2026, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class WhatsAppFlowResponse(Document):
+	"""One submitted WhatsApp Flow, written in bulk by the webhook."""
+
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("WhatsApp Flow Response", ["flow_token", "submitted_at"])
+	frappe.db.add_index("WhatsApp Flow Response", ["contact_number"])
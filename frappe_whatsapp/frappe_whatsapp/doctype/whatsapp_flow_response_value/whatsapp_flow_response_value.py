@@ -0,0 +1,13 @@
+# Copyright (c) 2026, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class WhatsAppFlowResponseValue(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("WhatsApp Flow Response Value", ["field_name", "value"])
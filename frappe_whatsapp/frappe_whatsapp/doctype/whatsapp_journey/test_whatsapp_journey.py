@@ -0,0 +1,44 @@
+# Copyright (c) 2026, Shridhar Patil and Contributors
+# See license.txt
+
+from datetime import datetime
+
+import frappe
+from frappe.tests import IntegrationTestCase
+
+from frappe_whatsapp.utils.journeys import get_step_time
+
+
+class TestWhatsAppJourney(IntegrationTestCase):
+	def test_step_time(self):
+		step = frappe._dict(delay_days=3, delay_hours=2)
+		self.assertEqual(get_step_time(step, datetime(2026, 1, 30, 23)), datetime(2026, 2, 3, 1))
+		self.assertEqual(get_step_time(frappe._dict(), datetime(2026, 1, 1)), datetime(2026, 1, 1))
+
+	def test_contact_journey(self):
+		# inserted without hooks, which would submit the template to Meta
+		template = frappe.get_doc({
+			"doctype": "WhatsApp Templates",
+			"name": "journey_welcome-en",
+			"template_name": "journey_welcome",
+			"actual_name": "journey_welcome",
+			"template": "Welcome!",
+			"language": "en",
+			"language_code": "en",
+			"category": "MARKETING",
+		})
+		template.db_insert()
+
+		notification = frappe.get_doc({
+			"doctype": "WhatsApp Notification",
+			"notification_name": "Journey Welcome",
+			"notification_type": "Journey Step",
+			"template": template.name,
+		}).insert(ignore_permissions=True)
+
+		journey = frappe.get_doc({
+			"doctype": "WhatsApp Journey",
+			"title": "Contact Welcome",
+			"steps": [{"notification": notification.name, "delay_days": 1}],
+		}).insert(ignore_permissions=True)
+		self.assertFalse(journey.reference_doctype)
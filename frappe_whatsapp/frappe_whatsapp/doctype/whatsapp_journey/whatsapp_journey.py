@@ -0,0 +1,38 @@
+# Copyright (c) 2026, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+from frappe.model.document import Document
+
+from frappe_whatsapp.utils.journeys import clear_journeys_cache
+
+
+class WhatsAppJourney(Document):
+	def validate(self):
+		if self.reference_doctype and not frappe.get_meta(self.reference_doctype).get_field(self.phone_field):
+			frappe.throw(_("Field {0} not found on DocType {1}").format(self.phone_field, self.reference_doctype))
+
+		for step in self.steps:
+			notification = frappe.db.get_value(
+				"WhatsApp Notification",
+				step.notification,
+				["notification_type", "reference_doctype"],
+				as_dict=True,
+			)
+			if notification.notification_type != "Journey Step":
+				frappe.throw(
+					_("Row {0}: Notification {1} must be of type Journey Step").format(step.idx, step.notification)
+				)
+			if (notification.reference_doctype or None) != (self.reference_doctype or None):
+				frappe.throw(
+					_("Row {0}: Notification {1} is not for {2}").format(
+						step.idx, step.notification, self.reference_doctype or _("contacts")
+					)
+				)
+
+	def on_update(self):
+		clear_journeys_cache()
+
+	def on_trash(self):
+		clear_journeys_cache()
@@ -0,0 +1,18 @@
+# Copyright (c) 2026, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class WhatsAppJourneyEnrollment(Document):
+	"""One document or contact going through a WhatsApp Journey."""
+
+	pass
+
+
+def on_doctype_update():
+	# the scheduler tick reads only due enrollments
+	frappe.db.add_index("WhatsApp Journey Enrollment", ["status", "next_step_at"])
+	frappe.db.add_index("WhatsApp Journey Enrollment", ["contact_number", "status"])
+	frappe.db.add_index("WhatsApp Journey Enrollment", ["reference_doctype", "reference_name"])
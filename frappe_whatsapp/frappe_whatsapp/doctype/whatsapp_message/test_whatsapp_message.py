@@ -3,10 +3,76 @@
 # See license.txt
 
 # import frappe
+from datetime import datetime, time
+
 from frappe.tests import UnitTestCase
 
+from frappe_whatsapp.utils.message_handlers import parse_interactive, parse_location, parse_unknown
+from frappe_whatsapp.utils.scheduled_send import after_quiet_hours
+from frappe_whatsapp.utils.search import get_match_query
+from frappe_whatsapp.utils.webhook import get_lane, get_lane_key, is_later_status
+
 
 class TestWhatsAppMessage(UnitTestCase):
     """Test whatsapp messages."""
 
-    pass
+    def test_interactive_replies(self):
+        """Button and list replies are not flow responses."""
+        record = parse_interactive({
+            "type": "interactive",
+            "interactive": {"type": "button_reply", "button_reply": {"id": "yes", "title": "Yes"}},
+        })
+        self.assertEqual(record["content_type"], "button")
+        self.assertEqual(record["message"], "Yes")
+        self.assertEqual(record["payload"]["id"], "yes")
+
+        record = parse_interactive({
+            "type": "interactive",
+            "interactive": {"type": "list_reply", "list_reply": {"id": "row-1", "title": "Row 1"}},
+        })
+        self.assertEqual(record["content_type"], "list")
+
+    def test_location(self):
+        record = parse_location({
+            "type": "location",
+            "location": {"latitude": 19.07, "longitude": 72.87},
+        })
+        self.assertEqual(record["message"], "19.07, 72.87")
+        self.assertEqual(record["payload"]["latitude"], 19.07)
+
+    def test_unknown_keeps_data(self):
+        record = parse_unknown({"type": "order", "order": {"catalog_id": "1"}})
+        self.assertEqual(record["content_type"], "unknown")
+        self.assertEqual(record["payload"], {"catalog_id": "1"})
+
+    def test_search_query(self):
+        """Search box text becomes a safe FTS5 query."""
+        self.assertEqual(get_match_query("order sta"), '"order" "sta"*')
+        self.assertEqual(get_match_query('"order status" late'), '"order status" "late"*')
+        self.assertEqual(get_match_query("NEAR(a OR"), '"NEAR" "a" "OR"*')
+        self.assertEqual(get_match_query("  "), "")
+
+    def test_after_quiet_hours(self):
+        """Sends in the quiet hours move to their end, across midnight too."""
+        night = (time(21), time(8))
+        self.assertEqual(after_quiet_hours(datetime(2026, 1, 1, 12), *night), datetime(2026, 1, 1, 12))
+        self.assertEqual(after_quiet_hours(datetime(2026, 1, 1, 23), *night), datetime(2026, 1, 2, 8))
+        self.assertEqual(after_quiet_hours(datetime(2026, 1, 2, 3), *night), datetime(2026, 1, 2, 8))
+        lunch = (time(13), time(14))
+        self.assertEqual(after_quiet_hours(datetime(2026, 1, 1, 13, 30), *lunch), datetime(2026, 1, 1, 14))
+
+    def test_webhook_lanes(self):
+        """A message and the statuses of replies to it share a lane."""
+        message = {"entry": [{"changes": [{"value": {"messages": [{"from": "919876543210", "id": "m1"}]}}]}]}
+        status = {"entry": [{"changes": [{"value": {"statuses": [{"recipient_id": "919876543210", "id": "m2"}]}}]}]}
+        self.assertEqual(get_lane_key(message), "919876543210")
+        self.assertEqual(get_lane_key(status), "919876543210")
+        self.assertEqual(get_lane_key({"entry": []}), "")
+        self.assertEqual(get_lane("919876543210", 8), get_lane("919876543210", 8))
+        self.assertLess(get_lane("919876543210", 8), 8)
+
+    def test_status_order(self):
+        """A late delivered callback does not undo read."""
+        self.assertTrue(is_later_status("read", "delivered"))
+        self.assertFalse(is_later_status("delivered", "read"))
+        self.assertTrue(is_later_status("sent", "Success"))
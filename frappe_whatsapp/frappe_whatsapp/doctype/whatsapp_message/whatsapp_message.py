@@ -1,53 +1,124 @@
 # Copyright (c) 2022, Shridhar Patil and contributors
 # For license information, please see license.txt
 import json
+import time
 import frappe
 from frappe.model.document import Document
+from frappe.utils import get_datetime, now_datetime
 from frappe.integrations.utils import make_post_request
 
+from frappe_whatsapp.utils.auto_reply import handle_incoming
+from frappe_whatsapp.utils.conversation import get_contact_number, update_conversation
+from frappe_whatsapp.utils.journeys import exit_on_reply
+from frappe_whatsapp.utils.media import get_media_object
+from frappe_whatsapp.utils.metrics import get_integration_error_code, record_api_call
+from frappe_whatsapp.utils.phone_index import get_record_for_number
+from frappe_whatsapp.utils.realtime import publish_message
+from frappe_whatsapp.utils.scheduled_send import get_quiet_hours, get_send_time, schedule_after_commit
+from frappe_whatsapp.utils.search import queue_message
+from frappe_whatsapp.utils.service_window import (
+    QUEUE,
+    REJECT,
+    SEND_TEMPLATE,
+    get_outside_window_action,
+    get_queued_filters,
+    get_window_template,
+    record_inbound,
+    throw_window_closed,
+)
+from frappe_whatsapp.utils.timings import mark_doc
+
 
 class WhatsAppMessage(Document):
     """Send whats app messages."""
 
     def before_insert(self):
         """Send message."""
-        if self.type == "Outgoing" and self.message_type != "Template":
-            if self.attach and not self.attach.startswith("http"):
-                link = frappe.utils.get_url() + "/" + self.attach
+        self.contact_number = get_contact_number(self)
+        if self.type == "Incoming" and not self.reference_doctype:
+            record = get_record_for_number(self.get("from"))
+            if record:
+                self.reference_doctype, self.reference_name = record
+        if self.type == "Outgoing" and self.send_at and not self.message_id:
+            self.send_at = get_send_time(self.send_at, quiet_hours=get_quiet_hours())
+            if get_datetime(self.send_at) > now_datetime():
+                # queued and sent when due, see utils.scheduled_send
+                self.status = "Scheduled"
+        if self.type == "Outgoing" and self.status != "Scheduled":
+            mark_doc(self, "queued")
+            self.send()
+
+    def send(self):
+        """Send an outgoing message now, or queue it outside the service window."""
+        if self.message_type != "Template":
+            # send_whatsapp_message checks the window before saving with a message_id
+            action = None if self.message_id else get_outside_window_action(self.contact_number)
+            if action == REJECT:
+                throw_window_closed(self.to)
+            elif action == SEND_TEMPLATE:
+                self.message_type = "Template"
+                self.template = get_window_template().name
+                self.send_template()
+            elif action == QUEUE:
+                self.status = "Queued"
             else:
-                link = self.attach
+                self.send_message()
+        elif not self.message_id:
+            self.send_template()
 
-            data = {
-                "messaging_product": "whatsapp",
-                "to": self.format_number(self.to),
-                "type": self.content_type,
+    def send_message(self):
+        """Send a free-form (non-template) message."""
+        media = get_media_object(self.attach) if self.attach else {}
+
+        data = {
+            "messaging_product": "whatsapp",
+            "to": self.format_number(self.to),
+            "type": self.content_type,
+        }
+        if self.is_reply and self.reply_to_message_id:
+            data["context"] = {"message_id": self.reply_to_message_id}
+        if self.content_type in ["document", "image", "video"]:
+            data[self.content_type.lower()] = {
+                **media,
+                "caption": self.message,
             }
-            if self.is_reply and self.reply_to_message_id:
-                data["context"] = {"message_id": self.reply_to_message_id}
-            if self.content_type in ["document", "image", "video"]:
-                data[self.content_type.lower()] = {
-                    "link": link,
-                    "caption": self.message,
-                }
-            elif self.content_type == "reaction":
-                data["reaction"] = {
-                    "message_id": self.reply_to_message_id,
-                    "emoji": self.message,
-                }
-            elif self.content_type == "text":
-                data["text"] = {"preview_url": True, "body": self.message}
-
-            elif self.content_type == "audio":
-                data["text"] = {"link": link}
-
-            try:
-                self.notify(data)
-                self.status = "Success"
-            except Exception as e:
-                self.status = "Failed"
-                frappe.throw(f"Failed to send message {str(e)}")
-        elif self.type == "Outgoing" and self.message_type == "Template" and not self.message_id:
-            self.send_template()
+        elif self.content_type == "reaction":
+            data["reaction"] = {
+                "message_id": self.reply_to_message_id,
+                "emoji": self.message,
+            }
+        elif self.content_type == "text":
+            data["text"] = {"preview_url": True, "body": self.message}
+
+        elif self.content_type == "audio":
+            data["audio"] = media
+
+        try:
+            self.notify(data)
+            self.status = "Success"
+        except Exception as e:
+            self.status = "Failed"
+            frappe.throw(f"Failed to send message {str(e)}")
+
+    def after_insert(self):
+        """Update the conversation index and notify open desk views."""
+        update_conversation(self)
+        publish_message(self)
+        queue_message(self)
+        if self.status == "Scheduled":
+            schedule_after_commit(f"WhatsApp Message|{self.name}", self.send_at)
+        if self.type == "Incoming":
+            record_inbound(self.contact_number, self.creation)
+            exit_on_reply(self.contact_number)
+            handle_incoming(self)
+            if frappe.db.exists("WhatsApp Message", get_queued_filters(self.contact_number)):
+                frappe.enqueue(
+                    "frappe_whatsapp.utils.service_window.send_queued_messages",
+                    job_id=f"whatsapp_send_queued|{self.contact_number}",
+                    deduplicate=True,
+                    enqueue_after_commit=True,
+                    number=self.contact_number,
+                )
 
     def send_template(self):
         """Send template."""
@@ -95,17 +166,11 @@ class WhatsAppMessage(Document):
 
         if template.header_type and template.sample:
             if template.header_type == 'IMAGE':
-                if template.sample.startswith("http"):
-                    url = f'{template.sample}'
-                else:
-                    url = f'{frappe.utils.get_url()}{template.sample}'
                 data['template']['components'].append({
                     "type": "header",
                     "parameters": [{
                         "type": "image",
-                        "image": {
-                            "link": url
-                        }
+                        "image": get_media_object(template.sample)
                     }]
                 })
 
@@ -123,6 +188,8 @@ class WhatsAppMessage(Document):
             "authorization": f"Bearer {token}",
             "content-type": "application/json",
         }
+        started = time.monotonic()
+        mark_doc(self, "api_request")
         try:
             response = make_post_request(
                 f"{settings.url}/{settings.version}/{settings.phone_id}/messages",
@@ -130,8 +197,11 @@ class WhatsAppMessage(Document):
                 data=json.dumps(data),
             )
             self.message_id = response["messages"][0]["id"]
+            mark_doc(self, "api_accepted")
+            record_api_call("whatsapp_message", started)
 
         except Exception as e:
+            record_api_call("whatsapp_message", started, get_integration_error_code())
             res = frappe.flags.integration_request.json()["error"]
             error_message = res.get("Error", res.get("message"))
             frappe.get_doc(
@@ -155,6 +225,16 @@ class WhatsAppMessage(Document):
 
 def on_doctype_update():
     frappe.db.add_index("WhatsApp Message", ["reference_doctype", "reference_name"])
+    frappe.db.add_index("WhatsApp Message", ["contact_number", "creation"])
+    frappe.db.add_index("WhatsApp Message", ["message_id"])
+    frappe.db.add_index("WhatsApp Message", ["conversation_id"])
+    frappe.db.add_index("WhatsApp Message", ["reply_to_message_id"])
+    frappe.db.add_index("WhatsApp Message", ["send_at"])
+    # latency report: outgoing messages of a date range
+    frappe.db.add_index("WhatsApp Message", ["type", "creation"])
+    # exports and latency report of one campaign or notification
+    frappe.db.add_index("WhatsApp Message", ["bulk_message_reference", "creation"])
+    frappe.db.add_index("WhatsApp Message", ["notification", "creation"])
 
 
 @frappe.whitelist()
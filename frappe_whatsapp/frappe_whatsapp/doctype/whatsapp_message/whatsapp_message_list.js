@@ -0,0 +1,65 @@
+// Copyright (c) 2026, Shridhar Patil and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings['WhatsApp Message'] = {
+	onload: function(listview) {
+		listview.page.add_inner_button(__("Search Messages"), function() {
+			frappe.whatsapp_message_search();
+		});
+	}
+};
+
+frappe.whatsapp_message_search = function() {
+	let page = 1;
+	let results = [];
+	let dialog = new frappe.ui.Dialog({
+		title: __("Search Messages"),
+		size: "large",
+		fields: [
+			{fieldname: "query", fieldtype: "Data", label: __("Search"), description: __("Use quotes to search for a phrase")},
+			{fieldname: "column_break_query", fieldtype: "Column Break"},
+			{fieldname: "contact_number", fieldtype: "Data", label: __("Contact Number")},
+			{fieldname: "section_break_results", fieldtype: "Section Break"},
+			{fieldname: "results", fieldtype: "HTML"}
+		]
+	});
+
+	let search = frappe.utils.debounce(function(more) {
+		let values = dialog.get_values(true);
+		if (!more) {
+			page = 1;
+			results = [];
+		}
+		frappe.call({
+			method: "frappe_whatsapp.utils.search.search_messages",
+			args: {query: values.query, contact_number: values.contact_number, page: page},
+			callback: function(r) {
+				results = results.concat(r.message.results);
+				render(r.message.has_more);
+			}
+		});
+	}, 300);
+
+	let render = function(has_more) {
+		let rows = results.map((m) => `
+			<div class="border-bottom py-2">
+				<a href="/app/whatsapp-message/${encodeURIComponent(m.name)}">
+					${frappe.utils.escape_html(m.profile_name || m.contact_number || "")}
+				</a>
+				<span class="text-muted small">${m.type} · ${frappe.datetime.comment_when(m.creation)}</span>
+				<div>${m.snippet}</div>
+			</div>`).join("");
+		let wrapper = dialog.get_field("results").$wrapper;
+		wrapper.html(`
+			${rows || `<div class="text-muted">${__("No messages found")}</div>`}
+			${has_more ? `<button class="btn btn-xs btn-default load-more mt-3">${__("More")}</button>` : ""}`);
+		wrapper.find(".load-more").on("click", function() {
+			page += 1;
+			search(true);
+		});
+	};
+
+	dialog.fields_dict.query.$input.on("input", () => search());
+	dialog.fields_dict.contact_number.$input.on("change", () => search());
+	dialog.show();
+};
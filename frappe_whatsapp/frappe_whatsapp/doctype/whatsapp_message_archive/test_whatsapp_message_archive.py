@@ -0,0 +1,38 @@
+# Copyright (c) 2026, Shridhar Patil and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests import IntegrationTestCase
+from frappe.utils import add_days, now_datetime
+
+from frappe_whatsapp.utils.retention import archive_messages, get_summary
+
+
+class TestWhatsAppMessageArchive(IntegrationTestCase):
+	def test_archive_in_batches(self):
+		old = add_days(now_datetime(), -400)
+		names = []
+		for body in ("one", "two", "three"):
+			doc = frappe.get_doc({
+				"doctype": "WhatsApp Message",
+				"type": "Incoming",
+				"from": "919000000002",
+				"message": body,
+				"content_type": "text",
+			}).insert(ignore_permissions=True)
+			frappe.db.set_value("WhatsApp Message", doc.name, "creation", old, update_modified=False)
+			names.append(doc.name)
+
+		# three rows in batches of two: a full batch, then a short one
+		self.assertGreaterEqual(archive_messages(365, batch_size=2), 3)
+		self.assertFalse(frappe.get_all("WhatsApp Message", filters={"name": ("in", names)}))
+		archived = frappe.get_all(
+			"WhatsApp Message Archive", filters={"name": ("in", names)}, fields=["name", "summary", "sent_on"]
+		)
+		self.assertEqual(len(archived), 3)
+		self.assertEqual({row.summary for row in archived}, {"one", "two", "three"})
+
+	def test_summary(self):
+		self.assertEqual(get_summary("<p>hello   <b>there</b></p>"), "hello there")
+		self.assertEqual(len(get_summary("x" * 500)), 140)
+		self.assertIsNone(get_summary(None))
@@ -0,0 +1,16 @@
+# Copyright (c) 2026, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class WhatsAppMessageArchive(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("WhatsApp Message Archive", ["from", "sent_on"])
+	frappe.db.add_index("WhatsApp Message Archive", ["to", "sent_on"])
+	frappe.db.add_index("WhatsApp Message Archive", ["reference_doctype", "reference_name"])
+	frappe.db.add_index("WhatsApp Message Archive", ["message_id"])
@@ -1,15 +1,27 @@
 """Notification."""
 
 import json
+import time
 import frappe
 
 from frappe import _dict, _
 from frappe.model.document import Document
 from frappe.utils.safe_exec import get_safe_globals, safe_exec
 from frappe.integrations.utils import make_post_request
-from frappe.desk.form.utils import get_pdf_link
 from frappe.utils import add_to_date, nowdate, datetime
 
+from frappe_whatsapp.utils.media import get_media_id, get_media_object
+from frappe_whatsapp.utils.metrics import get_integration_error_code, record_api_call
+from frappe_whatsapp.utils.print_attachments import enqueue_render_and_send
+from frappe_whatsapp.utils.timings import dump_timings, mark
+from frappe_whatsapp.utils.profiler import profile
+from frappe_whatsapp.utils.batch_sender import post_messages
+from frappe_whatsapp.utils.field_formatter import get_template_parameters
+from frappe_whatsapp.utils.notification_scheduler import clear_schedule_cache
+
+# payloads sent between two commits by send_batch
+BATCH_SIZE = 200
+
 
 class WhatsAppNotification(Document):
     """Notification."""
@@ -32,7 +44,7 @@ class WhatsAppNotification(Document):
                     frappe.bold(_("Attach from field")),
                 ))
 
-        if self.set_property_after_alert:
+        if self.set_property_after_alert and self.reference_doctype:
             meta = frappe.get_meta(self.reference_doctype)
             if not meta.get_field(self.set_property_after_alert):
                 frappe.throw(_("Field {0} not found on DocType {1}").format(
@@ -42,7 +54,13 @@ class WhatsAppNotification(Document):
 
 
     def send_scheduled_message(self) -> dict:
-        """Specific to API endpoint Server Scripts."""
+        """Specific to API endpoint Server Scripts.
+
+        Returns:
+            dict: Counts of sent, failed and skipped messages and of documents
+        """
+        self._timings = {}
+        mark(self._timings, "triggered")
         safe_exec(
             self.condition, get_safe_globals(), dict(doc=self)
         )
@@ -52,50 +70,150 @@ class WhatsAppNotification(Document):
             fieldname='*'
         )
 
+        stats = {"sent": 0, "failed": 0, "skipped": 0, "documents": 0}
         if template and template.language_code:
             if self.get("_contact_list"):
                 # send simple template without a doc to get field data.
-                self.send_simple_template(template)
+                stats.update(self.send_simple_template(template))
             elif self.get("_data_list"):
                 # allow send a dynamic template using schedule event config
                 # _doc_list shoud be [{"name": "xxx", "phone_no": "123"}]
-                for data in self._data_list:
-                    doc = frappe.get_doc(self.reference_doctype, data.get("name"))
+                stats["documents"] = len(self._data_list)
+                if self.can_send_in_bulk(template):
+                    stats.update(self.send_bulk_template(template, self._data_list))
+                else:
+                    for data in self._data_list:
+                        doc = frappe.get_doc(self.reference_doctype, data.get("name"))
 
-                    self.send_template_message(doc, data.get("phone_no"), template, True)
-        # return _globals.frappe.flags
+                        self.send_template_message(doc, data.get("phone_no"), template, True)
+        return stats
 
 
     def send_simple_template(self, template):
         """ send simple template without a doc to get field data """
-        for contact in self._contact_list:
-            data = {
-                "messaging_product": "whatsapp",
-                "to": self.format_number(contact),
-                "type": "template",
-                "template": {
-                    "name": template.actual_name,
-                    "language": {
-                        "code": template.language_code
-                    },
-                    "components": []
-                }
+        self.content_type = (template.get("header_type") or "text").lower()
+        return self.send_batch([
+            (self.get_template_payload(template, contact), None)
+            for contact in self._contact_list
+        ])
+
+    def can_send_in_bulk(self, template):
+        """Whether the parameters alone make the message, so documents need not be loaded."""
+        return (
+            not self.attach_document_print
+            and not self.custom_attachment
+            and template.header_type not in ("DOCUMENT", "IMAGE")
+        )
+
+    def send_bulk_template(self, template, data_list):
+        """Send the template for many documents, formatting their fields in bulk.
+
+        Args:
+            template: WhatsApp Templates row
+            data_list: [{"name": ..., "phone_no": ...}], phone_no is optional
+
+        Returns:
+            dict: Counts of sent and failed messages, and of documents
+                skipped as deleted or without a phone number
+        """
+        rows = get_template_parameters(self, [data.get("name") for data in data_list])
+        self.content_type = (template.header_type or "").lower()
+
+        items = []
+        skipped = 0
+        for data in data_list:
+            row = rows.get(data.get("name"))
+            phone_number = data.get("phone_no") or (row and row["phone_no"])
+            if not row or not phone_number:
+                skipped += 1
+                continue
+            items.append((
+                self.get_template_payload(template, phone_number, row["parameters"]),
+                _dict(doctype=self.reference_doctype, name=data.get("name")),
+            ))
+        return {**self.send_batch(items), "skipped": skipped}
+
+    def get_template_payload(self, template, phone_number, parameters=None):
+        """Message payload for a template with optional body parameters."""
+        data = {
+            "messaging_product": "whatsapp",
+            "to": self.format_number(phone_number),
+            "type": "template",
+            "template": {
+                "name": template.actual_name,
+                "language": {
+                    "code": template.language_code
+                },
+                "components": []
             }
-            self.content_type = template.get("header_type", "text").lower()
-            self.notify(data)
+        }
+        if parameters:
+            data["template"]["components"] = [{
+                "type": "body",
+                "parameters": parameters
+            }]
+        return data
+
+    def send_batch(self, items):
+        """Send many payloads concurrently and record each result.
+
+        Args:
+            items: List of (payload, doc_data) tuples, doc_data may be None
+
+        Returns:
+            dict: Counts of sent and failed messages
+        """
+        stats = {"sent": 0, "failed": 0}
+        base_timings = dict(self.get("_timings") or {})
+        mark(base_timings, "queued")
+
+        for start in range(0, len(items), BATCH_SIZE):
+            chunk = items[start:start + BATCH_SIZE]
+            with profile("send", self.name):
+                results = post_messages([data for data, _ in chunk])
+
+            for (data, doc_data), result in zip(chunk, results):
+                if result.get("response"):
+                    record_api_call("whatsapp_notification", result["started"], finished=result["finished"])
+                    self.record_sent(data, doc_data, result["response"], {**base_timings, **result["timings"]})
+                    self.log_result(result["response"])
+                    stats["sent"] += 1
+                else:
+                    error = result["error"]
+                    record_api_call(
+                        "whatsapp_notification", result["started"],
+                        str(error.get("code") or "unknown"), finished=result["finished"]
+                    )
+                    self.log_result({"error": error.get("message")})
+                    stats["failed"] += 1
 
+            # scheduled runs are long; keep what was sent even if a later chunk fails
+            frappe.db.commit()
+        return stats
 
-    def send_template_message(self, doc: Document, phone_no=None, default_template=None, ignore_condition=False):
-        """Specific to Document Event triggered Server Scripts."""
+
+    def send_template_message(self, doc: Document, phone_no=None, default_template=None, ignore_condition=False,
+                              triggered_at=None, print_file=None):
+        """Specific to Document Event triggered Server Scripts.
+
+        With `attach_document_print`, the send moves to a worker that renders
+        and uploads the print, then calls this again with its `print_file`.
+        """
         if self.disabled:
             return
 
+        # kept on the document so notify() can store it on the message
+        self._timings = {}
+        mark(self._timings, "triggered", triggered_at)
+
         doc_data = doc.as_dict()
         if self.condition and not ignore_condition:
             # check if condition satisfies
-            if not frappe.safe_eval(
-                self.condition, get_safe_globals(), dict(doc=doc_data)
-            ):
+            with profile("condition", self.name):
+                satisfied = frappe.safe_eval(
+                    self.condition, get_safe_globals(), dict(doc=doc_data)
+                )
+            if not satisfied:
                 return
 
         template = default_template or frappe.db.get_value(
@@ -109,18 +227,7 @@ class WhatsAppNotification(Document):
             else:
                 phone_number = phone_no
 
-            data = {
-                "messaging_product": "whatsapp",
-                "to": self.format_number(phone_number),
-                "type": "template",
-                "template": {
-                    "name": template.actual_name,
-                    "language": {
-                        "code": template.language_code
-                    },
-                    "components": []
-                }
-            }
+            data = self.get_template_payload(template, phone_number)
 
             # Pass parameter values
             if self.fields:
@@ -145,49 +252,35 @@ class WhatsAppNotification(Document):
                 }]
 
             if self.attach_document_print:
-                # frappe.db.begin()
-                key = doc.get_document_share_key()  # noqa
-                frappe.db.commit()
-                print_format = "Standard"
-                doctype = frappe.get_doc("DocType", doc_data['doctype'])
-                if doctype.custom:
-                    if doctype.default_print_format:
-                        print_format = doctype.default_print_format
-                else:
-                    default_print_format = frappe.db.get_value(
-                        "Property Setter",
-                        filters={
-                            "doc_type": doc_data['doctype'],
-                            "property": "default_print_format"
-                        },
-                        fieldname="value"
+                if not print_file:
+                    # render and upload in a worker, never in the user's save
+                    enqueue_render_and_send(
+                        self.name, doc_data['doctype'], doc_data['name'], phone_no,
+                        triggered_at=self._timings["triggered"],
                     )
-                    print_format = default_print_format if default_print_format else print_format
-                link = get_pdf_link(
-                    doc_data['doctype'],
-                    doc_data['name'],
-                    print_format=print_format
-                )
+                    return
+
+                # the pdf is private, so it is always sent by media id
+                media_id = get_media_id(print_file)
+                if not media_id:
+                    frappe.throw(_("Could not upload {0} to WhatsApp").format(print_file))
 
                 filename = f'{doc_data["name"]}.pdf'
-                url = f'{frappe.utils.get_url()}{link}&key={key}'
+                media = {"id": media_id}
 
             elif self.custom_attachment:
                 filename = self.file_name
 
                 if self.attach_from_field:
                     file_url = doc_data[self.attach_from_field]
-                    if not file_url.startswith("http"):
-                        # get share key so that private files can be sent
-                        key = doc.get_document_share_key()
-                        file_url = f'{frappe.utils.get_url()}{file_url}&key={key}'
+                    share_doc = doc
                 else:
                     file_url = self.attach
+                    share_doc = None
 
-                if file_url.startswith("http"):
-                    url = f'{file_url}'
-                else:
-                    url = f'{frappe.utils.get_url()}{file_url}'
+                # files of this site are uploaded once and sent by media id; if the
+                # upload fails, private files are linked with a share key
+                media = get_media_object(file_url, share_doc=share_doc)
 
             if template.header_type == 'DOCUMENT':
                 data['template']['components'].append({
@@ -195,7 +288,7 @@ class WhatsAppNotification(Document):
                     "parameters": [{
                         "type": "document",
                         "document": {
-                            "link": url,
+                            **media,
                             "filename": filename
                         }
                     }]
@@ -205,9 +298,7 @@ class WhatsAppNotification(Document):
                     "type": "header",
                     "parameters": [{
                         "type": "image",
-                        "image": {
-                            "link": url
-                        }
+                        "image": media
                     }]
                 })
             self.content_type = template.header_type.lower()
@@ -225,51 +316,31 @@ class WhatsAppNotification(Document):
             "authorization": f"Bearer {token}",
             "content-type": "application/json"
         }
+        timings = dict(self.get("_timings") or {})
+        mark(timings, "queued")
+        mark(timings, "api_request")
+        started = time.monotonic()
+        response = None
         try:
             success = False
-            response = make_post_request(
-                f"{settings.url}/{settings.version}/{settings.phone_id}/messages",
-                headers=headers, data=json.dumps(data)
-            )
-
-            if not self.get("content_type"):
-                self.content_type = 'text'
-
-            new_doc = {
-                "doctype": "WhatsApp Message",
-                "type": "Outgoing",
-                "message": str(data['template']),
-                "to": data['to'],
-                "message_type": "Template",
-                "message_id": response['messages'][0]['id'],
-                "content_type": self.content_type,
-            }
-
-            if doc_data:
-                new_doc.update({
-                    "reference_doctype": doc_data.doctype,
-                    "reference_name": doc_data.name,
-                })
-
-            frappe.get_doc(new_doc).save(ignore_permissions=True)
-
-            if doc_data and self.set_property_after_alert and self.property_value:
-                if doc_data.doctype and doc_data.name:
-                    fieldname = self.set_property_after_alert
-                    value = self.property_value
-                    meta = frappe.get_meta(doc_data.get("doctype"))
-                    df = meta.get_field(fieldname)
-                    if df:
-                        if df.fieldtype in frappe.model.numeric_fieldtypes:
-                            value = frappe.utils.cint(value)
+            with profile("send", self.name):
+                response = make_post_request(
+                    f"{settings.url}/{settings.version}/{settings.phone_id}/messages",
+                    headers=headers, data=json.dumps(data)
+                )
+            record_api_call("whatsapp_notification", started)
+            mark(timings, "api_accepted")
 
-                        frappe.db.set_value(doc_data.get("doctype"), doc_data.get("name"), fieldname, value)
+            self.record_sent(data, doc_data, response, timings)
 
             frappe.msgprint("WhatsApp Message Triggered", indicator="green", alert=True)
             success = True
 
         except Exception as e:
             error_message = str(e)
+            if response is None:
+                # the request itself failed, not the bookkeeping after it
+                record_api_call("whatsapp_notification", started, get_integration_error_code())
             if frappe.flags.integration_request:
                 response = frappe.flags.integration_request.json()['error']
                 error_message = response.get('Error', response.get("message"))
@@ -284,16 +355,63 @@ class WhatsAppNotification(Document):
                 meta = {"error": error_message}
             else:
                 meta = frappe.flags.integration_request.json()
-            frappe.get_doc({
-                "doctype": "WhatsApp Notification Log",
-                "template": self.template,
-                "meta_data": meta
-            }).insert(ignore_permissions=True)
+            self.log_result(meta)
+
+    def record_sent(self, data, doc_data, response, timings):
+        """Save the sent message and set the property after alert."""
+        if not self.get("content_type"):
+            self.content_type = 'text'
+
+        new_doc = {
+            "doctype": "WhatsApp Message",
+            "type": "Outgoing",
+            "message": str(data['template']),
+            "to": data['to'],
+            "message_type": "Template",
+            "message_id": response['messages'][0]['id'],
+            "content_type": self.content_type,
+            "template": self.template,
+            "notification": self.name,
+            "timings": dump_timings(timings),
+        }
+
+        if doc_data:
+            new_doc.update({
+                "reference_doctype": doc_data.doctype,
+                "reference_name": doc_data.name,
+            })
+
+        frappe.get_doc(new_doc).save(ignore_permissions=True)
+
+        if doc_data and self.set_property_after_alert and self.property_value:
+            if doc_data.doctype and doc_data.name:
+                fieldname = self.set_property_after_alert
+                value = self.property_value
+                meta = frappe.get_meta(doc_data.get("doctype"))
+                df = meta.get_field(fieldname)
+                if df:
+                    if df.fieldtype in frappe.model.numeric_fieldtypes:
+                        value = frappe.utils.cint(value)
+
+                    frappe.db.set_value(doc_data.get("doctype"), doc_data.get("name"), fieldname, value)
 
+    def log_result(self, meta):
+        frappe.get_doc({
+            "doctype": "WhatsApp Notification Log",
+            "template": self.template,
+            "meta_data": meta
+        }).insert(ignore_permissions=True)
+
+
+    def on_update(self):
+        """Rebuild the doc event map and schedule with the changed notification."""
+        frappe.cache().delete_value("whatsapp_notification_map")
+        clear_schedule_cache()
 
     def on_trash(self):
         """On delete remove from schedule."""
         frappe.cache().delete_value("whatsapp_notification_map")
+        clear_schedule_cache()
 
 
     def format_number(self, number):
@@ -324,6 +442,13 @@ class WhatsAppNotification(Document):
             ],
         )
 
+        template = frappe.db.get_value("WhatsApp Templates", self.template, fieldname='*')
+        if template and not self.condition and self.can_send_in_bulk(template):
+            # no condition to evaluate, so the documents themselves are not needed
+            self._timings = {}
+            mark(self._timings, "triggered")
+            return self.send_bulk_template(template, doc_list)
+
         for d in doc_list:
             doc = frappe.get_doc(self.reference_doctype, d.name)
             self.send_template_message(doc)
@@ -349,7 +474,12 @@ def trigger_notifications(method="daily"):
 
     if method == "daily":
         doc_list = frappe.get_all(
-            "WhatsApp Notification", filters={"doctype_event": ("in", ("Days Before", "Days After")), "disabled": 0}
+            "WhatsApp Notification",
+            filters={
+                "notification_type": "DocType Event",
+                "doctype_event": ("in", ("Days Before", "Days After")),
+                "disabled": 0,
+            },
         )
         for d in doc_list:
             alert = frappe.get_doc("WhatsApp Notification", d.name)
@@ -1,8 +1,12 @@
 # Copyright (c) 2022, Shridhar Patil and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
 class WhatsAppNotificationLog(Document):
 	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("WhatsApp Notification Log", ["creation"])
@@ -0,0 +1,18 @@
+# Copyright (c) 2026, Shridhar Patil and Contributors
+# See license.txt
+
+from frappe.tests import UnitTestCase
+
+from frappe_whatsapp.utils.phone_index import get_suffix, parse_phone_fields
+
+
+class TestWhatsAppPhoneIndex(UnitTestCase):
+	def test_parse_phone_fields(self):
+		self.assertEqual(
+			parse_phone_fields("mobile_no, phone_nos.phone,"),
+			[("mobile_no", None), ("phone_nos", "phone")],
+		)
+
+	def test_suffix(self):
+		self.assertEqual(get_suffix("919876543210"), "9876543210")
+		self.assertEqual(get_suffix("12345"), "12345")
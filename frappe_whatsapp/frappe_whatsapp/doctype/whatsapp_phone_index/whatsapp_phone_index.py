@@ -0,0 +1,17 @@
+# Copyright (c) 2026, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class WhatsAppPhoneIndex(Document):
+	"""Normalized phone number of a CRM record, maintained by utils/phone_index."""
+
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("WhatsApp Phone Index", ["number"])
+	frappe.db.add_index("WhatsApp Phone Index", ["number_suffix"])
+	frappe.db.add_index("WhatsApp Phone Index", ["reference_doctype", "reference_name"])
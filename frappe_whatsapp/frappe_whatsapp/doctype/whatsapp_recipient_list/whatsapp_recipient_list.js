@@ -123,5 +123,29 @@ frappe.ui.form.on('WhatsApp Recipient List', {
                 });
             }
         });
+
+        if(!frm.is_new()) {
+            frm.add_custom_button(__('Enroll in Journey'), function() {
+                frappe.prompt({
+                    fieldname: 'journey',
+                    fieldtype: 'Link',
+                    label: __('Journey'),
+                    options: 'WhatsApp Journey',
+                    reqd: 1,
+                    get_query: () => ({filters: {enabled: 1, reference_doctype: ['is', 'not set']}})
+                }, function(values) {
+                    frappe.call({
+                        method: 'frappe_whatsapp.utils.journeys.enroll_contacts',
+                        args: {journey: values.journey, recipient_list: frm.doc.name},
+                        callback: function(r) {
+                            frappe.show_alert({
+                                message: __('{0} recipients enrolled', [r.message]),
+                                indicator: 'green'
+                            });
+                        }
+                    });
+                }, __('Enroll in Journey'));
+            });
+        }
     }
 });
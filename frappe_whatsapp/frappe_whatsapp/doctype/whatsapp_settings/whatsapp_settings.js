@@ -2,7 +2,81 @@
 // For license information, please see license.txt
 
 frappe.ui.form.on('WhatsApp Settings', {
-	// refresh: function(frm) {
+	refresh: function(frm) {
+		if (frm.doc.enable_message_archival) {
+			frm.add_custom_button(__("Archive Old Messages Now"), function() {
+				frappe.call({
+					method: "frappe_whatsapp.utils.retention.archive_now",
+					callback: function() {
+						frappe.show_alert({message: __("Archival queued"), indicator: "green"});
+					}
+				});
+			});
+		}
 
-	// }
+		frm.add_custom_button(__("Rebuild Phone Index"), function() {
+			frappe.call({
+				method: "frappe_whatsapp.utils.phone_index.enqueue_rebuild",
+				callback: function() {
+					frappe.show_alert({message: __("Phone index rebuild queued"), indicator: "green"});
+				}
+			});
+		});
+
+		if (frm.doc.enable_message_search) {
+			frm.add_custom_button(__("Rebuild Search Index"), function() {
+				frappe.call({
+					method: "frappe_whatsapp.utils.search.rebuild_search_index",
+					callback: function() {
+						frappe.show_alert({message: __("Search index rebuild queued"), indicator: "green"});
+					}
+				});
+			});
+		}
+
+		frm.add_custom_button(__("Start"), function() {
+			frappe.prompt([
+				{fieldname: "minutes", fieldtype: "Int", label: __("Minutes"), default: 10, reqd: 1},
+				{fieldname: "mode", fieldtype: "Select", label: __("Mode"), options: "Instrumented\nSampling", default: "Instrumented"},
+				{fieldname: "sample_rate", fieldtype: "Percent", label: __("Sample Rate"), default: 100}
+			], function(values) {
+				frappe.call({
+					method: "frappe_whatsapp.utils.profiler.start_profiling",
+					args: values,
+					callback: function() {
+						frm.reload_doc();
+					}
+				});
+			}, __("Start Profiling"));
+		}, __("Profiling"));
+
+		frm.add_custom_button(__("Summary"), function() {
+			frappe.call({
+				method: "frappe_whatsapp.utils.profiler.get_profile_summary",
+				callback: function(r) {
+					let rows = (r.message || []).map(row => `<tr>
+						<td>${frappe.utils.escape_html(row.section)}</td>
+						<td>${frappe.utils.escape_html(row.key)}</td>
+						<td class="text-right">${row.calls}</td>
+						<td class="text-right">${row.total_ms}</td>
+						<td class="text-right">${row.avg_ms}</td>
+						<td class="text-right">${row.queries}</td>
+					</tr>`).join("");
+					frappe.msgprint({
+						title: __("Profile Summary"),
+						wide: true,
+						message: `<table class="table table-bordered">
+							<tr><th>${__("Section")}</th><th>${__("Key")}</th><th>${__("Calls")}</th>
+							<th>${__("Total ms")}</th><th>${__("Avg ms")}</th><th>${__("Queries")}</th></tr>
+							${rows}
+						</table>`
+					});
+				}
+			});
+		}, __("Profiling"));
+
+		frm.add_custom_button(__("Download Stacks"), function() {
+			window.open("/api/method/frappe_whatsapp.utils.profiler.download_stacks");
+		}, __("Profiling"));
+	}
 });
@@ -1,8 +1,19 @@
 # Copyright (c) 2022, Shridhar Patil and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
+from frappe import _
 from frappe.model.document import Document
 
 class WhatsAppSettings(Document):
-	pass
+	def validate(self):
+		if self.window_template and frappe.db.get_value("WhatsApp Templates", self.window_template, "sample_values"):
+			# sent to numbers of any record, so there is no document to fill variables from
+			frappe.throw(_("Window Template {0} must not have body variables").format(frappe.bold(self.window_template)))
+
+	def on_update(self):
+		from frappe_whatsapp.utils.phone_index import clear_sources_cache
+		from frappe_whatsapp.utils.webhook import publish_ingest_config
+
+		publish_ingest_config()
+		clear_sources_cache()
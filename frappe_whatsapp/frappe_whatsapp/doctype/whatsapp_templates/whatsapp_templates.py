@@ -2,13 +2,15 @@
 
 # Copyright (c) 2022, Shridhar Patil and contributors
 # For license information, please see license.txt
-import os
 import json
+import hashlib
 import frappe
-import magic
 from frappe.model.document import Document
 from frappe.integrations.utils import make_post_request, make_request
 from frappe.desk.form.utils import get_pdf_link
+from frappe.utils import now_datetime
+
+from frappe_whatsapp.utils.media import get_header_handle
 
 
 class WhatsAppTemplates(Document):
@@ -20,59 +22,21 @@ class WhatsAppTemplates(Document):
             self.language_code = lang_code.replace("-", "_")
 
         if self.header_type in ["IMAGE", "DOCUMENT"] and self.sample:
-            self.get_session_id()
-            self.get_media_id()
+            self.set_header_handle()
 
         if not self.is_new():
             self.update_template()
 
 
-    def get_session_id(self):
-        """Upload media."""
-        self.get_settings()
-        file_path = self.get_absolute_path(self.sample)
-        mime = magic.Magic(mime=True)
-        file_type = mime.from_file(file_path)
-
-        payload = {
-            'file_length': os.path.getsize(file_path),
-            'file_type': file_type,
-            'messaging_product': 'whatsapp'
-        }
-
-        response = make_post_request(
-            f"{self._url}/{self._version}/{self._app_id}/uploads",
-            headers=self._headers,
-            data=json.loads(json.dumps(payload))
-        )
-        self._session_id = response['id']
+    def set_header_handle(self):
+        """Upload the sample unless the same content was already uploaded."""
+        if self.header_handle and not self.has_value_changed("sample"):
+            return
 
-    def get_media_id(self):
         self.get_settings()
-
-        headers = {
-                "authorization": f"OAuth {self._token}"
-            }
-        file_name = self.get_absolute_path(self.sample)
-        with open(file_name, mode='rb') as file: # b is important -> binary
-            file_content = file.read()
-
-        payload = file_content
-        response = make_post_request(
-            f"{self._url}/{self._version}/{self._session_id}",
-            headers=headers,
-            data=payload
-        )
-
-        self._media_id = response['h']
-
-    def get_absolute_path(self, file_name):
-        if(file_name.startswith('/files/')):
-            file_path = f'{frappe.utils.get_bench_path()}/sites/{frappe.utils.get_site_base_path()[2:]}/public{file_name}'
-        if(file_name.startswith('/private/')):
-            file_path = f'{frappe.utils.get_bench_path()}/sites/{frappe.utils.get_site_base_path()[2:]}{file_name}'
-        return file_path
-
+        handle, sample_hash = get_header_handle(self.sample, self._settings)
+        self.header_handle = handle
+        self.sample_hash = sample_hash
 
     def after_insert(self):
         if self.template_name:
@@ -152,6 +116,7 @@ class WhatsAppTemplates(Document):
     def get_settings(self):
         """Get whatsapp settings."""
         settings = frappe.get_doc("WhatsApp Settings", "WhatsApp Settings")
+        self._settings = settings
         self._token = settings.get_password("token")
         self._url = settings.url
         self._version = settings.version
@@ -194,7 +159,7 @@ class WhatsAppTemplates(Document):
                 key = frappe.get_doc(self.doctype, self.name).get_document_share_key()
                 link = get_pdf_link(self.doctype, self.name)
                 pdf_link = f"{frappe.utils.get_url()}{link}&key={key}"
-            header.update({"example": {"header_handle": [self._media_id]}})
+            header.update({"example": {"header_handle": [self.header_handle]}})
 
         return header
 
@@ -202,70 +167,11 @@ class WhatsAppTemplates(Document):
 @frappe.whitelist()
 def fetch():
     """Fetch templates from meta."""
-
-    # get credentials
-    settings = frappe.get_doc("WhatsApp Settings", "WhatsApp Settings")
-    token = settings.get_password("token")
-    url = settings.url
-    version = settings.version
-    business_id = settings.business_id
-
-    headers = {"authorization": f"Bearer {token}", "content-type": "application/json"}
-
     try:
-        response = make_request(
-            "GET",
-            f"{url}/{version}/{business_id}/message_templates",
-            headers=headers,
-        )
-
-        for template in response["data"]:
-            # set flag to insert or update
-            flags = 1
-            if frappe.db.exists("WhatsApp Templates", {"actual_name": template["name"]}):
-                doc = frappe.get_doc("WhatsApp Templates", {"actual_name": template["name"]})
-            else:
-                flags = 0
-                doc = frappe.new_doc("WhatsApp Templates")
-                doc.template_name = template["name"]
-                doc.actual_name = template["name"]
-
-            doc.status = template["status"]
-            doc.language_code = template["language"]
-            doc.category = template["category"]
-            doc.id = template["id"]
-
-            # update components
-            for component in template["components"]:
-
-                # update header
-                if component["type"] == "HEADER":
-                    doc.header_type = component["format"]
-
-                    # if format is text update sample text
-                    if component["format"] == "TEXT":
-                        doc.header = component["text"]
-                # Update footer text
-                elif component["type"] == "FOOTER":
-                    doc.footer = component["text"]
-
-                # update template text
-                elif component["type"] == "BODY":
-                    doc.template = component["text"]
-                    if component.get("example"):
-                        doc.sample_values = ",".join(
-                            component["example"]["body_text"][0]
-                        )
-
-            # if document exists update else insert
-            # used db_update and db_insert to ignore hooks
-            if flags:
-                doc.db_update()
-            else:
-                doc.db_insert()
-            frappe.db.commit()
-
-    except Exception as e:
+        result = sync_templates()
+    except Exception:
+        if not frappe.flags.integration_request:
+            raise
         res = frappe.flags.integration_request.json()["error"]
         error_message = res.get("error_user_msg", res.get("message"))
         frappe.throw(
@@ -273,4 +179,122 @@ def fetch():
             title=res.get("error_user_title", "Error"),
         )
 
-    return "Successfully fetched templates from meta"
+    return "Successfully fetched templates from meta ({0} new, {1} updated, {2} unchanged)".format(
+        result["inserted"], result["updated"], result["unchanged"]
+    )
+
+
+def sync_templates():
+    """Stream every page of templates from meta and write only the changed ones.
+
+    Remote templates are compared with the local ones through a hash of
+    their components, so unchanged templates cost no writes. All changes
+    are committed together at the end.
+
+    Returns:
+        dict: Counts of inserted, updated and unchanged templates
+    """
+    settings = frappe.get_doc("WhatsApp Settings", "WhatsApp Settings")
+    local = {
+        (t.actual_name, t.language_code): t
+        for t in frappe.get_all(
+            "WhatsApp Templates",
+            fields=["name", "actual_name", "language_code", "components_hash"],
+        )
+    }
+    result = {"inserted": 0, "updated": 0, "unchanged": 0}
+
+    for template in iter_remote_templates(settings):
+        components_hash = get_components_hash(template)
+        existing = local.get((template["name"], template["language"]))
+
+        if existing and existing.components_hash == components_hash:
+            result["unchanged"] += 1
+            continue
+
+        values = get_template_values(template)
+        values["components_hash"] = components_hash
+
+        # write directly to ignore hooks
+        if existing:
+            frappe.db.set_value("WhatsApp Templates", existing.name, values)
+            result["updated"] += 1
+        else:
+            doc = frappe.new_doc("WhatsApp Templates")
+            doc.template_name = template["name"]
+            doc.actual_name = template["name"]
+            doc.update(values)
+            doc.db_insert()
+            result["inserted"] += 1
+
+    frappe.db.set_single_value("WhatsApp Settings", "last_template_sync", now_datetime())
+    frappe.db.commit()
+    return result
+
+
+def iter_remote_templates(settings, page_size=250):
+    """Yield templates from all pages of the message_templates edge."""
+    headers = {
+        "authorization": f"Bearer {settings.get_password('token')}",
+        "content-type": "application/json",
+    }
+    url = (
+        f"{settings.url}/{settings.version}/{settings.business_id}/message_templates"
+        f"?fields=name,status,language,category,id,components&limit={page_size}"
+    )
+
+    while url:
+        response = make_request("GET", url, headers=headers)
+        yield from response.get("data", [])
+        url = response.get("paging", {}).get("next")
+
+
+def get_components_hash(template):
+    """Stable hash of everything the sync copies from a remote template."""
+    payload = {
+        key: template.get(key)
+        for key in ("id", "status", "category", "components")
+    }
+    return hashlib.md5(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def get_template_values(template):
+    """Map a remote template to WhatsApp Templates field values."""
+    values = {
+        "status": template["status"],
+        "language_code": template["language"],
+        "category": template["category"],
+        "id": template["id"],
+    }
+
+    # update components
+    for component in template["components"]:
+
+        # update header
+        if component["type"] == "HEADER":
+            values["header_type"] = component["format"]
+
+            # if format is text update sample text
+            if component["format"] == "TEXT":
+                values["header"] = component["text"]
+        # Update footer text
+        elif component["type"] == "FOOTER":
+            values["footer"] = component["text"]
+
+        # update template text
+        elif component["type"] == "BODY":
+            values["template"] = component["text"]
+            if component.get("example"):
+                values["sample_values"] = ",".join(
+                    component["example"]["body_text"][0]
+                )
+
+    return values
+
+
+def sync_templates_job():
+    """Scheduled hourly sync, when enabled in WhatsApp Settings."""
+    settings = frappe.get_cached_doc("WhatsApp Settings")
+    if not settings.enabled or not settings.auto_sync_templates:
+        return
+    sync_templates()
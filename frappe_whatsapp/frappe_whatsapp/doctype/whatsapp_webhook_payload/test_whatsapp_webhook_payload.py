@@ -0,0 +1,18 @@
+# Copyright (c) 2026, Shridhar Patil and Contributors
+# See license.txt
+
+from frappe.tests import IntegrationTestCase
+
+from frappe_whatsapp.utils.payload_store import read_payload, store_payload
+
+
+class TestWhatsAppWebhookPayload(IntegrationTestCase):
+	def test_store_and_read(self):
+		first = {"entry": [{"id": "1", "changes": []}]}
+		second = {"entry": [{"id": "2", "changes": [{"field": "messages"}]}]}
+		names = [store_payload("wamid.test", first), store_payload("wamid.test", second)]
+
+		# both payloads share today's segment; each pointer reads back its own
+		self.assertEqual(read_payload(names[0]), first)
+		self.assertEqual(read_payload(names[1]), second)
+		self.assertIsNone(read_payload("missing"))
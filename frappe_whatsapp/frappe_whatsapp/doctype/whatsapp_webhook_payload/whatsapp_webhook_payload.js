@@ -0,0 +1,16 @@
+// Copyright (c) 2026, Shridhar Patil and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on('WhatsApp Webhook Payload', {
+	refresh: function(frm) {
+		frm.add_custom_button(__("View Payload"), function() {
+			frm.call("get_payload").then((r) => {
+				frappe.msgprint({
+					title: frm.doc.payload_key,
+					message: `<pre>${frappe.utils.escape_html(JSON.stringify(r.message, null, 2))}</pre>`,
+					wide: true
+				});
+			});
+		});
+	}
+});
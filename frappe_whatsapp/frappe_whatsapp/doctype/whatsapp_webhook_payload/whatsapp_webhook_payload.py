@@ -0,0 +1,19 @@
+# Copyright (c) 2026, Shridhar Patil and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class WhatsAppWebhookPayload(Document):
+	"""Pointer to a compressed raw payload in a segment file."""
+
+	@frappe.whitelist()
+	def get_payload(self):
+		from frappe_whatsapp.utils.payload_store import read_payload
+
+		return read_payload(self.name)
+
+
+def on_doctype_update():
+	frappe.db.add_index("WhatsApp Webhook Payload", ["payload_key"])
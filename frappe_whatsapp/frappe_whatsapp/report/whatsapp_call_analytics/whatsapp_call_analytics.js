@@ -0,0 +1,34 @@
+frappe.query_reports["WhatsApp Call Analytics"] = {
+    "filters": [
+        {
+            "fieldname": "from_date",
+            "label": __("From Date"),
+            "fieldtype": "Date",
+            "default": frappe.datetime.add_days(frappe.datetime.get_today(), -7)
+        },
+        {
+            "fieldname": "to_date",
+            "label": __("To Date"),
+            "fieldtype": "Date",
+            "default": frappe.datetime.get_today()
+        },
+        {
+            "fieldname": "group_by",
+            "label": __("Group By"),
+            "fieldtype": "Select",
+            "options": "hour\nnumber\ndirection",
+            "default": "hour"
+        },
+        {
+            "fieldname": "number",
+            "label": __("Number"),
+            "fieldtype": "Data"
+        },
+        {
+            "fieldname": "direction",
+            "label": __("Direction"),
+            "fieldtype": "Select",
+            "options": "\nIncoming\nOutgoing"
+        }
+    ]
+};
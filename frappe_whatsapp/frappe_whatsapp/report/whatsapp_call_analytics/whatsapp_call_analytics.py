@@ -0,0 +1,82 @@
+from frappe.utils import add_days
+
+from frappe_whatsapp.utils.call_analytics import get_call_analytics
+
+
+def execute(filters=None):
+    if not filters:
+        filters = {}
+
+    group_by = filters.get("group_by") or "hour"
+    columns = get_columns(group_by)
+    data = get_call_analytics(
+        from_date=filters.get("from_date"),
+        # include the whole last day
+        to_date=add_days(filters.get("to_date"), 1) if filters.get("to_date") else None,
+        group_by=group_by,
+        number=filters.get("number"),
+        direction=filters.get("direction"),
+    )
+    for row in data:
+        row["answered_ratio"] = row["answered_ratio"] * 100
+
+    return columns, data
+
+def get_columns(group_by):
+    group_column = {
+        "hour": {"fieldname": "hour", "label": "Hour", "fieldtype": "Datetime", "width": 160},
+        "number": {"fieldname": "number", "label": "Number", "fieldtype": "Data", "width": 150},
+        "direction": {"fieldname": "direction", "label": "Direction", "fieldtype": "Data", "width": 120},
+    }[group_by]
+
+    return [
+        group_column,
+        {
+            "fieldname": "call_count",
+            "label": "Calls",
+            "fieldtype": "Int",
+            "width": 100
+        },
+        {
+            "fieldname": "answered_count",
+            "label": "Answered",
+            "fieldtype": "Int",
+            "width": 100
+        },
+        {
+            "fieldname": "missed_count",
+            "label": "Missed",
+            "fieldtype": "Int",
+            "width": 100
+        },
+        {
+            "fieldname": "failed_count",
+            "label": "Failed",
+            "fieldtype": "Int",
+            "width": 100
+        },
+        {
+            "fieldname": "answered_ratio",
+            "label": "Answered Ratio",
+            "fieldtype": "Percent",
+            "width": 120
+        },
+        {
+            "fieldname": "total_duration",
+            "label": "Total Duration (s)",
+            "fieldtype": "Int",
+            "width": 140
+        },
+        {
+            "fieldname": "avg_duration",
+            "label": "Avg Duration (s)",
+            "fieldtype": "Float",
+            "width": 130
+        },
+        {
+            "fieldname": "p95_duration",
+            "label": "P95 Duration (s)",
+            "fieldtype": "Int",
+            "width": 130
+        }
+    ]
@@ -0,0 +1,39 @@
+const whatsapp_message_stages = "triggered\nqueued\napi_request\napi_accepted\nsent\ndelivered\nread\nfailed";
+
+frappe.query_reports["WhatsApp Message Latency"] = {
+    "filters": [
+        {
+            "fieldname": "from_date",
+            "label": __("From Date"),
+            "fieldtype": "Date",
+            "default": frappe.datetime.add_days(frappe.datetime.get_today(), -7)
+        },
+        {
+            "fieldname": "to_date",
+            "label": __("To Date"),
+            "fieldtype": "Date",
+            "default": frappe.datetime.get_today()
+        },
+        {
+            "fieldname": "group_by",
+            "label": __("Group By"),
+            "fieldtype": "Select",
+            "options": "template\ncampaign\nnotification",
+            "default": "template"
+        },
+        {
+            "fieldname": "from_stage",
+            "label": __("From Stage"),
+            "fieldtype": "Select",
+            "options": whatsapp_message_stages,
+            "default": "queued"
+        },
+        {
+            "fieldname": "to_stage",
+            "label": __("To Stage"),
+            "fieldtype": "Select",
+            "options": whatsapp_message_stages,
+            "default": "delivered"
+        }
+    ]
+};
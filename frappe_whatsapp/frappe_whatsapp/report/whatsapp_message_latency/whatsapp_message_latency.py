@@ -0,0 +1,42 @@
+from frappe_whatsapp.utils.timings import get_latency_stats
+
+
+def execute(filters=None):
+    if not filters:
+        filters = {}
+
+    group_by = filters.get("group_by") or "template"
+    data = get_latency_stats(
+        from_date=filters.get("from_date"),
+        to_date=filters.get("to_date"),
+        group_by=group_by,
+        from_stage=filters.get("from_stage") or "queued",
+        to_stage=filters.get("to_stage") or "delivered",
+    )
+
+    return get_columns(group_by), data
+
+def get_columns(group_by):
+    group_column = {
+        "template": {"fieldname": "template", "label": "Template", "fieldtype": "Link", "options": "WhatsApp Templates", "width": 200},
+        "campaign": {"fieldname": "campaign", "label": "Campaign", "fieldtype": "Link", "options": "Bulk WhatsApp Message", "width": 200},
+        "notification": {"fieldname": "notification", "label": "Notification", "fieldtype": "Link", "options": "WhatsApp Notification", "width": 200},
+    }[group_by]
+
+    columns = [
+        group_column,
+        {
+            "fieldname": "messages",
+            "label": "Messages",
+            "fieldtype": "Int",
+            "width": 100
+        },
+    ]
+    for fieldname, label in (("p50", "P50"), ("p90", "P90"), ("p95", "P95"), ("p99", "P99"), ("max", "Max")):
+        columns.append({
+            "fieldname": fieldname,
+            "label": f"{label} (s)",
+            "fieldtype": "Float",
+            "width": 100
+        })
+    return columns
@@ -119,7 +119,9 @@ scheduler_events = {
         "frappe_whatsapp.utils.trigger_whatsapp_notifications_all"
     ],
     "hourly": [
-        "frappe_whatsapp.utils.trigger_whatsapp_notifications_hourly"
+        "frappe_whatsapp.utils.trigger_whatsapp_notifications_hourly",
+        "frappe_whatsapp.frappe_whatsapp.doctype.whatsapp_templates.whatsapp_templates.sync_templates_job",
+        "frappe_whatsapp.utils.scheduled_send.reschedule_pending",
     ],
     "hourly_long": [
         "frappe_whatsapp.utils.trigger_whatsapp_notifications_hourly_long"
@@ -127,6 +129,7 @@ scheduler_events = {
     "daily": [
         "frappe_whatsapp.utils.trigger_whatsapp_notifications_daily",
         "frappe_whatsapp.frappe_whatsapp.doctype.whatsapp_notification.whatsapp_notification.trigger_notifications",
+        "frappe_whatsapp.utils.print_attachments.delete_expired_print_files",
     ],
     "daily_long": [
         "frappe_whatsapp.utils.trigger_whatsapp_notifications_daily_long",
@@ -143,6 +146,25 @@ scheduler_events = {
     "monthly_long": [
         "frappe_whatsapp.utils.trigger_whatsapp_notifications_monthly_long",
     ],
+    "yearly": [
+        "frappe_whatsapp.utils.trigger_whatsapp_notifications_yearly",
+    ],
+    "cron": {
+        "* * * * *": [
+            # safety net for payloads queued by frappe_whatsapp.ingest
+            "frappe_whatsapp.utils.webhook.drain_webhook_queue",
+            "frappe_whatsapp.utils.search.index_queued_messages",
+            "frappe_whatsapp.utils.scheduled_send.release_due_sends",
+            "frappe_whatsapp.utils.journeys.process_due_enrollments",
+        ],
+        "*/5 * * * *": [
+            "frappe_whatsapp.utils.calling.sweep_stale_calls",
+        ],
+        # off-hours archival of old messages and logs
+        "30 2 * * *": [
+            "frappe_whatsapp.utils.retention.run_retention",
+        ],
+    },
 }
 
 # Testing
@@ -153,9 +175,9 @@ scheduler_events = {
 # Overriding Methods
 # ------------------------------
 #
-# override_whitelisted_methods = {
-#   "frappe.desk.doctype.event.event.get_events": "frappe_whatsapp.event.get_events"
-# }
+override_whitelisted_methods = {
+    "frappe_whatsapp.metrics": "frappe_whatsapp.utils.metrics.metrics"
+}
 #
 # each overriding function accepts a `data` argument;
 # generated from the base implementation of the doctype dashboard,
@@ -215,7 +237,8 @@ doc_events = {
         "on_trash": "frappe_whatsapp.utils.run_server_script_for_doc_event",
         "after_delete": "frappe_whatsapp.utils.run_server_script_for_doc_event",
         "before_update_after_submit": "frappe_whatsapp.utils.run_server_script_for_doc_event",
-        "on_update_after_submit": "frappe_whatsapp.utils.run_server_script_for_doc_event"
+        "on_update_after_submit": "frappe_whatsapp.utils.run_server_script_for_doc_event",
+        "after_rename": "frappe_whatsapp.utils.phone_index.on_rename"
     }
 }
 
@@ -233,3 +256,15 @@ website_route_rules = [
         "to_route": "frappe_whatsapp.mcp.handle_mcp"
     }
 ]
+
+# Incoming Messages
+# -----------------
+# Parse extra webhook message types and handle incoming messages in the
+# background, see frappe_whatsapp.utils.message_handlers
+
+# whatsapp_message_parsers = {
+#   "order": "my_app.whatsapp.parse_order"
+# }
+# whatsapp_message_handlers = {
+#   "location": ["my_app.whatsapp.on_location"]
+# }
@@ -0,0 +1,192 @@
+"""Lightweight WSGI app for Meta webhook callbacks.
+
+The regular endpoint (`frappe_whatsapp.utils.webhook.webhook`) runs the
+full Frappe request: site init, database connection, session and form
+parsing. This app only checks the `X-Hub-Signature-256` header, pushes
+the raw body to a Redis list and returns. A background job
+(`drain_webhook_queue`) routes the queue to the webhook lanes, which
+process it with the regular code.
+
+Run it next to the Frappe web server, from the sites directory:
+
+    gunicorn -w 2 --threads 8 -b 127.0.0.1:8010 frappe_whatsapp.ingest:application
+
+and proxy the webhook path to it. `with_ingest(app, path)` mounts it
+in front of another WSGI app instead.
+
+The verify token and app secret come from the `whatsapp_webhook_verify_token`
+and `whatsapp_app_secret` site config keys, or else from a Redis copy of
+WhatsApp Settings written on save and by the drain job. The copy of the
+app secret is encrypted with the `encryption_key` of the site config.
+"""
+import hashlib
+import hmac
+import json
+import os
+import time
+
+import frappe
+import redis
+from cryptography.fernet import Fernet, InvalidToken
+from werkzeug.wrappers import Request, Response
+
+INGEST_QUEUE_KEY = "whatsapp_webhook_queue"
+INGEST_FAILED_KEY = "whatsapp_webhook_failed"
+INGEST_PENDING_KEY = "whatsapp_webhook_drain_pending"
+INGEST_CONFIG_KEY = "whatsapp_ingest_config"
+
+# a drain job is enqueued at most once per window, whatever the request rate
+DRAIN_WINDOW = 60
+CONFIG_TTL = 30
+MAX_BODY_SIZE = 1024 * 1024
+
+SITES_PATH = os.environ.get("SITES_PATH", ".")
+
+_sites = {}
+
+
+def get_site(site):
+    """Config, Redis connection and key prefix of a site, loaded once per process."""
+    if site not in _sites:
+        site_path = os.path.join(SITES_PATH, site)
+        conf = frappe.get_site_config(sites_path=SITES_PATH, site_path=site_path)
+        _sites[site] = {
+            "name": site,
+            "conf": conf,
+            "redis": redis.Redis.from_url(conf.get("redis_cache") or "redis://localhost:13000"),
+            # same keys as frappe.cache().make_key
+            "prefix": f"{conf.get('db_name')}|",
+            "config": None,
+            "config_expiry": 0,
+        }
+    return _sites[site]
+
+
+def get_site_name(request):
+    site = request.headers.get("X-Frappe-Site-Name") or os.environ.get("FRAPPE_SITE")
+    if not site:
+        site = request.host.split(":")[0]
+
+    if "/" in site or site.startswith(".") or not os.path.isfile(
+        os.path.join(SITES_PATH, site, "site_config.json")
+    ):
+        return None
+    return site
+
+
+def get_ingest_config(site):
+    """Verify token and app secret, cached in the process for CONFIG_TTL seconds."""
+    if site["config"] is None or site["config_expiry"] < time.monotonic():
+        raw = site["redis"].get(f"{site['prefix']}{INGEST_CONFIG_KEY}")
+        config = json.loads(raw) if raw else {}
+        conf = site["conf"]
+        config["app_secret"] = decrypt_secret(config.get("app_secret"), conf.get("encryption_key"))
+        if conf.get("whatsapp_webhook_verify_token"):
+            config["verify_token"] = conf["whatsapp_webhook_verify_token"]
+        if conf.get("whatsapp_app_secret"):
+            config["app_secret"] = conf["whatsapp_app_secret"]
+
+        site["config"] = config
+        site["config_expiry"] = time.monotonic() + CONFIG_TTL
+    return site["config"]
+
+
+def decrypt_secret(value, encryption_key):
+    """App secret from its Redis copy, encrypted like passwords with the site's key."""
+    if not value or not encryption_key:
+        return None
+    try:
+        return Fernet(encryption_key.encode()).decrypt(value.encode()).decode()
+    except InvalidToken:
+        return None
+
+
+def is_valid_signature(body, signature, app_secret):
+    """Check an `X-Hub-Signature-256` header against the raw request body."""
+    if not signature or not app_secret:
+        return False
+    expected = hmac.new(app_secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(signature, f"sha256={expected}")
+
+
+def wake_drain(site):
+    """Enqueue the drain job; only called when no drain is pending."""
+    frappe.init(site=site["name"], sites_path=SITES_PATH)
+    try:
+        frappe.enqueue(
+            "frappe_whatsapp.utils.webhook.drain_webhook_queue",
+            queue="short",
+            job_id="whatsapp_webhook_drain",
+            deduplicate=True,
+        )
+    finally:
+        frappe.destroy()
+
+
+def make_application(queue_key=INGEST_QUEUE_KEY, wake=True):
+    """Build the ingest WSGI app.
+
+    Args:
+        queue_key: Redis list the raw payloads are pushed to
+        wake: Enqueue the drain job when the first payload of a window arrives
+    """
+
+    @Request.application
+    def application(request):
+        site_name = get_site_name(request)
+        if not site_name:
+            return Response("Unknown site", status=404)
+
+        site = get_site(site_name)
+        config = get_ingest_config(site)
+
+        if request.method == "GET":
+            token = config.get("verify_token")
+            if not token or request.args.get("hub.verify_token") != token:
+                return Response("Verify token does not match", status=403)
+            return Response(request.args.get("hub.challenge", ""), status=200)
+
+        if request.method != "POST":
+            return Response(status=405)
+
+        if (request.content_length or 0) > MAX_BODY_SIZE:
+            return Response(status=413)
+
+        body = request.get_data(cache=False)
+        if not config.get("app_secret"):
+            # nothing to verify against; meta retries until settings are published
+            return Response("Not configured", status=503)
+        if not is_valid_signature(body, request.headers.get("X-Hub-Signature-256"), config["app_secret"]):
+            return Response("Invalid signature", status=403)
+
+        prefix = site["prefix"]
+        pipe = site["redis"].pipeline(transaction=False)
+        pipe.rpush(f"{prefix}{queue_key}", body)
+        if wake:
+            pipe.set(f"{prefix}{INGEST_PENDING_KEY}", 1, nx=True, ex=DRAIN_WINDOW)
+        results = pipe.execute()
+
+        if wake and results[1]:
+            try:
+                wake_drain(site)
+            except Exception:
+                # the payload is queued; the per-minute drain picks it up
+                pass
+
+        return Response("OK", status=200)
+
+    return application
+
+
+application = make_application()
+
+
+def with_ingest(app, path="/api/method/frappe_whatsapp.ingest"):
+    """Serve `path` with the ingest app and everything else with `app`."""
+
+    def middleware(environ, start_response):
+        if environ.get("PATH_INFO") == path:
+            return application(environ, start_response)
+        return app(environ, start_response)
+
+    return middleware
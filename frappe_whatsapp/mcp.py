@@ -2,7 +2,7 @@
 import frappe
 import frappe_mcp
 from frappe_whatsapp.utils import calling
-from frappe_whatsapp.utils import send_whatsapp_message
+from frappe_whatsapp.utils import send_whatsapp_message, normalize_number
 import json
 
 # Create MCP instance
@@ -102,7 +102,7 @@ def get_message_history(phone_number: str = None, limit: int = 20):
     """
     filters = {}
     if phone_number:
-        filters["from"] = phone_number
+        filters["contact_number"] = normalize_number(phone_number)
     
     messages = frappe.get_all(
         "WhatsApp Message",
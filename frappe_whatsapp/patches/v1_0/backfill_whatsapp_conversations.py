@@ -0,0 +1,90 @@
+import frappe
+
+from frappe_whatsapp.utils import normalize_number
+from frappe_whatsapp.utils.retention import get_summary
+
+BATCH_SIZE = 5000
+
+
+def execute():
+	"""Fill contact_number on existing messages and build WhatsApp Conversation rows."""
+	backfill_contact_numbers()
+
+	rows = frappe.db.sql(
+		"""SELECT contact_number, COUNT(*) AS message_count,
+			MAX(creation) AS last_message_at,
+			MAX(IF(type = 'Incoming', creation, NULL)) AS last_inbound_at
+		FROM `tabWhatsApp Message`
+		WHERE contact_number IS NOT NULL AND contact_number != ''
+		GROUP BY contact_number""",
+		as_dict=True,
+	)
+
+	for row in rows:
+		number = normalize_number(row.contact_number)
+		if not number or frappe.db.exists("WhatsApp Conversation", number):
+			continue
+
+		last = frappe.db.get_value(
+			"WhatsApp Message",
+			{"contact_number": row.contact_number, "creation": row.last_message_at},
+			["name", "type", "message"],
+			as_dict=True,
+		)
+		profile_name = frappe.db.get_value(
+			"WhatsApp Message",
+			{"contact_number": row.contact_number, "profile_name": ("is", "set")},
+			"profile_name",
+		)
+		frappe.get_doc({
+			"doctype": "WhatsApp Conversation",
+			"number": number,
+			"profile_name": profile_name,
+			"message_count": row.message_count,
+			"last_message": last.name if last else None,
+			"last_message_at": row.last_message_at,
+			"last_message_type": last.type if last else None,
+			"last_message_preview": get_summary(last.message) if last else None,
+			"last_inbound_at": row.last_inbound_at,
+		}).db_insert()
+
+
+def backfill_contact_numbers():
+	"""Set contact_number with normalize_number, in batches by primary key.
+
+	Python rather than SQL, so historic numbers with dashes, brackets or a
+	00 prefix end up exactly as new messages store them, and short
+	transactions, so the table is not locked for the whole migration.
+	"""
+	last_name = ""
+	while True:
+		rows = frappe.db.sql(
+			"""SELECT name, type, `from`, `to`
+			FROM `tabWhatsApp Message`
+			WHERE name > %(last_name)s AND (contact_number IS NULL OR contact_number = '')
+			ORDER BY name
+			LIMIT %(limit)s""",
+			{"last_name": last_name, "limit": BATCH_SIZE},
+			as_dict=True,
+		)
+		if not rows:
+			break
+		last_name = rows[-1].name
+
+		numbers = {
+			row.name: normalize_number(row["from"] if row.type == "Incoming" else row.to)
+			for row in rows
+		}
+		numbers = {name: number for name, number in numbers.items() if number}
+		if numbers:
+			cases = " ".join(["WHEN %s THEN %s"] * len(numbers))
+			frappe.db.sql(
+				f"""UPDATE `tabWhatsApp Message`
+				SET contact_number = CASE name {cases} END
+				WHERE name IN ({", ".join(["%s"] * len(numbers))})""",
+				[value for item in numbers.items() for value in item] + list(numbers),
+			)
+		frappe.db.commit()
+
+		if len(rows) < BATCH_SIZE:
+			break
@@ -0,0 +1,6 @@
+import frappe
+
+
+def execute():
+	"""Drop the print file hash that never expired; renders are now cached per key with a TTL."""
+	frappe.cache().delete_value("whatsapp_print_files")
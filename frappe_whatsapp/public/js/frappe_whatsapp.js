@@ -1,4 +1,12 @@
 $(document).on('app_ready', function () {
+	// refresh WhatsApp lists from pushed updates instead of polling
+	let refresh_list = frappe.utils.debounce(() => {
+		if (window.cur_list && ["WhatsApp Message", "WhatsApp Conversation"].includes(cur_list.doctype)) {
+			cur_list.refresh();
+		}
+	}, 1000);
+	frappe.realtime.on("whatsapp_message_update", refresh_list);
+
 	// waiting for page to load completely
 	frappe.router.on("change", () => {
 		var route = frappe.get_route();
@@ -2,7 +2,29 @@
 import frappe
 import requests
 import json
+import time
 from frappe.utils import now_datetime, add_to_date
+from frappe_whatsapp.utils.metrics import get_response_code, record_api_call
+from frappe_whatsapp.utils.timings import dump_timings, mark
+from frappe_whatsapp.utils.profiler import profile
+from frappe_whatsapp.utils.notification_scheduler import trigger_scheduled_notifications
+
+# doc event -> WhatsApp Notification.doctype_event
+EVENT_MAP = {
+    "before_insert": "Before Insert",
+    "after_insert": "After Insert",
+    "before_validate": "Before Validate",
+    "validate": "Before Save",
+    "on_update": "After Save",
+    "before_submit": "Before Submit",
+    "on_submit": "After Submit",
+    "before_cancel": "Before Cancel",
+    "on_cancel": "After Cancel",
+    "on_trash": "Before Delete",
+    "after_delete": "After Delete",
+    "before_update_after_submit": "Before Save (Submitted Document)",
+    "on_update_after_submit": "After Save (Submitted Document)",
+}
 
 
 def send_whatsapp_message(number, message, reference_doctype=None, reference_name=None,
@@ -10,6 +32,8 @@ def send_whatsapp_message(number, message, reference_doctype=None, reference_nam
                          template_name=None, language_code="en", custom_data=None,
                          message_type="text"):
     """Send WhatsApp message."""
+    timings = {}
+    mark(timings, "queued")
     settings = frappe.get_doc(
         "WhatsApp Settings", "WhatsApp Settings"
     )
@@ -20,6 +44,29 @@ def send_whatsapp_message(number, message, reference_doctype=None, reference_nam
     }
     your_phone_number_id = settings.phone_id
 
+    if not template_name:
+        from frappe_whatsapp.utils import service_window
+
+        action = service_window.get_outside_window_action(number)
+        if action == service_window.REJECT:
+            service_window.throw_window_closed(number)
+        elif action == service_window.QUEUE:
+            # saved as Queued and sent by the webhook when the contact writes
+            return frappe.get_doc({
+                "doctype": "WhatsApp Message",
+                "message": message if message_type == "text" else media_caption,
+                "to": number,
+                "type": "Outgoing",
+                "attach": media_link,
+                "reference_doctype": reference_doctype,
+                "reference_name": reference_name,
+                "content_type": message_type,
+            }).insert(ignore_permissions=True).as_dict()
+        elif action == service_window.SEND_TEMPLATE:
+            template = service_window.get_window_template()
+            template_name = template.actual_name or template.template_name
+            language_code = template.language_code
+
     if not template_name:
         message_data = format_message_json(
             message_type, number, message, media_link, media_caption,
@@ -44,15 +91,19 @@ def send_whatsapp_message(number, message, reference_doctype=None, reference_nam
             }
         }
     try:
+        started = time.monotonic()
+        mark(timings, "api_request")
         response = requests.post(
             f"{settings.url}/{settings.version}/{your_phone_number_id}/messages",
             json=message_data,
             headers=headers
         )
+        record_api_call("send_whatsapp_message", started, get_response_code(response))
         if response.ok:
             messages = response.json().get('messages')
             if messages:
                 id = messages[0].get("id")
+                mark(timings, "api_accepted")
                 frappe.get_doc({
                     "doctype": "WhatsApp Message",
                     "message": str(template_name) + str(modified_data) if template_name else str(message),
@@ -61,7 +112,8 @@ def send_whatsapp_message(number, message, reference_doctype=None, reference_nam
                     "type": "Outgoing",
                     "reference_doctype": reference_doctype,
                     "reference_name": reference_name,
-                    "content_type": message_type
+                    "content_type": message_type,
+                    "timings": dump_timings(timings)
                 }).save(ignore_permissions=True)
                 frappe.msgprint("WhatsApp message sent")
         else:
@@ -83,13 +135,13 @@ def format_message_json(message_type, number, message, media_link, media_caption
             }
         }
     elif message_type in ["image", "audio", "video", "document"]:
+        from frappe_whatsapp.utils.media import get_media_object
+
         media_data = {
             "messaging_product": "whatsapp",
             "to": number,
             "type": message_type,
-            message_type: {
-                "link": media_link
-            }
+            message_type: get_media_object(media_link) if media_link else {"link": media_link}
         }
         if media_caption and message_type in ["image", "video", "document"]:
             media_data[message_type]["caption"] = media_caption
@@ -100,8 +152,107 @@ def format_message_json(message_type, number, message, media_link, media_caption
         frappe.throw(f"Unsupported message type: {message_type}")
 
 
+def normalize_number(number):
+    """Normalize a phone number to the digits-only form used by WhatsApp.
+
+    "+91 98765-43210" and "0091 9876543210" both become "919876543210".
+    """
+    if not number:
+        return None
+    digits = "".join(char for char in str(number) if char.isdigit())
+    if digits.startswith("00"):
+        digits = digits[2:]
+    return digits or None
+
+
 def get_template_info(template_name, language_code, data):
     """Get template information."""
     # Implementation details for template handling
     # This is a simplified version - actual implementation would fetch from WhatsApp Templates doctype
     return [], template_name, data
+
+
+def run_server_script_for_doc_event(doc, event):
+    """Send the WhatsApp Notifications configured for a doc event.
+
+    Attached to every event of every doctype, so the common case (no
+    notification for the doctype) is a lookup in the cached map.
+    """
+    if frappe.flags.in_install or frappe.flags.in_migrate:
+        return
+
+    # imported records are indexed too, only notifications are skipped
+    if event in ("on_update", "on_update_after_submit", "on_trash"):
+        from frappe_whatsapp.utils.phone_index import sync_phone_index
+
+        sync_phone_index(doc, event)
+
+    if frappe.flags.in_patch or frappe.flags.in_import:
+        return
+
+    with profile("bridge", doc.doctype):
+        notifications = get_notifications_map().get(doc.doctype, {}).get(EVENT_MAP.get(event))
+        for notification_name in notifications or []:
+            with profile("notification", notification_name):
+                frappe.get_cached_doc("WhatsApp Notification", notification_name).send_template_message(doc)
+
+        from frappe_whatsapp.utils.journeys import enroll_for_doc_event
+
+        enroll_for_doc_event(doc, EVENT_MAP.get(event))
+
+
+def get_notifications_map():
+    """{reference doctype: {doctype event: [notification names]}} of enabled DocType Event notifications."""
+    notification_map = frappe.cache().get_value("whatsapp_notification_map")
+    if notification_map is None:
+        notification_map = {}
+        for notification in frappe.get_all(
+            "WhatsApp Notification",
+            filters={"disabled": 0, "notification_type": "DocType Event"},
+            fields=["name", "reference_doctype", "doctype_event"],
+        ):
+            notification_map.setdefault(notification.reference_doctype, {}).setdefault(
+                notification.doctype_event, []
+            ).append(notification.name)
+        frappe.cache().set_value("whatsapp_notification_map", notification_map)
+    return notification_map
+
+
+def trigger_whatsapp_notifications_all():
+    trigger_scheduled_notifications("All")
+
+
+def trigger_whatsapp_notifications_hourly():
+    trigger_scheduled_notifications("Hourly")
+
+
+def trigger_whatsapp_notifications_hourly_long():
+    trigger_scheduled_notifications("Hourly Long")
+
+
+def trigger_whatsapp_notifications_daily():
+    trigger_scheduled_notifications("Daily")
+
+
+def trigger_whatsapp_notifications_daily_long():
+    trigger_scheduled_notifications("Daily Long")
+
+
+def trigger_whatsapp_notifications_weekly():
+    trigger_scheduled_notifications("Weekly")
+
+
+def trigger_whatsapp_notifications_weekly_long():
+    trigger_scheduled_notifications("Weekly Long")
+
+
+def trigger_whatsapp_notifications_monthly():
+    trigger_scheduled_notifications("Monthly")
+
+
+def trigger_whatsapp_notifications_monthly_long():
+    trigger_scheduled_notifications("Monthly Long")
+
+
+def trigger_whatsapp_notifications_yearly():
+    trigger_scheduled_notifications("Yearly")
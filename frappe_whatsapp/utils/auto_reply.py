@@ -0,0 +1,224 @@
+"""Auto replies to incoming messages.
+
+All enabled WhatsApp Auto Reply rules are compiled into one matcher: a
+dict of exact messages, an Aho-Corasick automaton of the keywords and one
+combined regular expression. It is built once per process and rebuilt
+only when a rule changes, so matching a message is a single pass over its
+text. Replies are sent from a background job, never from the webhook.
+"""
+import re
+from collections import deque
+
+import frappe
+
+RULES_CACHE = "whatsapp_auto_reply_rules"
+# content types whose `message` is text the sender typed or tapped
+MATCHED_CONTENT_TYPES = ("text", "button", "list")
+# constructs that compile alone but break, or change meaning, once the
+# rule is one alternative of the combined expression
+JOINED_REGEX_ERRORS = (
+    (re.compile(r"\(\?[aiLmsux]+\)"), "inline flags apply to the whole expression, use (?i:...) instead"),
+    (re.compile(r"\(\?P[<=]"), "named groups are not supported"),
+    (re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]"), "numbered backreferences are not supported"),
+)
+
+_matcher = None
+
+
+def normalize_text(text):
+    return " ".join((text or "").casefold().split())
+
+
+def split_keywords(keywords):
+    return [keyword.strip() for keyword in (keywords or "").splitlines() if keyword.strip()]
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton: every keyword occurrence in one pass."""
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+    def add(self, keyword, value):
+        node = 0
+        for char in keyword:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append([])
+                self.goto[node][char] = next_node
+            node = next_node
+        self.output[node].append((len(keyword), value))
+
+    def build(self):
+        """Set the failure links, breadth first; call after the last add."""
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, next_node in self.goto[node].items():
+                queue.append(next_node)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_node] = fail if fail != next_node else 0
+                self.output[next_node] = self.output[next_node] + self.output[self.fail[next_node]]
+
+    def find(self, text):
+        """Yield (start, end, value) of every keyword in `text`."""
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for length, value in self.output[node]:
+                yield index - length + 1, index + 1, value
+
+
+class ReplyMatcher:
+    """First matching rule of a message, rules given in priority order.
+
+    Args:
+        rules: Dicts with `name`, `match_type` and `keywords`
+    """
+
+    def __init__(self, rules):
+        self.names = [rule["name"] for rule in rules]
+        self.exact = {}
+        self.keywords = KeywordAutomaton()
+        patterns = []
+        self.groups = {}
+
+        for index, rule in enumerate(rules):
+            for keyword in split_keywords(rule["keywords"]):
+                if rule["match_type"] == "Exact":
+                    self.exact.setdefault(normalize_text(keyword), index)
+                elif rule["match_type"] == "Keyword":
+                    self.keywords.add(normalize_text(keyword), index)
+                elif rule["match_type"] == "Regex":
+                    # `.*?` makes the alternatives match in rule order
+                    # rather than by position in the message
+                    group = f"_auto_reply_{len(patterns)}"
+                    self.groups[group] = index
+                    patterns.append(f"(?:.*?(?P<{group}>{keyword}))")
+
+        self.keywords.build()
+        self.regex = re.compile("|".join(patterns), re.IGNORECASE | re.DOTALL) if patterns else None
+
+    def match(self, text):
+        """Name of the matching rule with the highest priority, or None."""
+        normalized = normalize_text(text)
+        if not normalized:
+            return None
+
+        best = self.exact.get(normalized)
+        for start, end, index in self.keywords.find(normalized):
+            if best is not None and index >= best:
+                continue
+            # whole words only: "stop" matches "please stop" but not "nonstop"
+            if (start and normalized[start - 1].isalnum()) or (
+                end < len(normalized) and normalized[end].isalnum()
+            ):
+                continue
+            best = index
+
+        if self.regex:
+            match = self.regex.match(text)
+            if match:
+                index = self.groups[match.lastgroup]
+                if best is None or index < best:
+                    best = index
+
+        return None if best is None else self.names[best]
+
+
+def get_regex_error(pattern):
+    """Why `pattern` can not be a Regex keyword, or None if it can."""
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        return str(e)
+    for construct, error in JOINED_REGEX_ERRORS:
+        if construct.search(pattern):
+            return error
+    return None
+
+
+def get_rules():
+    """Enabled rules, highest priority first, cached until one changes."""
+    rules = frappe.cache().get_value(RULES_CACHE)
+    if rules is None:
+        rules = frappe.get_all(
+            "WhatsApp Auto Reply",
+            filters={"enabled": 1},
+            fields=["name", "match_type", "keywords", "modified"],
+            order_by="priority desc, name asc",
+        )
+        rules = [{**rule, "modified": str(rule.modified)} for rule in rules]
+        frappe.cache().set_value(RULES_CACHE, rules)
+    return rules
+
+
+def clear_rules_cache():
+    frappe.cache().delete_value(RULES_CACHE)
+
+
+def get_matcher():
+    """Compiled matcher of the current rules, rebuilt when they change."""
+    global _matcher
+    rules = get_rules()
+    version = tuple((rule["name"], rule["modified"]) for rule in rules)
+    if _matcher is None or _matcher[0] != version:
+        _matcher = (version, ReplyMatcher(rules))
+    return _matcher[1]
+
+
+def handle_incoming(doc):
+    """Queue the auto reply to an incoming message, if a rule matches."""
+    if doc.content_type not in MATCHED_CONTENT_TYPES:
+        return
+    try:
+        rule = get_matcher().match(doc.message)
+    except Exception:
+        # a broken rule must never block receiving the message
+        frappe.log_error(title="WhatsApp Auto Reply rules failed to match")
+        return
+    if not rule:
+        return
+
+    frappe.enqueue(
+        "frappe_whatsapp.utils.auto_reply.send_auto_reply",
+        enqueue_after_commit=True,
+        rule=rule,
+        message=doc.name,
+    )
+
+
+def send_auto_reply(rule, message):
+    rule = frappe.get_cached_doc("WhatsApp Auto Reply", rule)
+    incoming = frappe.get_doc("WhatsApp Message", message)
+
+    if rule.cooldown:
+        key = f"whatsapp_auto_reply|{rule.name}|{incoming.contact_number}"
+        if frappe.cache().get_value(key):
+            return
+        frappe.cache().set_value(key, 1, expires_in_sec=rule.cooldown * 60)
+
+    reply = {
+        "doctype": "WhatsApp Message",
+        "type": "Outgoing",
+        "to": incoming.get("from"),
+        "reference_doctype": incoming.reference_doctype,
+        "reference_name": incoming.reference_name,
+        "content_type": "text",
+    }
+    if rule.reply_type == "Template":
+        reply.update({"message_type": "Template", "template": rule.template})
+    else:
+        reply.update({"message": rule.reply})
+
+    frappe.get_doc(reply).insert(ignore_permissions=True)
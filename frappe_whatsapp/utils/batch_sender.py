@@ -0,0 +1,57 @@
+"""Concurrent sending of many message payloads.
+
+Only the HTTP requests run in threads; they share one keep-alive session
+and never touch frappe, so every database write stays in the calling
+thread.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import frappe
+import requests
+
+from frappe_whatsapp.utils.timings import now_ts
+
+MAX_WORKERS = 8
+
+
+def post_messages(payloads, settings=None, workers=MAX_WORKERS):
+    """POST message payloads to /{phone_id}/messages concurrently.
+
+    Args:
+        payloads: List of message payloads
+        settings: Optional WhatsApp Settings document
+        workers: Parallel requests
+
+    Returns:
+        list: One dict per payload, in order, with `response` (json) or
+            `error`, plus `started` and `finished` (monotonic) and `timings`
+    """
+    settings = settings or frappe.get_cached_doc("WhatsApp Settings")
+    url = f"{settings.url}/{settings.version}/{settings.phone_id}/messages"
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+    session.mount("https://", adapter)
+    session.headers.update({
+        "authorization": f"Bearer {settings.get_password('token')}",
+        "content-type": "application/json",
+    })
+
+    def post(payload):
+        result = {"started": time.monotonic(), "timings": {"api_request": now_ts()}}
+        try:
+            response = session.post(url, json=payload, timeout=30)
+            body = response.json()
+            if response.ok:
+                result["response"] = body
+                result["timings"]["api_accepted"] = now_ts()
+            else:
+                result["error"] = body.get("error") or {"message": response.text}
+        except Exception as e:
+            result["error"] = {"message": str(e)}
+        result["finished"] = time.monotonic()
+        return result
+
+    with session, ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(post, payloads))
@@ -0,0 +1,230 @@
+"""Incrementally maintained WhatsApp call rollups.
+
+Every finished call adds itself to one WhatsApp Call Rollup row per
+(hour, number, direction). Reports and APIs read only the rollups.
+"""
+import json
+
+import frappe
+from frappe.utils import cint, get_datetime
+
+from frappe_whatsapp.utils import normalize_number
+
+# upper bounds (seconds) of the duration histogram buckets; the last one is open
+DURATION_BUCKETS = (5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+GROUP_BY_FIELDS = {
+    "hour": "period_start",
+    "number": "number",
+    "direction": "direction",
+}
+
+
+def get_bucket(duration):
+    for index, upper in enumerate(DURATION_BUCKETS):
+        if duration <= upper:
+            return index
+    return len(DURATION_BUCKETS)
+
+
+def get_call_stats(call):
+    """Rollup key and increments contributed by one finished call."""
+    started = call.get("started_at") or call.get("ended_at") or call.get("creation")
+    period_start = get_datetime(started).replace(minute=0, second=0, microsecond=0)
+    number = call.get("from_number") if call.get("type") == "Incoming" else call.get("to_number")
+    answered = call.get("status") == "ended" and bool(call.get("started_at"))
+    duration = cint(call.get("duration")) if answered else 0
+
+    histogram = [0] * (len(DURATION_BUCKETS) + 1)
+    if answered:
+        histogram[get_bucket(duration)] = 1
+
+    key = (period_start, normalize_number(number) or "", call.get("type") or "Incoming")
+    return key, {
+        "call_count": 1,
+        "answered_count": 1 if answered else 0,
+        "missed_count": 1 if call.get("status") == "missed" else 0,
+        "failed_count": 1 if call.get("status") == "failed" else 0,
+        "total_duration": duration,
+        "histogram": histogram,
+    }
+
+
+def record_call(call):
+    """Add a finished call to its rollup row."""
+    key, stats = get_call_stats(call)
+    add_to_rollup(key, stats)
+
+
+def add_to_rollup(key, stats):
+    period_start, number, direction = key
+    name = f"{period_start:%Y%m%d%H}-{direction}-{number}"
+
+    row = frappe.db.get_value(
+        "WhatsApp Call Rollup", name, "duration_histogram", for_update=True
+    )
+    if row is None and not frappe.db.exists("WhatsApp Call Rollup", name):
+        try:
+            frappe.get_doc({
+                "doctype": "WhatsApp Call Rollup",
+                "name": name,
+                "period_start": period_start,
+                "number": number,
+                "direction": direction,
+                "call_count": stats["call_count"],
+                "answered_count": stats["answered_count"],
+                "missed_count": stats["missed_count"],
+                "failed_count": stats["failed_count"],
+                "total_duration": stats["total_duration"],
+                "duration_histogram": json.dumps(stats["histogram"]),
+            }).db_insert()
+            return
+        except frappe.DuplicateEntryError:
+            row = frappe.db.get_value(
+                "WhatsApp Call Rollup", name, "duration_histogram", for_update=True
+            )
+
+    histogram = merge_histograms(parse_histogram(row), stats["histogram"])
+    frappe.db.sql(
+        """UPDATE `tabWhatsApp Call Rollup`
+        SET call_count = call_count + %(call_count)s,
+            answered_count = answered_count + %(answered_count)s,
+            missed_count = missed_count + %(missed_count)s,
+            failed_count = failed_count + %(failed_count)s,
+            total_duration = total_duration + %(total_duration)s,
+            duration_histogram = %(histogram)s
+        WHERE name = %(name)s""",
+        {**stats, "histogram": json.dumps(histogram), "name": name},
+    )
+
+
+def parse_histogram(value):
+    histogram = json.loads(value) if isinstance(value, str) and value else (value or [])
+    return histogram + [0] * (len(DURATION_BUCKETS) + 1 - len(histogram))
+
+
+def merge_histograms(*histograms):
+    return [sum(counts) for counts in zip(*(parse_histogram(h) for h in histograms))]
+
+
+def get_percentile(histogram, percentile=95):
+    """Upper bound of the bucket holding the given percentile, None when empty."""
+    total = sum(histogram)
+    if not total:
+        return None
+
+    threshold = total * percentile / 100
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= threshold:
+            return DURATION_BUCKETS[index] if index < len(DURATION_BUCKETS) else None
+    return None
+
+
+@frappe.whitelist()
+def get_call_analytics(from_date=None, to_date=None, group_by="hour", number=None, direction=None):
+    """Call volume and duration stats from the rollups.
+
+    Args:
+        from_date: Optional start of the period
+        to_date: Optional end of the period
+        group_by: hour, number or direction
+        number: Optional filter by phone number
+        direction: Optional filter by Incoming / Outgoing
+
+    Returns:
+        list: One row per group with counts, answer/miss ratios and
+            total, average and p95 duration. p95 is the upper bound of
+            its histogram bucket, None for calls longer than an hour.
+    """
+    frappe.has_permission("WhatsApp Call Rollup", throw=True)
+    group_field = GROUP_BY_FIELDS.get(group_by)
+    if not group_field:
+        frappe.throw(f"Cannot group by {group_by}")
+
+    filters = {}
+    if from_date and to_date:
+        filters["period_start"] = ("between", [from_date, to_date])
+    elif from_date:
+        filters["period_start"] = (">=", from_date)
+    elif to_date:
+        filters["period_start"] = ("<=", to_date)
+    if number:
+        filters["number"] = normalize_number(number)
+    if direction:
+        filters["direction"] = direction
+
+    groups = {}
+    for row in frappe.get_all(
+        "WhatsApp Call Rollup",
+        filters=filters,
+        fields=[group_field, "call_count", "answered_count", "missed_count",
+                "failed_count", "total_duration", "duration_histogram"],
+    ):
+        group = groups.setdefault(row[group_field], {
+            group_by: row[group_field],
+            "call_count": 0,
+            "answered_count": 0,
+            "missed_count": 0,
+            "failed_count": 0,
+            "total_duration": 0,
+            "histogram": parse_histogram(None),
+        })
+        for field in ("call_count", "answered_count", "missed_count", "failed_count", "total_duration"):
+            group[field] += cint(row[field])
+        group["histogram"] = merge_histograms(group["histogram"], row.duration_histogram)
+
+    result = []
+    for key in sorted(groups, key=lambda k: (k is None, k)):
+        group = groups[key]
+        calls, answered = group["call_count"], group["answered_count"]
+        group["answered_ratio"] = answered / calls if calls else 0
+        group["missed_ratio"] = group["missed_count"] / calls if calls else 0
+        group["avg_duration"] = group["total_duration"] / answered if answered else 0
+        group["p95_duration"] = get_percentile(group.pop("histogram"))
+        result.append(group)
+    return result
+
+
+def backfill_call_rollups(chunk_size=1000):
+    """Rebuild all rollups from WhatsApp Call history, one chunk at a time.
+
+    Returns:
+        int: Number of calls processed
+    """
+    frappe.db.delete("WhatsApp Call Rollup")
+    frappe.db.commit()
+
+    last_name, processed = "", 0
+    while True:
+        calls = frappe.get_all(
+            "WhatsApp Call",
+            filters={"status": ["in", ["ended", "missed", "failed"]], "name": (">", last_name)},
+            fields=["name", "type", "from_number", "to_number", "status",
+                    "started_at", "ended_at", "duration", "creation"],
+            order_by="name asc",
+            limit_page_length=chunk_size,
+        )
+        if not calls:
+            break
+
+        # aggregate the chunk in memory so every rollup row is written once per chunk
+        chunk = {}
+        for call in calls:
+            key, stats = get_call_stats(call)
+            if key in chunk:
+                total = chunk[key]
+                for field in ("call_count", "answered_count", "missed_count", "failed_count", "total_duration"):
+                    total[field] += stats[field]
+                total["histogram"] = merge_histograms(total["histogram"], stats["histogram"])
+            else:
+                chunk[key] = stats
+
+        for key, stats in chunk.items():
+            add_to_rollup(key, stats)
+        frappe.db.commit()
+
+        processed += len(calls)
+        last_name = calls[-1].name
+
+    return processed
@@ -2,7 +2,27 @@
 import frappe
 import requests
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
+from frappe.utils import cint, convert_utc_to_system_timezone, get_datetime, now_datetime
+
+from frappe_whatsapp.utils.call_analytics import record_call
+
+ACTIVE_CALL_STATUSES = ("initiated", "ringing", "answered")
+FINAL_CALL_STATUSES = ("ended", "missed", "failed")
+
+# allowed status changes; anything else is a duplicate or out-of-order event
+CALL_TRANSITIONS = {
+    "initiated": {"ringing", "answered", "ended", "missed", "failed"},
+    "ringing": {"answered", "ended", "missed", "failed"},
+    "answered": {"ended", "failed"},
+    "ended": set(),
+    "missed": set(),
+    "failed": set(),
+}
+
+ACTIVE_CALLS_KEY = "whatsapp_active_calls"
+# calls that were never answered are considered missed after this many seconds without events
+CALL_IDLE_TIMEOUT = 120
 
 
 def initiate_voice_call(to_number, display_name=None):
@@ -94,14 +114,202 @@ def get_active_calls():
     Returns:
         list: List of active call records
     """
-    return frappe.get_all(
-        "WhatsApp Call",
-        filters={
-            "status": ["in", ["initiated", "ringing", "answered"]]
-        },
-        fields=["name", "type", "from_number", "to_number", "status", "started_at"]
+    return sorted(
+        get_call_registry().values(),
+        key=lambda call: str(call.get("last_event_at") or ""),
+        reverse=True,
+    )
+
+
+def can_transition(current_status, new_status):
+    """Whether a call may move from `current_status` to `new_status`."""
+    return new_status in CALL_TRANSITIONS.get(current_status, set())
+
+
+def get_call_registry():
+    """Active calls by call id, served from Redis.
+
+    The registry is rebuilt from the database (status index) when the
+    cache has been flushed.
+    """
+    cache = frappe.cache()
+    registry = cache.hgetall(ACTIVE_CALLS_KEY) or {}
+    if "__loaded__" not in registry:
+        registry = {"__loaded__": True}
+        for call in frappe.get_all(
+            "WhatsApp Call",
+            filters={"status": ["in", ACTIVE_CALL_STATUSES]},
+            fields=["name", "call_id", "type", "from_number", "to_number",
+                    "status", "started_at", "modified"],
+        ):
+            registry[call.call_id or call.name] = get_registry_entry(call, call.modified)
+        for key, entry in registry.items():
+            cache.hset(ACTIVE_CALLS_KEY, key, entry)
+
+    registry.pop("__loaded__", None)
+    return registry
+
+
+def get_registry_entry(call, last_event_at):
+    return {
+        "name": call.get("name"),
+        "call_id": call.get("call_id"),
+        "type": call.get("type"),
+        "from_number": call.get("from_number"),
+        "to_number": call.get("to_number"),
+        "status": call.get("status"),
+        "started_at": call.get("started_at"),
+        "last_event_at": last_event_at,
+    }
+
+
+def sync_call_registry(call, last_event_at=None):
+    """Add an active call to the registry or drop a finished one."""
+    key = call.get("call_id") or call.get("name")
+    if call.get("status") in ACTIVE_CALL_STATUSES:
+        frappe.cache().hset(
+            ACTIVE_CALLS_KEY, key, get_registry_entry(call, last_event_at or now_datetime())
+        )
+    else:
+        frappe.cache().hdel(ACTIVE_CALLS_KEY, key)
+
+
+def get_event_time(call_data):
+    """Time of a call event from the webhook `timestamp`, in system time."""
+    timestamp = call_data.get("timestamp")
+    if not timestamp:
+        return now_datetime()
+    return convert_utc_to_system_timezone(datetime.utcfromtimestamp(int(timestamp))).replace(tzinfo=None)
+
+
+def get_duration(started_at, ended_at):
+    if not started_at or not ended_at:
+        return 0
+    return max(int((get_datetime(ended_at) - get_datetime(started_at)).total_seconds()), 0)
+
+
+def apply_call_event(call_data, meta_data=None):
+    """Apply one call webhook event.
+
+    Known calls are looked up in the registry and updated with a single
+    UPDATE, without loading or saving the document. Duplicate and
+    out-of-order events are ignored.
+
+    Returns:
+        str: Name of the WhatsApp Call
+    """
+    call_id = call_data.get("id")
+    status = (call_data.get("status") or "").lower()
+    event_time = get_event_time(call_data)
+
+    call = get_call_registry().get(call_id) or frappe.db.get_value(
+        "WhatsApp Call", {"call_id": call_id},
+        ["name", "call_id", "type", "from_number", "to_number", "status", "started_at"],
+        as_dict=True,
     )
 
+    if not call:
+        call = frappe.get_doc({
+            "doctype": "WhatsApp Call",
+            "type": "Incoming",
+            "from_number": call_data.get("from"),
+            "to_number": call_data.get("to"),
+            "status": status,
+            "call_id": call_id,
+            "meta_data": meta_data,
+            "started_at": event_time if status == "answered" else None,
+            "ended_at": event_time if status in FINAL_CALL_STATUSES else None,
+        })
+        call.flags.last_event_at = event_time
+        call.insert(ignore_permissions=True)
+        return call.name
+
+    if not can_transition(call["status"], status):
+        return call["name"]
+
+    values = {"status": status}
+    if meta_data is not None:
+        values["meta_data"] = meta_data
+    if status == "answered":
+        values["started_at"] = event_time
+    elif status in FINAL_CALL_STATUSES:
+        values["ended_at"] = event_time
+        values["duration"] = get_duration(call.get("started_at"), event_time)
+
+    frappe.db.set_value("WhatsApp Call", call["name"], values)
+    call.update(values)
+    sync_call_registry(call, event_time)
+    if status in FINAL_CALL_STATUSES:
+        record_call(call)
+    return call["name"]
+
+
+def sweep_stale_calls():
+    """Close calls that exceeded max_call_duration or stopped receiving events.
+
+    Answered calls are ended at `started_at + max_call_duration`; calls
+    that were never answered are marked missed at their last event.
+    """
+    max_duration = cint(
+        frappe.db.get_single_value("WhatsApp Settings", "max_call_duration")
+    ) or 3600
+    now = now_datetime()
+    ended, missed = [], []
+
+    for key, call in get_call_registry().items():
+        if call["status"] == "answered":
+            started_at = get_datetime(call.get("started_at") or call["last_event_at"])
+            if now - started_at > timedelta(seconds=max_duration):
+                call.update(status="ended", started_at=started_at, duration=max_duration,
+                            ended_at=started_at + timedelta(seconds=max_duration))
+                ended.append((key, call))
+        elif now - get_datetime(call["last_event_at"]) > timedelta(seconds=CALL_IDLE_TIMEOUT):
+            call.update(status="missed", ended_at=now, duration=0)
+            missed.append((key, call))
+
+    # lock the rows first: a real end event may have closed the call since the
+    # registry was read, and such a call must not be counted by the rollups twice
+    ended = lock_calls(ended, ("answered",))
+    missed = lock_calls(missed, ("initiated", "ringing"))
+
+    if ended:
+        frappe.db.sql(
+            """UPDATE `tabWhatsApp Call`
+            SET status = 'ended',
+                ended_at = DATE_ADD(started_at, INTERVAL %(max_duration)s SECOND),
+                duration = %(max_duration)s
+            WHERE name IN %(names)s""",
+            {"max_duration": max_duration, "names": tuple(call["name"] for _, call in ended)},
+        )
+    if missed:
+        frappe.db.sql(
+            """UPDATE `tabWhatsApp Call`
+            SET status = 'missed', ended_at = %(now)s, duration = 0
+            WHERE name IN %(names)s""",
+            {"now": now, "names": tuple(call["name"] for _, call in missed)},
+        )
+
+    for _, call in ended + missed:
+        record_call(call)
+    frappe.db.commit()
+    # calls changed by a real event meanwhile are left to sync_call_registry
+    for key, _ in ended + missed:
+        frappe.cache().hdel(ACTIVE_CALLS_KEY, key)
+    return len(ended) + len(missed)
+
+
+def lock_calls(calls, statuses):
+    """The (key, call) pairs whose row still has one of `statuses`, locked until commit."""
+    if not calls:
+        return []
+    names = set(frappe.db.sql_list(
+        """SELECT name FROM `tabWhatsApp Call`
+        WHERE name IN %(names)s AND status IN %(statuses)s
+        FOR UPDATE""",
+        {"names": tuple(call["name"] for _, call in calls), "statuses": statuses},
+    ))
+    return [(key, call) for key, call in calls if call["name"] in names]
+
 
 @frappe.whitelist()
 def make_call(to_number):
@@ -0,0 +1,126 @@
+"""Conversation index over WhatsApp Message."""
+import frappe
+from frappe.utils import cint
+
+from frappe_whatsapp.utils import normalize_number
+from frappe_whatsapp.utils.retention import get_summary
+
+MESSAGE_FIELDS = [
+    "name", "type", "from", "to", "message", "status", "content_type",
+    "message_type", "attach", "message_id", "is_reply", "reply_to_message_id",
+    "profile_name", "creation",
+]
+
+
+def get_contact_number(doc):
+    """Normalized number of the other party of a message."""
+    return normalize_number(doc.get("from") if doc.type == "Incoming" else doc.get("to"))
+
+
+def update_conversation(doc):
+    """Maintain the WhatsApp Conversation row of a freshly inserted message.
+
+    Counters are incremented in SQL so that concurrent webhook workers do
+    not lose updates, and the last-message pointer only moves forward.
+    """
+    number = doc.contact_number
+    if not number:
+        return
+
+    values = {
+        "number": number,
+        "message": doc.name,
+        "at": doc.creation,
+        "direction": doc.type,
+        "preview": get_summary(doc.message),
+        "unread": 1 if doc.type == "Incoming" else 0,
+        "inbound_at": doc.creation if doc.type == "Incoming" else None,
+        "profile_name": doc.profile_name,
+    }
+
+    if not frappe.db.exists("WhatsApp Conversation", number):
+        try:
+            frappe.get_doc({
+                "doctype": "WhatsApp Conversation",
+                "number": number,
+                "profile_name": doc.profile_name,
+                "message_count": 1,
+                "unread_count": values["unread"],
+                "last_message": doc.name,
+                "last_message_at": doc.creation,
+                "last_message_type": doc.type,
+                "last_message_preview": values["preview"],
+                "last_inbound_at": values["inbound_at"],
+            }).insert(ignore_permissions=True)
+            return
+        except frappe.DuplicateEntryError:
+            # another worker created it first; fall through to the update
+            pass
+
+    # `last_message_at` is assigned last: later assignments see earlier ones
+    frappe.db.sql(
+        """UPDATE `tabWhatsApp Conversation`
+        SET message_count = message_count + 1,
+            unread_count = unread_count + %(unread)s,
+            profile_name = COALESCE(%(profile_name)s, profile_name),
+            last_inbound_at = CASE
+                WHEN %(inbound_at)s IS NOT NULL
+                    AND (last_inbound_at IS NULL OR last_inbound_at < %(inbound_at)s)
+                THEN %(inbound_at)s ELSE last_inbound_at END,
+            last_message = CASE
+                WHEN last_message_at IS NULL OR last_message_at <= %(at)s
+                THEN %(message)s ELSE last_message END,
+            last_message_type = CASE
+                WHEN last_message_at IS NULL OR last_message_at <= %(at)s
+                THEN %(direction)s ELSE last_message_type END,
+            last_message_preview = CASE
+                WHEN last_message_at IS NULL OR last_message_at <= %(at)s
+                THEN %(preview)s ELSE last_message_preview END,
+            last_message_at = CASE
+                WHEN last_message_at IS NULL OR last_message_at <= %(at)s
+                THEN %(at)s ELSE last_message_at END
+        WHERE name = %(number)s""",
+        values,
+    )
+
+
+@frappe.whitelist()
+def get_conversation(number, before=None, limit=50):
+    """A page of the chat with `number`, newest first.
+
+    Args:
+        number: Phone number of the contact, in any format
+        before: Cursor returned as `next_before` by the previous page
+        limit: Maximum number of messages to return
+
+    Returns:
+        dict: `messages` and `next_before`, which is None on the last page
+    """
+    number = normalize_number(number)
+    limit = min(cint(limit) or 50, 500)
+
+    filters = {"contact_number": number}
+    if before:
+        filters["creation"] = ("<", before)
+
+    messages = frappe.get_list(
+        "WhatsApp Message",
+        filters=filters,
+        fields=MESSAGE_FIELDS,
+        order_by="creation desc",
+        limit_page_length=limit,
+    )
+
+    return {
+        "number": number,
+        "messages": messages,
+        "next_before": str(messages[-1].creation) if len(messages) == limit else None,
+    }
+
+
+@frappe.whitelist()
+def mark_as_read(number):
+    """Reset the unread counter of a conversation."""
+    number = normalize_number(number)
+    frappe.get_doc("WhatsApp Conversation", number).check_permission("write")
+    frappe.db.set_value("WhatsApp Conversation", number, "unread_count", 0)
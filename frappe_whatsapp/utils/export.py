@@ -0,0 +1,179 @@
+"""Export of per-recipient message results.
+
+The list view export and reports load every row before writing the file.
+Here a background job reads the messages through an unbuffered
+(server-side) cursor and writes each row to the file as it arrives, CSV
+directly and XLSX through a write-only openpyxl workbook, so memory stays
+flat whatever the size of the campaign. Progress and the download link
+are sent to the user over realtime.
+"""
+import csv
+import os
+from datetime import datetime
+
+import frappe
+from frappe import _
+from frappe.utils import now_datetime
+
+from frappe_whatsapp.utils.timings import parse_timings
+
+COLUMNS = ["Number", "Status", "Message ID", "Template", "Created", "Sent", "Delivered", "Read", "Failed", "Error"]
+FIELDS = ["to", "status", "message_id", "template", "creation", "timings", "error_message"]
+TIMING_COLUMNS = ("sent", "delivered", "read", "failed")
+# progress is published every this many rows
+PROGRESS_INTERVAL = 5000
+
+
+def get_conditions(bulk_message=None, notification=None, from_date=None, to_date=None):
+    conditions = []
+    if bulk_message:
+        conditions.append("bulk_message_reference = %(bulk_message)s")
+    if notification:
+        conditions.append("notification = %(notification)s")
+    if from_date:
+        conditions.append("creation >= %(from_date)s")
+    if to_date:
+        conditions.append("creation <= %(to_date)s")
+    if not (bulk_message or notification):
+        conditions.append("type = 'Outgoing'")
+    return " AND ".join(conditions)
+
+
+@frappe.whitelist()
+def start_export(bulk_message=None, notification=None, from_date=None, to_date=None, file_format="CSV"):
+    """Queue an export of message results.
+
+    Args:
+        bulk_message: Bulk WhatsApp Message whose messages to export
+        notification: WhatsApp Notification whose messages to export
+        from_date: Messages created from this date
+        to_date: Messages created up to this date
+        file_format: CSV or Excel
+
+    Returns:
+        str: Export id, sent back with the realtime progress events
+    """
+    if bulk_message:
+        frappe.get_doc("Bulk WhatsApp Message", bulk_message).check_permission("read")
+    frappe.has_permission("WhatsApp Message", "export", throw=True)
+    if file_format not in ("CSV", "Excel"):
+        frappe.throw(_("File format must be CSV or Excel"))
+
+    export_id = frappe.generate_hash(length=10)
+    frappe.enqueue(
+        "frappe_whatsapp.utils.export.export_messages",
+        queue="long",
+        timeout=4 * 60 * 60,
+        export_id=export_id,
+        user=frappe.session.user,
+        filters={
+            "bulk_message": bulk_message,
+            "notification": notification,
+            "from_date": from_date,
+            "to_date": to_date,
+        },
+        file_format=file_format,
+    )
+    return export_id
+
+
+def get_rows(filters):
+    """Yield export rows, streamed from an unbuffered cursor."""
+    fields = ", ".join(f"`{field}`" for field in FIELDS)
+    with frappe.db.unbuffered_cursor():
+        for row in frappe.db.sql(
+            f"""SELECT {fields} FROM `tabWhatsApp Message`
+            WHERE {get_conditions(**filters)}
+            ORDER BY creation""",
+            filters,
+            as_iterator=True,
+        ):
+            timings = parse_timings(row[5])
+            yield [
+                row[0], row[1], row[2], row[3], row[4],
+                *(format_timestamp(timings.get(stage)) for stage in TIMING_COLUMNS),
+                row[6],
+            ]
+
+
+def format_timestamp(ts):
+    return datetime.fromtimestamp(ts) if ts else None
+
+
+def export_messages(export_id, user, filters, file_format="CSV"):
+    total = frappe.db.sql(
+        f"SELECT COUNT(*) FROM `tabWhatsApp Message` WHERE {get_conditions(**filters)}", filters
+    )[0][0]
+    extension = "csv" if file_format == "CSV" else "xlsx"
+    name = filters.get("bulk_message") or filters.get("notification") or "messages"
+    file_name = f"{frappe.scrub(name)}-{now_datetime():%Y%m%d%H%M%S}.{extension}"
+    path = frappe.get_site_path("private", "files", file_name)
+
+    def progress(rows):
+        frappe.publish_realtime(
+            "whatsapp_export_progress",
+            {"export_id": export_id, "rows": rows, "total": total},
+            user=user,
+        )
+
+    try:
+        if file_format == "CSV":
+            rows = write_csv(path, get_rows(filters), progress)
+        else:
+            rows = write_xlsx(path, get_rows(filters), progress)
+
+        file = frappe.get_doc({
+            "doctype": "File",
+            "file_name": file_name,
+            "file_url": f"/private/files/{file_name}",
+            "is_private": 1,
+            "attached_to_doctype": "Bulk WhatsApp Message" if filters.get("bulk_message") else None,
+            "attached_to_name": filters.get("bulk_message"),
+        })
+        file.flags.ignore_permissions = True
+        file.insert()
+        frappe.db.commit()
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        frappe.log_error(title="WhatsApp message export failed")
+        frappe.publish_realtime(
+            "whatsapp_export_progress", {"export_id": export_id, "error": 1}, user=user
+        )
+        raise
+
+    frappe.publish_realtime(
+        "whatsapp_export_progress",
+        {"export_id": export_id, "rows": rows, "total": total, "file_url": file.file_url},
+        user=user,
+    )
+
+
+def write_csv(path, rows, progress):
+    count = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow([_(label) for label in COLUMNS])
+        for row in rows:
+            writer.writerow(["" if value is None else value for value in row])
+            count += 1
+            if not count % PROGRESS_INTERVAL:
+                progress(count)
+    return count
+
+
+def write_xlsx(path, rows, progress):
+    from openpyxl import Workbook
+
+    # write-only workbooks keep only the current row in memory
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(_("Messages"))
+    sheet.append([_(label) for label in COLUMNS])
+    count = 0
+    for row in rows:
+        sheet.append(row)
+        count += 1
+        if not count % PROGRESS_INTERVAL:
+            progress(count)
+    workbook.save(path)
+    return count
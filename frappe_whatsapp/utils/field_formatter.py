@@ -0,0 +1,108 @@
+"""Bulk formatting of document fields for template parameters.
+
+`Document.get_formatted` needs a full document per record. Here the
+fields a notification needs are read for many documents in one query and
+formatted from cached meta, including the currency field a Currency
+depends on and link titles where the target shows them.
+"""
+import frappe
+from frappe.model import default_fields
+
+CHUNK_SIZE = 1000
+
+
+def get_currency_fields(meta, df):
+    """Fields a Currency field reads its currency from, e.g. "currency" or "company"."""
+    if df.fieldtype != "Currency" or not df.options:
+        return []
+    return [part for part in df.options.split(":") if meta.has_field(part)]
+
+
+def get_link_titles(doctype, names):
+    """{name: title} for a Link target that shows titles in links."""
+    meta = frappe.get_meta(doctype)
+    if not names or not meta.show_title_field_in_link or not meta.title_field:
+        return {}
+    return {
+        row.name: row.get(meta.title_field)
+        for row in frappe.get_all(
+            doctype, filters={"name": ("in", list(names))}, fields=["name", meta.title_field]
+        )
+    }
+
+
+def get_formatted_rows(doctype, names, fieldnames, raw_fields=()):
+    """Formatted values of `fieldnames` for many documents.
+
+    Args:
+        doctype: Doctype of the documents
+        names: Document names
+        fieldnames: Fields to format
+        raw_fields: Fields to return unformatted, e.g. a phone number
+
+    Returns:
+        dict: {name: {"formatted": {fieldname: str}, "raw": {fieldname: value}}}
+    """
+    meta = frappe.get_meta(doctype)
+    fieldnames = [f for f in dict.fromkeys(fieldnames) if meta.has_field(f) or f in default_fields]
+    raw_fields = [f for f in dict.fromkeys(raw_fields) if meta.has_field(f) or f in default_fields]
+
+    query_fields = {"name", *fieldnames, *raw_fields}
+    for fieldname in fieldnames:
+        df = meta.get_field(fieldname)
+        if df:
+            query_fields.update(get_currency_fields(meta, df))
+
+    rows = []
+    names = list(names)
+    for start in range(0, len(names), CHUNK_SIZE):
+        rows += frappe.get_all(
+            doctype,
+            filters={"name": ("in", names[start:start + CHUNK_SIZE])},
+            fields=list(query_fields),
+        )
+
+    # one query per link target instead of one per value
+    link_titles = {}
+    for fieldname in fieldnames:
+        df = meta.get_field(fieldname)
+        if df and df.fieldtype == "Link" and df.options:
+            link_titles[fieldname] = get_link_titles(
+                df.options, {row.get(fieldname) for row in rows if row.get(fieldname)}
+            )
+
+    result = {}
+    for row in rows:
+        formatted = {}
+        for fieldname in fieldnames:
+            value = row.get(fieldname)
+            if link_titles.get(fieldname) and value in link_titles[fieldname]:
+                value = link_titles[fieldname][value] or value
+            df = meta.get_field(fieldname)
+            formatted[fieldname] = frappe.format_value(value, df, doc=row) if df else str(value or "")
+        result[row.name] = {
+            "formatted": formatted,
+            "raw": {fieldname: row.get(fieldname) for fieldname in raw_fields},
+        }
+    return result
+
+
+def get_template_parameters(notification, names):
+    """Body parameters and phone number of a notification for many documents.
+
+    Returns:
+        dict: {name: {"parameters": [...], "phone_no": value of field_name}}
+    """
+    fieldnames = [field.field_name for field in notification.fields]
+    raw_fields = [notification.field_name] if notification.field_name else []
+    rows = get_formatted_rows(notification.reference_doctype, names, fieldnames, raw_fields)
+
+    return {
+        name: {
+            "parameters": [
+                {"type": "text", "text": values["formatted"].get(fieldname)} for fieldname in fieldnames
+            ],
+            "phone_no": values["raw"].get(notification.field_name) if notification.field_name else None,
+        }
+        for name, values in rows.items()
+    }
@@ -0,0 +1,130 @@
+"""WhatsApp Flow responses.
+
+Flow submissions arrive as a JSON string in an interactive nfm_reply
+message. On ingest every answer is also written as an indexed
+(field_name, value) row of WhatsApp Flow Response, so reports count
+answers with a GROUP BY instead of parsing message text.
+"""
+import json
+
+import frappe
+from frappe.utils import get_datetime, now_datetime
+
+from frappe_whatsapp.utils import normalize_number
+
+# length of the indexed Data column
+VALUE_LENGTH = 140
+
+
+def get_values(response, prefix=""):
+    """(field_name, value) pairs of a flow response.
+
+    Nested objects become dotted field names and every item of a list
+    (e.g. a multi-select) its own pair. `flow_token` is stored separately.
+    """
+    values = []
+    for key, value in response.items():
+        if not prefix and key == "flow_token":
+            continue
+        field_name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values += get_values(value, f"{field_name}.")
+        elif isinstance(value, list):
+            values += [(field_name, str(item)[:VALUE_LENGTH]) for item in value]
+        elif value is not None:
+            values.append((field_name, str(value)[:VALUE_LENGTH]))
+    return values
+
+
+def save_flow_responses(docs):
+    """Write the flow responses of incoming WhatsApp Messages in bulk."""
+    now = now_datetime()
+    responses = []
+    values = []
+
+    for doc in docs:
+        try:
+            response = json.loads(doc.message or "{}")
+        except ValueError:
+            continue
+        if not isinstance(response, dict):
+            continue
+        payload = json.loads(doc.payload) if doc.payload else {}
+
+        name = frappe.generate_hash(length=10)
+        responses.append((
+            name, now, now, frappe.session.user, frappe.session.user,
+            response.get("flow_token"), payload.get("name"), normalize_number(doc.get("from")),
+            doc.name, get_datetime(doc.creation), doc.message,
+        ))
+        values += [
+            (frappe.generate_hash(length=10), now, now, frappe.session.user, frappe.session.user,
+             name, "WhatsApp Flow Response", "values", idx, field_name, value)
+            for idx, (field_name, value) in enumerate(get_values(response), 1)
+        ]
+
+    if responses:
+        frappe.db.bulk_insert(
+            "WhatsApp Flow Response",
+            fields=["name", "creation", "modified", "owner", "modified_by",
+                    "flow_token", "flow_name", "contact_number", "message", "submitted_at", "response"],
+            values=responses,
+        )
+    if values:
+        frappe.db.bulk_insert(
+            "WhatsApp Flow Response Value",
+            fields=["name", "creation", "modified", "owner", "modified_by",
+                    "parent", "parenttype", "parentfield", "idx", "field_name", "value"],
+            values=values,
+        )
+
+
+@frappe.whitelist()
+def get_flow_summary(flow_token=None, flow_name=None, from_date=None, to_date=None, field_name=None):
+    """Answer counts of a flow.
+
+    Args:
+        flow_token: Flow token the flow was sent with
+        flow_name: Name of the flow
+        from_date: Start of the submission period
+        to_date: End of the submission period
+        field_name: Only count this field
+
+    Returns:
+        dict: `responses` (count) and `fields`: {field_name: [{"value", "count"}]}
+    """
+    frappe.has_permission("WhatsApp Flow Response", "report", throw=True)
+
+    conditions = []
+    if flow_token:
+        conditions.append("response.flow_token = %(flow_token)s")
+    if flow_name:
+        conditions.append("response.flow_name = %(flow_name)s")
+    if from_date:
+        conditions.append("response.submitted_at >= %(from_date)s")
+    if to_date:
+        conditions.append("response.submitted_at <= %(to_date)s")
+    where = " AND ".join(conditions) or "1=1"
+    values = {
+        "flow_token": flow_token, "flow_name": flow_name,
+        "from_date": from_date, "to_date": to_date, "field_name": field_name,
+    }
+
+    responses = frappe.db.sql(
+        f"SELECT COUNT(*) FROM `tabWhatsApp Flow Response` response WHERE {where}", values
+    )[0][0]
+    rows = frappe.db.sql(
+        f"""SELECT answer.field_name, answer.value, COUNT(*) AS count
+        FROM `tabWhatsApp Flow Response Value` answer
+        JOIN `tabWhatsApp Flow Response` response ON response.name = answer.parent
+        WHERE {where} {"AND answer.field_name = %(field_name)s" if field_name else ""}
+        GROUP BY answer.field_name, answer.value
+        ORDER BY answer.field_name, count DESC""",
+        values,
+        as_dict=True,
+    )
+
+    fields = {}
+    for row in rows:
+        fields.setdefault(row.field_name, []).append({"value": row.value, "count": row.count})
+    return {"responses": responses, "fields": fields}
@@ -0,0 +1,293 @@
+"""Drip journeys.
+
+A WhatsApp Journey sends a sequence of Journey Step notifications, each
+some days or hours after the previous one, to documents enrolled on a doc
+event or to contacts enrolled from a recipient list. Every enrollment
+keeps the due time of its next step in an indexed column, so the
+scheduler tick reads only the enrollments that are due, instead of every
+step scanning its doctype each day like "Days After" notifications do.
+Contacts that write to us leave the journeys set to Exit on Reply.
+"""
+import frappe
+from frappe import _
+from frappe.utils import add_to_date, now_datetime
+from frappe.utils.safe_exec import get_safe_globals
+
+from frappe_whatsapp.utils import normalize_number
+
+JOURNEYS_KEY = "whatsapp_journeys"
+BATCH_SIZE = 500
+# enrollments processed per tick; the rest are picked up by the next one
+MAX_PER_TICK = 20000
+CHUNK_SIZE = 1000
+
+# WhatsApp Journey Enrollment.status
+ACTIVE = "Active"
+COMPLETED = "Completed"
+EXITED = "Exited"
+
+
+def get_journeys():
+    """Enabled journeys, cached until one changes.
+
+    Returns:
+        dict: `enabled` names, `events` as {doctype: {enroll on: [names]}}
+            and `exit_on_reply` names
+    """
+    journeys = frappe.cache().get_value(JOURNEYS_KEY)
+    if journeys is None:
+        journeys = {"enabled": [], "events": {}, "exit_on_reply": []}
+        for journey in frappe.get_all(
+            "WhatsApp Journey",
+            filters={"enabled": 1},
+            fields=["name", "reference_doctype", "enroll_on", "exit_on_reply"],
+        ):
+            journeys["enabled"].append(journey.name)
+            if journey.reference_doctype and journey.enroll_on:
+                journeys["events"].setdefault(journey.reference_doctype, {}).setdefault(
+                    journey.enroll_on, []
+                ).append(journey.name)
+            if journey.exit_on_reply:
+                journeys["exit_on_reply"].append(journey.name)
+        frappe.cache().set_value(JOURNEYS_KEY, journeys)
+    return journeys
+
+
+def clear_journeys_cache():
+    frappe.cache().delete_value(JOURNEYS_KEY)
+
+
+def get_step_time(step, after=None):
+    return add_to_date(
+        after or now_datetime(), days=step.delay_days or 0, hours=step.delay_hours or 0, as_datetime=True
+    )
+
+
+def get_enrollment(journey, contact_number, next_step_at):
+    return {
+        "journey": journey,
+        "status": ACTIVE,
+        "contact_number": contact_number,
+        "next_step": 1,
+        "next_step_at": next_step_at,
+    }
+
+
+def enroll(journey, contact_number, reference_doctype=None, reference_name=None):
+    """Start a journey for a document and its contact, or for a contact alone.
+
+    A document or contact already active in the journey is not enrolled again.
+
+    Args:
+        journey: WhatsApp Journey document
+        contact_number: Number the steps are sent to
+        reference_doctype: DocType of the enrolled document
+        reference_name: Name of the enrolled document
+
+    Returns:
+        str: Name of the new WhatsApp Journey Enrollment, or None
+    """
+    contact_number = normalize_number(contact_number)
+    if not contact_number or not journey.steps:
+        return None
+
+    filters = {"journey": journey.name, "status": ACTIVE}
+    if reference_name:
+        filters.update({"reference_doctype": reference_doctype, "reference_name": reference_name})
+    else:
+        filters.update({"contact_number": contact_number, "reference_name": ("is", "not set")})
+    if frappe.db.exists("WhatsApp Journey Enrollment", filters):
+        return None
+
+    enrollment = frappe.get_doc({
+        **get_enrollment(journey.name, contact_number, get_step_time(journey.steps[0])),
+        "doctype": "WhatsApp Journey Enrollment",
+        "reference_doctype": reference_doctype,
+        "reference_name": reference_name,
+    })
+    enrollment.insert(ignore_permissions=True)
+    return enrollment.name
+
+
+def enroll_for_doc_event(doc, event):
+    """Enroll `doc` in the journeys that start on `event`, e.g. After Insert."""
+    for name in get_journeys()["events"].get(doc.doctype, {}).get(event) or []:
+        journey = frappe.get_cached_doc("WhatsApp Journey", name)
+        if journey.condition and not frappe.safe_eval(
+            journey.condition, get_safe_globals(), dict(doc=doc.as_dict())
+        ):
+            continue
+        enroll(journey, doc.get(journey.phone_field), doc.doctype, doc.name)
+
+
+@frappe.whitelist()
+def enroll_contacts(journey, contact_numbers=None, recipient_list=None):
+    """Enroll many contacts in a journey of contacts.
+
+    Args:
+        journey: WhatsApp Journey name
+        contact_numbers: List (or JSON list) of phone numbers
+        recipient_list: WhatsApp Recipient List whose recipients to enroll
+
+    Returns:
+        int: Number of contacts enrolled
+    """
+    frappe.has_permission("WhatsApp Journey Enrollment", "create", throw=True)
+    journey = frappe.get_doc("WhatsApp Journey", journey)
+    if journey.reference_doctype:
+        frappe.throw(_("Journey {0} enrolls {1} documents, not contacts").format(
+            journey.name, journey.reference_doctype
+        ))
+
+    numbers = frappe.parse_json(contact_numbers) if isinstance(contact_numbers, str) else contact_numbers or []
+    if recipient_list:
+        numbers += frappe.get_all(
+            "WhatsApp Recipient", filters={"parent": recipient_list}, pluck="mobile_number"
+        )
+    numbers = list(dict.fromkeys(filter(None, map(normalize_number, numbers))))
+
+    active = set()
+    for start in range(0, len(numbers), CHUNK_SIZE):
+        active.update(frappe.get_all(
+            "WhatsApp Journey Enrollment",
+            filters={
+                "journey": journey.name,
+                "status": ACTIVE,
+                "contact_number": ("in", numbers[start:start + CHUNK_SIZE]),
+                "reference_name": ("is", "not set"),
+            },
+            pluck="contact_number",
+        ))
+
+    now = now_datetime()
+    next_step_at = get_step_time(journey.steps[0])
+    enrollments = [
+        {
+            "name": frappe.generate_hash(length=10),
+            "creation": now,
+            "modified": now,
+            "owner": frappe.session.user,
+            "modified_by": frappe.session.user,
+            **get_enrollment(journey.name, number, next_step_at),
+        }
+        for number in numbers
+        if number not in active
+    ]
+    for start in range(0, len(enrollments), CHUNK_SIZE):
+        frappe.db.bulk_insert(
+            "WhatsApp Journey Enrollment",
+            fields=list(enrollments[0]),
+            values=[list(row.values()) for row in enrollments[start:start + CHUNK_SIZE]],
+        )
+    return len(enrollments)
+
+
+def exit_on_reply(contact_number):
+    """End the active enrollments of a contact that wrote to us."""
+    journeys = get_journeys()["exit_on_reply"]
+    if not journeys or not contact_number:
+        return
+    set_enrollments(
+        {"contact_number": contact_number, "status": ACTIVE, "journey": ("in", journeys)},
+        {"status": EXITED, "exit_reason": "Replied", "next_step_at": None},
+    )
+
+
+def set_enrollments(filters, values):
+    frappe.db.set_value("WhatsApp Journey Enrollment", filters, values)
+
+
+def process_due_enrollments():
+    """Scheduler job: send the next step of every due enrollment."""
+    enabled = get_journeys()["enabled"]
+    processed = 0
+    while enabled and processed < MAX_PER_TICK:
+        enrollments = frappe.get_all(
+            "WhatsApp Journey Enrollment",
+            filters={"status": ACTIVE, "next_step_at": ("<=", now_datetime()), "journey": ("in", enabled)},
+            fields=["name", "journey", "next_step", "contact_number", "reference_doctype", "reference_name"],
+            order_by="next_step_at asc",
+            limit=BATCH_SIZE,
+        )
+
+        steps = {}
+        for enrollment in enrollments:
+            steps.setdefault((enrollment.journey, enrollment.next_step), []).append(enrollment)
+        for (journey, step), group in steps.items():
+            try:
+                send_step(frappe.get_cached_doc("WhatsApp Journey", journey), step, group)
+            except Exception:
+                frappe.db.rollback()
+                frappe.log_error(title=f"WhatsApp Journey {journey} step {step} failed")
+                # skip the journey until the next tick rather than fetching it again
+                enabled = [name for name in enabled if name != journey]
+
+        processed += len(enrollments)
+        if len(enrollments) < BATCH_SIZE:
+            break
+
+
+def send_step(journey, step, enrollments):
+    """Send step number `step` of a journey to enrollments that are due for it."""
+    if journey.exit_condition:
+        enrollments = check_exit_condition(journey, enrollments)
+
+    # moved on before sending: a failed send skips the step rather than repeating it
+    advance(journey, step, [enrollment.name for enrollment in enrollments])
+    frappe.db.commit()
+    if step > len(journey.steps) or not enrollments:
+        return
+
+    notification = frappe.get_doc("WhatsApp Notification", journey.steps[step - 1].notification)
+    template = frappe.db.get_value("WhatsApp Templates", notification.template, fieldname="*")
+    if not template:
+        return
+
+    if journey.reference_doctype:
+        data_list = [{"name": e.reference_name, "phone_no": e.contact_number} for e in enrollments]
+        if not notification.condition and notification.can_send_in_bulk(template):
+            notification.send_bulk_template(template, data_list)
+        else:
+            for data in data_list:
+                if frappe.db.exists(journey.reference_doctype, data["name"]):
+                    doc = frappe.get_doc(journey.reference_doctype, data["name"])
+                    notification.send_template_message(doc, data["phone_no"], template)
+    else:
+        notification._contact_list = [enrollment.contact_number for enrollment in enrollments]
+        notification.send_simple_template(template)
+    frappe.db.commit()
+
+
+def check_exit_condition(journey, enrollments):
+    """Exit the enrollments whose document meets the exit condition, or is gone.
+
+    Returns:
+        list: The enrollments that stay in the journey
+    """
+    staying = []
+    exits = {}
+    for enrollment in enrollments:
+        if not frappe.db.exists(enrollment.reference_doctype, enrollment.reference_name):
+            exits.setdefault("Document deleted", []).append(enrollment.name)
+            continue
+        doc = frappe.get_doc(enrollment.reference_doctype, enrollment.reference_name)
+        if frappe.safe_eval(journey.exit_condition, get_safe_globals(), dict(doc=doc.as_dict())):
+            exits.setdefault("Exit condition met", []).append(enrollment.name)
+        else:
+            staying.append(enrollment)
+
+    for reason, names in exits.items():
+        set_enrollments(
+            {"name": ("in", names)}, {"status": EXITED, "exit_reason": reason, "next_step_at": None}
+        )
+    return staying
+
+
+def advance(journey, step, names):
+    if not names:
+        return
+    if step >= len(journey.steps):
+        values = {"status": COMPLETED, "next_step_at": None}
+    else:
+        values = {"next_step": step + 1, "next_step_at": get_step_time(journey.steps[step])}
+    set_enrollments({"name": ("in", names)}, values)
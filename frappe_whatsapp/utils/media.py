@@ -0,0 +1,237 @@
+"""Media uploads to the WhatsApp Cloud API."""
+import hashlib
+import mimetypes
+import os
+import time
+
+import frappe
+import requests
+
+CHUNK_SIZE = 1024 * 1024
+UPLOAD_RETRIES = 3
+# seconds to connect, and between two reads, of a request to meta
+UPLOAD_TIMEOUT = 30
+HEADER_HANDLE_CACHE = "whatsapp_header_handles"
+
+_file_hashes = {}
+
+
+def get_file_path(file_url):
+    """Absolute path of a /files or /private/files url of the current site."""
+    file_url = file_url.split("?")[0]
+    if file_url.startswith("/private/"):
+        return frappe.get_site_path(file_url.lstrip("/"))
+    if file_url.startswith("/files/"):
+        return frappe.get_site_path("public", file_url.lstrip("/"))
+    frappe.throw(f"{file_url} is not a file of this site")
+
+
+def get_file_hash(file_path):
+    """sha256 of a file, read in chunks and memoized per process until the file changes."""
+    stat = os.stat(file_path)
+    memo_key = (file_path, stat.st_mtime_ns, stat.st_size)
+    if memo_key in _file_hashes:
+        return _file_hashes[memo_key]
+
+    sha = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+
+    if len(_file_hashes) > 1024:
+        _file_hashes.clear()
+    _file_hashes[memo_key] = sha.hexdigest()
+    return _file_hashes[memo_key]
+
+
+def get_mime_type(file_path):
+    """Guess the mime type from the extension, sniffing the content only as a fallback."""
+    mime_type, _ = mimetypes.guess_type(file_path)
+    if mime_type:
+        return mime_type
+
+    import magic
+
+    return magic.Magic(mime=True).from_file(file_path)
+
+
+def get_header_handle(file_url, settings=None):
+    """Header handle for a template sample, uploading it only if its content is new.
+
+    Args:
+        file_url: /files or /private/files url of the sample
+        settings: Optional WhatsApp Settings document
+
+    Returns:
+        tuple: (header handle, sha256 of the file)
+    """
+    file_path = get_file_path(file_url)
+    file_hash = get_file_hash(file_path)
+
+    handle = frappe.cache().hget(HEADER_HANDLE_CACHE, file_hash)
+    if not handle:
+        handle = upload_resumable(file_path, settings)
+        frappe.cache().hset(HEADER_HANDLE_CACHE, file_hash, handle)
+
+    return handle, file_hash
+
+
+def is_retryable(error):
+    """Whether a failed request may succeed when sent again, i.e. it is not a 4xx."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    response = getattr(error, "response", None)
+    return response is not None and response.status_code >= 500
+
+
+def upload_resumable(file_path, settings=None):
+    """Upload a file with the resumable upload protocol.
+
+    The file is streamed from disk. When a request fails, the offset that
+    meta received is queried and the upload continues from there. Client
+    errors (4xx) are raised without retrying.
+
+    Returns:
+        str: Header handle (`h`) of the uploaded file
+    """
+    settings = settings or frappe.get_doc("WhatsApp Settings", "WhatsApp Settings")
+    token = settings.get_password("token")
+    base_url = f"{settings.url}/{settings.version}"
+    file_length = os.path.getsize(file_path)
+
+    response = requests.post(
+        f"{base_url}/{settings.app_id}/uploads",
+        params={
+            "file_name": os.path.basename(file_path),
+            "file_length": file_length,
+            "file_type": get_mime_type(file_path),
+        },
+        headers={"authorization": f"Bearer {token}"},
+        timeout=UPLOAD_TIMEOUT,
+    )
+    response.raise_for_status()
+    session_id = response.json()["id"]
+    headers = {"authorization": f"OAuth {token}"}
+
+    offset = 0
+    for attempt in range(UPLOAD_RETRIES + 1):
+        try:
+            with open(file_path, "rb") as f:
+                f.seek(offset)
+                response = requests.post(
+                    f"{base_url}/{session_id}",
+                    headers={**headers, "file_offset": str(offset)},
+                    data=f,
+                    timeout=UPLOAD_TIMEOUT,
+                )
+            response.raise_for_status()
+            return response.json()["h"]
+        except requests.RequestException as e:
+            if attempt == UPLOAD_RETRIES or not is_retryable(e):
+                raise
+            time.sleep(2 ** attempt)
+            status = requests.get(f"{base_url}/{session_id}", headers=headers, timeout=UPLOAD_TIMEOUT)
+            status.raise_for_status()
+            offset = int(status.json().get("file_offset") or 0)
+
+
+# meta keeps uploaded media for 30 days; stop reusing an id a day earlier
+MEDIA_ID_TTL = 29 * 24 * 60 * 60
+MEDIA_LOCK_TIMEOUT = 60
+# a failed upload is not retried for every recipient of a campaign
+MEDIA_FAILURE_TTL = 5 * 60
+# deletes the upload lock only while it still holds this worker's token,
+# not the lock another worker took after this one's expired
+RELEASE_MEDIA_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def get_media_object(file_url, settings=None, share_doc=None):
+    """Media object for a send payload: `{"id": ...}` when possible, else `{"link": ...}`.
+
+    Files of this site are uploaded once to /{phone_id}/media and the
+    returned id is reused for every recipient until it expires. External
+    links and failed uploads fall back to sending the link.
+
+    Args:
+        file_url: Site file url or external link
+        settings: Optional WhatsApp Settings document
+        share_doc: Document whose share key makes a private file link
+            readable by Meta
+    """
+    settings = settings or frappe.get_cached_doc("WhatsApp Settings")
+    site_url = frappe.utils.get_url()
+    if file_url.startswith(site_url):
+        file_url = file_url[len(site_url):]
+
+    if settings.upload_outbound_media and file_url.startswith(("/files/", "/private/files/")):
+        media_id = get_media_id(file_url, settings)
+        if media_id:
+            return {"id": media_id}
+
+    if file_url.startswith("http"):
+        return {"link": file_url}
+    link = f"{site_url}{file_url}"
+    if share_doc and file_url.startswith("/private/"):
+        link += f"{'&' if '?' in link else '?'}key={share_doc.get_document_share_key()}"
+    return {"link": link}
+
+
+def get_media_id(file_url, settings=None):
+    """Cached media id of a site file, uploading it on the first use.
+
+    Returns:
+        str: Media id, or None if the upload failed or is still running elsewhere
+    """
+    settings = settings or frappe.get_cached_doc("WhatsApp Settings")
+    file_path = get_file_path(file_url)
+    if not os.path.exists(file_path):
+        return None
+
+    cache = frappe.cache()
+    key = f"whatsapp_media_id|{settings.phone_id}|{get_file_hash(file_path)}"
+    media_id = cache.get_value(key)
+    if media_id or cache.get_value(f"{key}|failed"):
+        return media_id
+
+    # only one worker uploads a given file; the others wait for its result
+    lock_key = cache.make_key(f"{key}|lock")
+    token = frappe.generate_hash(length=20)
+    if not cache.set(lock_key, token, nx=True, ex=MEDIA_LOCK_TIMEOUT):
+        for _ in range(MEDIA_LOCK_TIMEOUT):
+            time.sleep(1)
+            media_id = cache.get_value(key)
+            if media_id or not cache.get(lock_key):
+                return media_id
+        return None
+
+    try:
+        media_id = upload_media(file_path, settings)
+        cache.set_value(key, media_id, expires_in_sec=MEDIA_ID_TTL)
+        return media_id
+    except Exception:
+        frappe.log_error(title="WhatsApp media upload failed")
+        cache.set_value(f"{key}|failed", 1, expires_in_sec=MEDIA_FAILURE_TTL)
+        return None
+    finally:
+        cache.eval(RELEASE_MEDIA_LOCK, 1, lock_key, token)
+
+
+def upload_media(file_path, settings):
+    """Upload a file to /{phone_id}/media and return the media id."""
+    mime_type = get_mime_type(file_path)
+    with open(file_path, "rb") as f:
+        response = requests.post(
+            f"{settings.url}/{settings.version}/{settings.phone_id}/media",
+            headers={"authorization": f"Bearer {settings.get_password('token')}"},
+            data={"messaging_product": "whatsapp", "type": mime_type},
+            files={"file": (os.path.basename(file_path), f, mime_type)},
+            # below MEDIA_LOCK_TIMEOUT, so a stalled upload gives up before its lock expires
+            timeout=UPLOAD_TIMEOUT,
+        )
+    response.raise_for_status()
+    return response.json()["id"]
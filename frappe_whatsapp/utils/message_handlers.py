@@ -0,0 +1,224 @@
+"""Incoming message parsers and handlers.
+
+Each message type of the Cloud API webhook has a parser that turns the
+message into WhatsApp Message fields: `message` (what the desk shows),
+`content_type` and a `payload` with the structured data of the type, e.g.
+the coordinates of a location or the id of a tapped button.
+
+Apps extend this through hooks:
+
+    whatsapp_message_parsers = {"order": "my_app.whatsapp.parse_order"}
+    whatsapp_message_handlers = {"location": ["my_app.whatsapp.on_location"]}
+
+A parser takes the message dict and returns the fields; a handler is
+enqueued with `message` (the WhatsApp Message name) and `data` (the raw
+message) after the message is saved. The "*" handler key matches every type.
+"""
+import json
+
+import frappe
+import requests
+
+from frappe_whatsapp.utils.flow_responses import save_flow_responses
+
+# seconds per media request; the webhook lane lock outlasts one
+MEDIA_TIMEOUT = 30
+
+
+def parse_text(message):
+    return {"content_type": "text", "message": message["text"]["body"]}
+
+
+def parse_reaction(message):
+    return {
+        "content_type": "reaction",
+        "message": message["reaction"].get("emoji"),
+        "reply_to_message_id": message["reaction"].get("message_id"),
+    }
+
+
+def parse_button(message):
+    """Quick reply button of a template."""
+    return {
+        "content_type": "button",
+        "message": message["button"].get("text"),
+        "payload": {"payload": message["button"].get("payload")},
+    }
+
+
+def parse_interactive(message):
+    interactive = message["interactive"]
+    reply_type = interactive.get("type")
+    reply = interactive.get(reply_type) or {}
+
+    if reply_type == "nfm_reply":
+        return {
+            "content_type": "flow",
+            "message": reply.get("response_json"),
+            "payload": {"name": reply.get("name"), "body": reply.get("body")},
+        }
+    if reply_type in ("button_reply", "list_reply"):
+        return {
+            "content_type": "button" if reply_type == "button_reply" else "list",
+            "message": reply.get("title"),
+            "payload": reply,
+        }
+    return parse_unknown(message)
+
+
+def parse_location(message):
+    location = message["location"]
+    return {
+        "content_type": "location",
+        "message": ", ".join(
+            filter(None, (location.get("name"), location.get("address")))
+        ) or f"{location.get('latitude')}, {location.get('longitude')}",
+        "payload": location,
+    }
+
+
+def parse_contacts(message):
+    contacts = message["contacts"]
+    return {
+        "content_type": "contact",
+        "message": ", ".join(
+            filter(None, (contact.get("name", {}).get("formatted_name") for contact in contacts))
+        ),
+        "payload": contacts,
+    }
+
+
+def parse_media(message):
+    media = message[message["type"]]
+    return {
+        "content_type": message["type"],
+        "message": media.get("caption"),
+        "media_id": media.get("id"),
+        "payload": {key: value for key, value in media.items() if key not in ("id", "caption")},
+    }
+
+
+def parse_unknown(message):
+    """Any other type: keep all of its data rather than guess a text."""
+    return {
+        "content_type": "unknown",
+        "message": message["type"],
+        "payload": message.get(message["type"]) or message.get("errors"),
+    }
+
+
+PARSERS = {
+    "text": parse_text,
+    "reaction": parse_reaction,
+    "button": parse_button,
+    "interactive": parse_interactive,
+    "location": parse_location,
+    "contacts": parse_contacts,
+    "image": parse_media,
+    "audio": parse_media,
+    "video": parse_media,
+    "document": parse_media,
+    "sticker": parse_media,
+}
+
+
+def get_parsers():
+    parsers = dict(PARSERS)
+    for message_type, methods in frappe.get_hooks("whatsapp_message_parsers").items():
+        parsers[message_type] = frappe.get_attr(methods[-1])
+    return parsers
+
+
+def get_handlers(message_type):
+    handlers = frappe.get_hooks("whatsapp_message_handlers")
+    return handlers.get("*", []) + handlers.get(message_type, [])
+
+
+def download_media(media_id, settings):
+    """Fetch an incoming media file from the Cloud API.
+
+    Returns:
+        tuple: (file name, content), or None if it could not be downloaded
+    """
+    from frappe_whatsapp.utils.webhook import refresh_lane_lock
+
+    headers = {"Authorization": "Bearer " + settings.get_password("token")}
+    refresh_lane_lock()
+    response = requests.get(
+        f"{settings.url}/{settings.version}/{media_id}/", headers=headers, timeout=MEDIA_TIMEOUT
+    )
+    if response.status_code != 200:
+        return None
+
+    media_data = response.json()
+    refresh_lane_lock()
+    media_response = requests.get(media_data.get("url"), headers=headers, timeout=MEDIA_TIMEOUT)
+    if media_response.status_code != 200:
+        return None
+
+    file_extension = media_data.get("mime_type").split(";")[0].split("/")[1]
+    return f"{frappe.generate_hash(length=10)}.{file_extension}", media_response.content
+
+
+def process_messages(messages, profile_name=None):
+    """Save the incoming messages of one webhook payload.
+
+    Messages already saved (Meta retries deliveries) are skipped with one
+    query for the whole batch.
+
+    Returns:
+        list: The new WhatsApp Message documents
+    """
+    message_ids = [message["id"] for message in messages if message.get("id")]
+    existing = set(frappe.get_all(
+        "WhatsApp Message", filters={"message_id": ("in", message_ids)}, pluck="message_id"
+    )) if message_ids else set()
+
+    parsers = get_parsers()
+    settings = None
+    docs = []
+    for message in messages:
+        if message.get("id") in existing:
+            continue
+
+        record = parsers.get(message["type"], parse_unknown)(message)
+        media_id = record.pop("media_id", None)
+        media = None
+        if media_id:
+            settings = settings or frappe.get_cached_doc("WhatsApp Settings")
+            media = download_media(media_id, settings)
+            if media and not record.get("message"):
+                record["message"] = f"/files/{media[0]}"
+        if record.get("payload") is not None:
+            record["payload"] = json.dumps(record["payload"])
+
+        context = message.get("context") or {}
+        doc = frappe.get_doc({
+            "doctype": "WhatsApp Message",
+            "type": "Incoming",
+            "from": message["from"],
+            "message_id": message.get("id"),
+            "reply_to_message_id": context.get("id"),
+            "is_reply": bool(context),
+            "profile_name": profile_name,
+            **record,
+        }).insert(ignore_permissions=True)
+
+        if media:
+            file = frappe.get_doc({
+                "doctype": "File",
+                "file_name": media[0],
+                "attached_to_doctype": "WhatsApp Message",
+                "attached_to_name": doc.name,
+                "content": media[1],
+                "attached_to_field": "attach",
+            }).save(ignore_permissions=True)
+            doc.attach = file.file_url
+            doc.save()
+
+        for handler in get_handlers(message["type"]):
+            frappe.enqueue(handler, enqueue_after_commit=True, message=doc.name, data=message)
+        docs.append(doc)
+
+    save_flow_responses([doc for doc in docs if doc.content_type == "flow"])
+    return docs
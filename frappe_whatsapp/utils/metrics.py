@@ -0,0 +1,187 @@
+"""Prometheus-style metrics for the WhatsApp pipeline.
+
+Enabled with `"whatsapp_metrics": 1` in site config. Counters and
+histograms are aggregated in one Redis hash per site and gauges are read
+when scraped. When disabled, every recording call returns after a config
+lookup.
+
+The text endpoint is `/api/method/frappe_whatsapp.metrics`. It accepts a
+System Manager session or `Authorization: Bearer <whatsapp_metrics_token>`.
+"""
+import hmac
+import time
+
+import frappe
+from werkzeug.wrappers import Response
+
+from frappe_whatsapp.ingest import INGEST_FAILED_KEY, INGEST_QUEUE_KEY
+
+METRICS_KEY = "whatsapp_metrics"
+
+METRICS = {
+    "whatsapp_api_requests_total": ("counter", "Calls to the WhatsApp Cloud API by source and result code"),
+    "whatsapp_api_latency_seconds": ("histogram", "Latency of WhatsApp Cloud API calls"),
+    "whatsapp_webhook_events_total": ("counter", "Webhook changes received by field"),
+    "whatsapp_webhook_lag_seconds": ("histogram", "Delay between an event at meta and its processing"),
+    "whatsapp_bulk_messages_total": ("counter", "Bulk campaign messages queued by result"),
+    "whatsapp_webhook_queue_depth": ("gauge", "Webhook payloads waiting in the ingest queue"),
+    "whatsapp_webhook_failed_depth": ("gauge", "Webhook payloads that failed processing"),
+    "whatsapp_campaign_progress_ratio": ("gauge", "Share of recipients processed per running campaign"),
+}
+
+HISTOGRAM_BUCKETS = {
+    "whatsapp_api_latency_seconds": (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    "whatsapp_webhook_lag_seconds": (1, 5, 15, 60, 300, 900, 3600),
+}
+
+
+def is_enabled():
+    return bool(frappe.conf.get("whatsapp_metrics"))
+
+
+def get_field(name, labels=None):
+    """Series name in the exposition format, e.g. `name{code="ok",source="x"}`."""
+    if not labels:
+        return name
+    label_str = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in sorted(labels.items())
+    )
+    return f"{name}{{{label_str}}}"
+
+
+def inc(name, labels=None, value=1):
+    """Increment a counter."""
+    if not is_enabled():
+        return
+    cache = frappe.cache()
+    cache.hincrbyfloat(cache.make_key(METRICS_KEY), get_field(name, labels), value)
+
+
+def observe(name, value, labels=None):
+    """Add a value to a histogram (cumulative buckets, sum and count)."""
+    if not is_enabled():
+        return
+    cache = frappe.cache()
+    key = cache.make_key(METRICS_KEY)
+    labels = labels or {}
+
+    pipe = cache.pipeline(transaction=False)
+    for upper in HISTOGRAM_BUCKETS[name]:
+        if value <= upper:
+            pipe.hincrbyfloat(key, get_field(f"{name}_bucket", {**labels, "le": upper}), 1)
+    pipe.hincrbyfloat(key, get_field(f"{name}_bucket", {**labels, "le": "+Inf"}), 1)
+    pipe.hincrbyfloat(key, get_field(f"{name}_sum", labels), value)
+    pipe.hincrbyfloat(key, get_field(f"{name}_count", labels), 1)
+    pipe.execute()
+
+
+def record_api_call(source, started, code="ok", finished=None):
+    """Record one Cloud API call.
+
+    Args:
+        source: Caller, e.g. "whatsapp_message"
+        started: time.monotonic() taken before the request
+        code: "ok" or the error code returned by meta
+        finished: time.monotonic() taken after the request, defaults to now
+    """
+    if not is_enabled():
+        return
+    observe("whatsapp_api_latency_seconds", (finished or time.monotonic()) - started, {"source": source})
+    inc("whatsapp_api_requests_total", {"source": source, "code": code})
+
+
+def get_response_code(response):
+    """"ok" or the meta error code of a requests response."""
+    if response.ok:
+        return "ok"
+    try:
+        return str(response.json()["error"].get("code") or response.status_code)
+    except Exception:
+        return str(response.status_code)
+
+
+def get_integration_error_code():
+    """Error code of the failed make_post_request, "unknown" when there is none."""
+    try:
+        return str(frappe.flags.integration_request.json()["error"].get("code") or "unknown")
+    except Exception:
+        return "unknown"
+
+
+def record_webhook(data):
+    """Count the changes of a webhook payload and the lag of its events."""
+    if not is_enabled():
+        return
+
+    entries = data.get("entry") or []
+    if isinstance(entries, dict):
+        entries = [entries]
+
+    now = time.time()
+    for entry in entries:
+        for change in entry.get("changes", []):
+            inc("whatsapp_webhook_events_total", {"field": change.get("field")})
+            value = change.get("value") or {}
+            for event in value.get("messages", []) + value.get("statuses", []) + value.get("calls", []):
+                if event.get("timestamp"):
+                    lag = max(now - float(event["timestamp"]), 0)
+                    observe("whatsapp_webhook_lag_seconds", lag, {"field": change.get("field")})
+
+
+def get_base_name(field):
+    name = field.split("{", 1)[0]
+    for suffix in ("_bucket", "_sum", "_count"):
+        if name.endswith(suffix) and name[: -len(suffix)] in HISTOGRAM_BUCKETS:
+            return name[: -len(suffix)]
+    return name
+
+
+def get_gauges():
+    cache = frappe.cache()
+    gauges = {
+        get_field("whatsapp_webhook_queue_depth"): cache.llen(INGEST_QUEUE_KEY),
+        get_field("whatsapp_webhook_failed_depth"): cache.llen(INGEST_FAILED_KEY),
+    }
+    for campaign in frappe.get_all(
+        "Bulk WhatsApp Message",
+        filters={"docstatus": 1, "status": ("in", ["Queued", "In Progress", "Partially Failed"])},
+        fields=["name", "sent_count", "recipient_count"],
+    ):
+        progress = (campaign.sent_count or 0) / campaign.recipient_count if campaign.recipient_count else 0
+        gauges[get_field("whatsapp_campaign_progress_ratio", {"campaign": campaign.name})] = progress
+    return gauges
+
+
+def render_metrics():
+    """All series in the Prometheus text exposition format."""
+    cache = frappe.cache()
+    # read through a pipeline: cache.hgetall would unpickle the raw counters
+    pipe = cache.pipeline(transaction=False)
+    pipe.hgetall(cache.make_key(METRICS_KEY))
+    series = {field.decode(): float(value) for field, value in pipe.execute()[0].items()}
+    series.update(get_gauges())
+
+    grouped = {}
+    for field, value in series.items():
+        grouped.setdefault(get_base_name(field), []).append((field, value))
+
+    lines = []
+    for name in sorted(grouped):
+        metric_type, help_text = METRICS.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for field, value in sorted(grouped[name]):
+            lines.append(f"{field} {int(value) if float(value).is_integer() else value}")
+    return "\n".join(lines) + "\n"
+
+
+@frappe.whitelist(allow_guest=True)
+def metrics():
+    """Served as /api/method/frappe_whatsapp.metrics via override_whitelisted_methods."""
+    token = frappe.conf.get("whatsapp_metrics_token")
+    auth = frappe.get_request_header("Authorization") or ""
+    if not (token and hmac.compare_digest(auth, f"Bearer {token}")):
+        frappe.only_for("System Manager")
+
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,73 @@
+"""Scheduler Event notifications.
+
+Each scheduler tick looks up the notifications of its frequency in a
+cached index and enqueues one job per notification, so slow scripts do
+not hold up the others and the RQ workers run them in parallel. Every
+run is logged with its duration and counts.
+"""
+import json
+import time
+
+import frappe
+
+SCHEDULE_CACHE = "whatsapp_scheduled_notifications"
+
+
+def get_scheduled_notifications(frequency):
+    """Names of the enabled notifications of an event_frequency, cached until one changes."""
+    names = frappe.cache().hget(SCHEDULE_CACHE, frequency)
+    if names is None:
+        names = frappe.get_all(
+            "WhatsApp Notification",
+            filters={
+                "notification_type": "Scheduler Event",
+                "event_frequency": frequency,
+                "disabled": 0,
+            },
+            pluck="name",
+        )
+        frappe.cache().hset(SCHEDULE_CACHE, frequency, names)
+    return names
+
+
+def clear_schedule_cache():
+    frappe.cache().delete_value(SCHEDULE_CACHE)
+
+
+def trigger_scheduled_notifications(frequency):
+    """Enqueue a run of every notification of `frequency`, e.g. "Daily Long"."""
+    if frappe.flags.in_import or frappe.flags.in_patch:
+        return
+
+    for name in get_scheduled_notifications(frequency):
+        frappe.enqueue(
+            "frappe_whatsapp.utils.notification_scheduler.run_scheduled_notification",
+            queue="long" if frequency.endswith("Long") else "default",
+            job_id=f"whatsapp_scheduled_notification|{name}",
+            deduplicate=True,
+            notification=name,
+            frequency=frequency,
+        )
+
+
+def run_scheduled_notification(notification, frequency=None):
+    """Run one Scheduler Event notification and log the run."""
+    started = time.monotonic()
+    doc = frappe.get_doc("WhatsApp Notification", notification)
+    run = {"notification": notification, "frequency": frequency}
+
+    try:
+        run.update(doc.send_scheduled_message() or {})
+    except Exception:
+        frappe.db.rollback()
+        run["error"] = frappe.get_traceback()
+        frappe.log_error(title=f"WhatsApp scheduled notification {notification} failed")
+    finally:
+        run["duration"] = round(time.monotonic() - started, 3)
+        frappe.get_doc({
+            "doctype": "WhatsApp Notification Log",
+            "template": doc.template,
+            "event_type": "scheduled_run",
+            "meta_data": json.dumps(run),
+        }).insert(ignore_permissions=True)
+        frappe.db.commit()
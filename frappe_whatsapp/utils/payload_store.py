@@ -0,0 +1,148 @@
+"""Compressed storage of raw webhook payloads.
+
+Payloads are appended to per-day segment files under
+`private/whatsapp_payloads` and only a small pointer row
+(WhatsApp Webhook Payload) is kept in the database.
+"""
+import fcntl
+import gzip
+import json
+import os
+
+import frappe
+from frappe.utils import nowdate
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+SEGMENT_FOLDER = "whatsapp_payloads"
+
+
+def get_storage_mode():
+    """Return the configured payload storage: Database, Compressed Files or Disabled."""
+    return frappe.get_cached_doc("WhatsApp Settings").payload_storage or "Database"
+
+
+def get_codec():
+    return "zstd" if zstandard else "gzip"
+
+
+def compress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def decompress(data, codec):
+    if codec == "zstd":
+        if not zstandard:
+            frappe.throw("zstandard is required to read this payload")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def get_segment_path(segment):
+    return frappe.get_site_path("private", SEGMENT_FOLDER, segment)
+
+
+def store_payload(key, payload, kind="webhook"):
+    """Append a payload to today's segment and index it under `key`.
+
+    Args:
+        key: Message, status or call id used to look the payload up
+        payload: JSON serialisable payload or raw bytes
+        kind: Short label of the payload source (webhook, call, ...)
+
+    Returns:
+        str: Name of the WhatsApp Webhook Payload pointer
+    """
+    if not isinstance(payload, bytes):
+        payload = json.dumps(payload, separators=(",", ":")).encode()
+
+    codec = get_codec()
+    blob = compress(payload, codec)
+    segment = f"{nowdate().replace('-', '')}.seg"
+    path = get_segment_path(segment)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # segments are append-only; the lock keeps offsets correct across workers
+    with open(path, "ab") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            f.seek(0, os.SEEK_END)
+            offset = f.tell()
+            f.write(blob)
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+    doc = frappe.get_doc({
+        "doctype": "WhatsApp Webhook Payload",
+        "payload_key": key,
+        "kind": kind,
+        "segment": segment,
+        "segment_offset": offset,
+        "payload_length": len(blob),
+        "codec": codec,
+    })
+    doc.db_insert()
+    return doc.name
+
+
+def read_payload(name):
+    """Read and decode one stored payload by its pointer name."""
+    pointer = frappe.db.get_value(
+        "WhatsApp Webhook Payload", name,
+        ["segment", "segment_offset", "payload_length", "codec"],
+        as_dict=True,
+    )
+    if not pointer:
+        return None
+
+    with open(get_segment_path(pointer.segment), "rb") as f:
+        f.seek(pointer.segment_offset)
+        blob = f.read(pointer.payload_length)
+
+    return json.loads(decompress(blob, pointer.codec))
+
+
+@frappe.whitelist()
+def get_payloads(key):
+    """Debugging API: all raw payloads stored for a message, status or call id.
+
+    Args:
+        key: Message, status or call id
+
+    Returns:
+        list: Payloads in the order they were received
+    """
+    frappe.only_for("System Manager")
+    names = frappe.get_all(
+        "WhatsApp Webhook Payload",
+        filters={"payload_key": key},
+        order_by="creation asc",
+        pluck="name",
+    )
+    return [read_payload(name) for name in names]
+
+
+def get_webhook_summary(data):
+    """Extract the typed fields kept on WhatsApp Notification Log.
+
+    Returns:
+        tuple: (event_type, key) where key is the first message, status or call id
+    """
+    try:
+        change = data["entry"][0]["changes"][0]
+    except (KeyError, IndexError, TypeError):
+        return None, None
+
+    value = change.get("value") or {}
+    for collection, event_type in (("messages", "message"), ("statuses", "status"), ("calls", "call")):
+        items = value.get(collection)
+        if items:
+            return event_type, items[0].get("id")
+
+    return change.get("field"), value.get("message_template_id") or value.get("id")
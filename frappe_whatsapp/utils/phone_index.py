@@ -0,0 +1,238 @@
+"""Sender lookup: normalized phone numbers of CRM records.
+
+WhatsApp Phone Index holds one row per (number, record) for the doctypes
+set in WhatsApp Settings. The doc events bridge keeps it current when a
+source record is saved or deleted. Lookups go through a small per-process
+LRU, then Redis (per number suffix), then the indexed table.
+"""
+import time
+from collections import OrderedDict, defaultdict
+
+import frappe
+from frappe.utils import now_datetime
+
+from frappe_whatsapp.utils import normalize_number
+
+# used when WhatsApp Settings has no Phone Index Sources
+DEFAULT_SOURCES = (
+    ("Contact", "mobile_no,phone,phone_nos.phone"),
+    ("Customer", "mobile_no"),
+    ("Lead", "mobile_no,phone,whatsapp_no"),
+    ("Employee", "cell_number"),
+)
+SOURCES_CACHE = "whatsapp_phone_index_sources"
+LOOKUP_CACHE = "whatsapp_phone_index"
+# numbers saved without a country code still match on their last digits
+SUFFIX_LENGTH = 10
+LOOKUP_TTL = 24 * 60 * 60
+MISS_TTL = 10 * 60
+# the LRU only saves Redis round trips; its entries expire quickly so
+# changes made by other workers show up
+LRU_SIZE = 4096
+LRU_TTL = 60
+
+_lru = OrderedDict()
+
+
+def parse_phone_fields(phone_fields):
+    """"mobile_no, phone_nos.phone" -> [("mobile_no", None), ("phone_nos", "phone")]"""
+    fields = []
+    for field in (phone_fields or "").split(","):
+        field = field.strip()
+        if not field:
+            continue
+        parent_field, _, child_field = field.partition(".")
+        fields.append((parent_field, child_field or None))
+    return fields
+
+
+def get_suffix(number):
+    return number[-SUFFIX_LENGTH:]
+
+
+def get_sources():
+    """{doctype: {"fields": [...], "priority": int}} of the indexed doctypes."""
+    sources = frappe.cache().get_value(SOURCES_CACHE)
+    if sources is None:
+        rows = [
+            (row.reference_doctype, row.phone_fields)
+            for row in frappe.get_cached_doc("WhatsApp Settings").get("phone_index_sources") or []
+        ] or [source for source in DEFAULT_SOURCES if frappe.db.exists("DocType", source[0])]
+
+        sources = {
+            doctype: {"fields": parse_phone_fields(phone_fields), "priority": priority}
+            for priority, (doctype, phone_fields) in enumerate(rows)
+        }
+        frappe.cache().set_value(SOURCES_CACHE, sources)
+    return sources
+
+
+def clear_sources_cache():
+    frappe.cache().delete_value(SOURCES_CACHE)
+
+
+def get_numbers(doc, fields):
+    numbers = set()
+    for field, child_field in fields:
+        if child_field:
+            values = [row.get(child_field) for row in doc.get(field) or []]
+        else:
+            values = [doc.get(field)]
+        numbers.update(filter(None, (normalize_number(value) for value in values)))
+    return numbers
+
+
+def sync_phone_index(doc, event):
+    """Doc events bridge entry: index a saved source record, drop a deleted one."""
+    source = get_sources().get(doc.doctype)
+    if not source:
+        return
+
+    numbers = set() if event == "on_trash" else get_numbers(doc, source["fields"])
+    existing = {
+        row.number: row.name
+        for row in frappe.get_all(
+            "WhatsApp Phone Index",
+            filters={"reference_doctype": doc.doctype, "reference_name": doc.name},
+            fields=["name", "number"],
+        )
+    }
+
+    for number in set(existing) - numbers:
+        frappe.db.delete("WhatsApp Phone Index", {"name": existing[number]})
+    for number in numbers - set(existing):
+        frappe.get_doc({
+            "doctype": "WhatsApp Phone Index",
+            "name": frappe.generate_hash(length=10),
+            "number": number,
+            "number_suffix": get_suffix(number),
+            "reference_doctype": doc.doctype,
+            "reference_name": doc.name,
+            "priority": source["priority"],
+        }).db_insert()
+
+    invalidate(numbers ^ set(existing))
+
+
+def on_rename(doc, method, old, new, merge=False):
+    """rename_doc already updates the Dynamic Link; drop the cached lookups."""
+    if doc.doctype in get_sources():
+        invalidate(frappe.get_all(
+            "WhatsApp Phone Index",
+            filters={"reference_doctype": doc.doctype, "reference_name": new},
+            pluck="number",
+        ))
+
+
+def invalidate(numbers):
+    for suffix in {get_suffix(number) for number in numbers}:
+        frappe.cache().delete_value(f"{LOOKUP_CACHE}|{suffix}")
+        _lru.pop(suffix, None)
+
+
+def get_candidates(suffix):
+    """[(number, doctype, name)] sharing a suffix, best priority first."""
+    now = time.monotonic()
+    cached = _lru.get(suffix)
+    if cached and cached[0] > now:
+        _lru.move_to_end(suffix)
+        return cached[1]
+
+    key = f"{LOOKUP_CACHE}|{suffix}"
+    candidates = frappe.cache().get_value(key)
+    if candidates is None:
+        candidates = [
+            (row.number, row.reference_doctype, row.reference_name)
+            for row in frappe.get_all(
+                "WhatsApp Phone Index",
+                filters={"number_suffix": suffix},
+                fields=["number", "reference_doctype", "reference_name"],
+                order_by="priority asc, creation desc",
+            )
+        ]
+        frappe.cache().set_value(key, candidates, expires_in_sec=LOOKUP_TTL if candidates else MISS_TTL)
+
+    _lru[suffix] = (now + LRU_TTL, candidates)
+    _lru.move_to_end(suffix)
+    if len(_lru) > LRU_SIZE:
+        _lru.popitem(last=False)
+    return candidates
+
+
+def get_record_for_number(number):
+    """Record a phone number belongs to.
+
+    An exact match wins; otherwise a record saved with the same number
+    without (or with a shorter) country code.
+
+    Returns:
+        tuple: (doctype, name), or None
+    """
+    number = normalize_number(number)
+    if not number:
+        return None
+
+    candidates = get_candidates(get_suffix(number))
+    for candidate_number, doctype, name in candidates:
+        if candidate_number == number:
+            return doctype, name
+    for candidate_number, doctype, name in candidates:
+        if number.endswith(candidate_number) or candidate_number.endswith(number):
+            return doctype, name
+    return None
+
+
+@frappe.whitelist()
+def enqueue_rebuild():
+    frappe.only_for("System Manager")
+    frappe.enqueue(
+        "frappe_whatsapp.utils.phone_index.rebuild_phone_index",
+        queue="long",
+        job_id="whatsapp_phone_index_rebuild",
+        deduplicate=True,
+    )
+
+
+def rebuild_phone_index():
+    """Rebuild the whole index with one query per phone field."""
+    clear_sources_cache()
+    frappe.db.delete("WhatsApp Phone Index")
+    now = now_datetime()
+
+    for doctype, source in get_sources().items():
+        meta = frappe.get_meta(doctype)
+        numbers = defaultdict(set)
+        for field, child_field in source["fields"]:
+            df = meta.get_field(field)
+            if not df:
+                continue
+            if child_field:
+                rows = frappe.get_all(
+                    df.options,
+                    filters={"parenttype": doctype, "parentfield": field, child_field: ("is", "set")},
+                    fields=["parent as name", f"{child_field} as phone"],
+                )
+            else:
+                rows = frappe.get_all(
+                    doctype, filters={field: ("is", "set")}, fields=["name", f"{field} as phone"],
+                )
+            for row in rows:
+                number = normalize_number(row.phone)
+                if number:
+                    numbers[row.name].add(number)
+
+        frappe.db.bulk_insert(
+            "WhatsApp Phone Index",
+            fields=["name", "creation", "modified", "owner", "modified_by",
+                    "number", "number_suffix", "reference_doctype", "reference_name", "priority"],
+            values=[
+                (frappe.generate_hash(length=10), now, now, "Administrator", "Administrator",
+                 number, get_suffix(number), doctype, name, source["priority"])
+                for name, record_numbers in numbers.items()
+                for number in record_numbers
+            ],
+        )
+        frappe.db.commit()
+
+    frappe.cache().delete_keys(LOOKUP_CACHE)
+    _lru.clear()
@@ -0,0 +1,141 @@
+"""Pre-rendered document prints for WhatsApp notifications.
+
+PDFs are rendered by a background worker, saved once as private files
+(deduplicated by content hash) and then sent by media id from the same
+worker. The user's save only enqueues the job; it never renders or
+uploads.
+
+Renders are cached per document version for PRINT_FILE_TTL and reuse
+only files younger than that, so a daily job can delete the print files
+older than twice the TTL: no cache entry points to them anymore.
+"""
+import hashlib
+from functools import partial
+
+import frappe
+from frappe.utils import add_to_date, now_datetime
+
+PRINT_FILE_CACHE = "whatsapp_print_file"
+PRINT_FILE_TTL = 7 * 24 * 60 * 60
+# file name prefix that tells print files apart from other attachments
+PRINT_FILE_PREFIX = "whatsapp-print-"
+DELETE_BATCH = 500
+
+
+def get_print_format(doctype):
+    """Default print format of a doctype.
+
+    Meta is cached and already includes the default_print_format
+    property setter, so no DocType or Property Setter query is needed.
+    """
+    return frappe.get_meta(doctype).default_print_format or "Standard"
+
+
+def get_artifact_key(doctype, name, print_format, modified):
+    digest = hashlib.sha1(f"{doctype}|{name}|{print_format}|{modified}".encode()).hexdigest()
+    return f"{PRINT_FILE_CACHE}|{digest}"
+
+
+def get_print_file(doc, print_format=None):
+    """File url of the rendered print of `doc`, or None if not rendered yet.
+
+    The artifact is keyed on the document's `modified`, so edits produce
+    a fresh render.
+    """
+    print_format = print_format or get_print_format(doc.doctype)
+    return frappe.cache().get_value(get_artifact_key(doc.doctype, doc.name, print_format, doc.modified))
+
+
+def render_print_file(doctype, name, print_format=None):
+    """Render a document print to a private file and remember it.
+
+    Returns:
+        str: File url of the PDF
+    """
+    doc = frappe.get_doc(doctype, name)
+    print_format = print_format or get_print_format(doctype)
+
+    file_url = get_print_file(doc, print_format)
+    if file_url:
+        return file_url
+
+    pdf = frappe.get_print(doctype, name, print_format, doc=doc, as_pdf=True)
+    content_hash = hashlib.md5(pdf).hexdigest()
+
+    # identical renders share one file
+    file_url = frappe.db.get_value(
+        "File",
+        {
+            "content_hash": content_hash,
+            "attached_to_doctype": doctype,
+            "attached_to_name": name,
+            "creation": (">", add_to_date(now_datetime(), seconds=-PRINT_FILE_TTL)),
+        },
+        "file_url",
+    )
+    if not file_url:
+        file_url = frappe.get_doc({
+            "doctype": "File",
+            "file_name": f"{PRINT_FILE_PREFIX}{name}.pdf",
+            "attached_to_doctype": doctype,
+            "attached_to_name": name,
+            "is_private": 1,
+            "content": pdf,
+        }).save(ignore_permissions=True).file_url
+
+    # cached only once the File is committed, never for a rolled back one
+    frappe.db.after_commit.add(partial(
+        frappe.cache().set_value,
+        get_artifact_key(doctype, name, print_format, doc.modified),
+        file_url,
+        expires_in_sec=PRINT_FILE_TTL,
+    ))
+    return file_url
+
+
+def enqueue_render_and_send(notification, doctype, name, phone_no=None, triggered_at=None):
+    """Render the print in the background, then send the notification."""
+    frappe.enqueue(
+        "frappe_whatsapp.utils.print_attachments.render_and_send",
+        queue="long",
+        job_id=f"whatsapp_print|{notification}|{doctype}|{name}|{phone_no or ''}",
+        deduplicate=True,
+        enqueue_after_commit=True,
+        notification=notification,
+        doctype=doctype,
+        name=name,
+        phone_no=phone_no,
+        triggered_at=triggered_at,
+    )
+
+
+def render_and_send(notification, doctype, name, phone_no=None, triggered_at=None):
+    file_url = render_print_file(doctype, name)
+    frappe.get_doc("WhatsApp Notification", notification).send_template_message(
+        frappe.get_doc(doctype, name),
+        phone_no,
+        ignore_condition=True,
+        triggered_at=triggered_at,
+        print_file=file_url,
+    )
+
+
+def delete_expired_print_files():
+    """Daily job: delete the print files no cached render points to anymore."""
+    cutoff = add_to_date(now_datetime(), seconds=-2 * PRINT_FILE_TTL)
+    while True:
+        names = frappe.get_all(
+            "File",
+            filters={
+                "file_name": ("like", f"{PRINT_FILE_PREFIX}%"),
+                "is_private": 1,
+                "creation": ("<", cutoff),
+            },
+            pluck="name",
+            limit=DELETE_BATCH,
+        )
+        for name in names:
+            frappe.delete_doc("File", name, ignore_permissions=True)
+        frappe.db.commit()
+        if len(names) < DELETE_BATCH:
+            break
@@ -0,0 +1,241 @@
+"""Opt-in profiler for the doc_events bridge, notification evaluation and sends.
+
+Enabled from WhatsApp Settings (optionally until a given time) or with
+`"whatsapp_profiling": 1` in site config. Sections are aggregated in Redis
+per (section, key), with wall time, call count and query count:
+
+    bridge        doctype of the doc event
+    notification  WhatsApp Notification evaluated for the event
+    condition     its condition
+    send          the Cloud API request
+
+Stacks are kept in the collapsed format read by flamegraph.pl and
+speedscope. In "Instrumented" mode they are made of the section labels,
+weighted by self time in microseconds. In "Sampling" mode a thread samples
+the Python stack every millisecond while a top level section runs.
+"""
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import add_to_date, cint, flt, get_datetime, now_datetime
+
+PROFILE_KEY = "whatsapp_profile"
+STACKS_KEY = "whatsapp_profile_stacks"
+SAMPLE_INTERVAL = 0.001
+
+
+def is_profiling():
+    """Whether profiling is on, evaluated once per request or job."""
+    if frappe.flags.whatsapp_profiling is None:
+        frappe.flags.whatsapp_profiling = get_profiling_settings() or False
+    return bool(frappe.flags.whatsapp_profiling)
+
+
+def get_profiling_settings():
+    """Mode and sample rate when profiling is on, else None."""
+    if frappe.conf.get("whatsapp_profiling"):
+        return {"mode": "Instrumented", "sample_rate": 100}
+
+    settings = frappe.get_cached_doc("WhatsApp Settings")
+    if not settings.get("enable_profiling"):
+        return None
+    if settings.profile_until and get_datetime(settings.profile_until) < now_datetime():
+        return None
+    return {
+        "mode": settings.profiling_mode or "Instrumented",
+        "sample_rate": flt(settings.profiling_sample_rate) or 100,
+    }
+
+
+class Sampler(threading.Thread):
+    """Collects collapsed Python stacks of another thread."""
+
+    def __init__(self, thread_id, prefix):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.prefix = prefix
+        self.samples = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join([self.prefix, *reversed(names)])] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        return self.samples
+
+
+@contextmanager
+def profile(section, key):
+    """Time a block and count its queries when profiling is on."""
+    if not is_profiling() or frappe.flags.whatsapp_profile_skip:
+        yield
+        return
+
+    settings = frappe.flags.whatsapp_profiling
+    stack = frappe.flags.whatsapp_profile_stack
+    if not stack:
+        # top level: sample the whole tree or none of it
+        if random.uniform(0, 100) >= settings["sample_rate"]:
+            frappe.flags.whatsapp_profile_skip = True
+            try:
+                yield
+            finally:
+                frappe.flags.whatsapp_profile_skip = False
+            return
+        stack = frappe.flags.whatsapp_profile_stack = []
+
+    label = f"{section}:{key}"
+    frame = {"label": label, "start": time.perf_counter(), "child": 0}
+    top_level = not stack
+    if top_level:
+        frame["queries"] = install_query_counter()
+        if settings["mode"] == "Sampling":
+            frame["sampler"] = Sampler(threading.get_ident(), label)
+            frame["sampler"].start()
+    frame["query_start"] = stack[0]["queries"][0] if stack else 0
+    stack.append(frame)
+
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - frame["start"]
+        queries = stack[0]["queries"][0] - frame["query_start"]
+        path = ";".join(f["label"] for f in stack)
+        stack.pop()
+        if stack:
+            stack[-1]["child"] += elapsed
+
+        samples = {}
+        if top_level:
+            # restored before anything that can fail, or the next profile wraps the wrapper
+            try:
+                if settings["mode"] == "Sampling":
+                    samples = frame["sampler"].stop()
+            finally:
+                uninstall_query_counter()
+
+        try:
+            save_profile(section, key, elapsed, queries, path, frame["child"], samples, settings["mode"])
+        except Exception:
+            # never replace the exception of the profiled code
+            frappe.log_error(title="WhatsApp profile could not be saved")
+
+
+def save_profile(section, key, elapsed, queries, path, child, samples, mode):
+    cache = frappe.cache()
+    pipe = cache.pipeline(transaction=False)
+    profile_key = cache.make_key(PROFILE_KEY)
+    pipe.hincrbyfloat(profile_key, f"{section}|{key}|time", elapsed * 1000)
+    pipe.hincrbyfloat(profile_key, f"{section}|{key}|calls", 1)
+    pipe.hincrbyfloat(profile_key, f"{section}|{key}|queries", queries)
+
+    stacks_key = cache.make_key(STACKS_KEY)
+    if mode == "Sampling":
+        for sample, count in samples.items():
+            pipe.hincrby(stacks_key, sample, count)
+    else:
+        pipe.hincrby(stacks_key, path, int((elapsed - child) * 1_000_000))
+    pipe.execute()
+
+
+def install_query_counter():
+    """Count frappe.db.sql calls until uninstall_query_counter()."""
+    counter = [0]
+    original = frappe.db.sql
+
+    def sql(*args, **kwargs):
+        counter[0] += 1
+        return original(*args, **kwargs)
+
+    frappe.db.sql = sql
+    frappe.flags.whatsapp_profile_sql = original
+    return counter
+
+
+def uninstall_query_counter():
+    frappe.db.sql = frappe.flags.whatsapp_profile_sql
+    frappe.flags.whatsapp_profile_sql = None
+
+
+@frappe.whitelist()
+def start_profiling(minutes=10, mode="Instrumented", sample_rate=100):
+    """Clear collected data and profile for the next `minutes`."""
+    frappe.only_for("System Manager")
+    clear_profile()
+    settings = frappe.get_doc("WhatsApp Settings")
+    settings.enable_profiling = 1
+    settings.profiling_mode = mode
+    settings.profiling_sample_rate = flt(sample_rate)
+    settings.profile_until = add_to_date(now_datetime(), minutes=cint(minutes))
+    settings.save()
+
+
+@frappe.whitelist()
+def clear_profile():
+    frappe.only_for("System Manager")
+    cache = frappe.cache()
+    cache.delete(cache.make_key(PROFILE_KEY), cache.make_key(STACKS_KEY))
+
+
+def read_hash(key):
+    # read through a pipeline: cache.hgetall would unpickle the raw counters
+    cache = frappe.cache()
+    pipe = cache.pipeline(transaction=False)
+    pipe.hgetall(cache.make_key(key))
+    return {field.decode(): value.decode() for field, value in pipe.execute()[0].items()}
+
+
+@frappe.whitelist()
+def get_profile_summary():
+    """Time, calls and queries per section and key, slowest first.
+
+    Returns:
+        list: Rows with section, key, calls, total_ms, avg_ms and queries
+    """
+    frappe.only_for("System Manager")
+    rows = {}
+    for field, value in read_hash(PROFILE_KEY).items():
+        section, rest = field.split("|", 1)
+        key, metric = rest.rsplit("|", 1)
+        row = rows.setdefault((section, key), {"section": section, "key": key})
+        row[metric] = float(value)
+
+    summary = []
+    for row in rows.values():
+        calls = row.get("calls") or 0
+        summary.append({
+            "section": row["section"],
+            "key": row["key"],
+            "calls": int(calls),
+            "total_ms": round(row.get("time", 0), 2),
+            "avg_ms": round(row.get("time", 0) / calls, 2) if calls else 0,
+            "queries": int(row.get("queries", 0)),
+        })
+    summary.sort(key=lambda row: row["total_ms"], reverse=True)
+    return summary
+
+
+@frappe.whitelist()
+def download_stacks():
+    """Collapsed stacks of the current window as a text file."""
+    frappe.only_for("System Manager")
+    lines = [f"{stack} {count}" for stack, count in sorted(read_hash(STACKS_KEY).items())]
+    frappe.response["filename"] = "whatsapp_profile.folded"
+    frappe.response["filecontent"] = "\n".join(lines) + "\n"
+    frappe.response["type"] = "download"
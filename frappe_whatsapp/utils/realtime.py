@@ -0,0 +1,131 @@
+"""Realtime fan-out of WhatsApp messages and status ticks to desk.
+
+Every conversation, campaign and the WhatsApp Message list is a room.
+The first update of a room is published at once; further updates within
+the coalesce window are collected in Redis and published together by a
+single trailing flush, so a burst of status callbacks for one campaign
+becomes one socket.io event.
+"""
+import json
+import time
+
+import frappe
+from frappe.utils import cint
+
+MESSAGE_EVENT = "whatsapp_message_update"
+CONVERSATION_EVENT = "whatsapp_conversation_update"
+CAMPAIGN_EVENT = "whatsapp_campaign_update"
+
+
+def publish_message(doc, event="new_message"):
+    """Publish a message insert or status change to all rooms it belongs to."""
+    settings = frappe.get_cached_doc("WhatsApp Settings")
+    if not settings.enable_realtime_updates:
+        return
+
+    update = {
+        "event": event,
+        "name": doc.name,
+        "type": doc.type,
+        "status": doc.status,
+        "contact_number": doc.contact_number,
+        "content_type": doc.content_type,
+        "message": doc.message if event == "new_message" else None,
+        "creation": str(doc.creation),
+    }
+    window = cint(settings.realtime_coalesce_window)
+
+    publish_coalesced(("doctype", "WhatsApp Message", None), MESSAGE_EVENT, update, window)
+    if doc.contact_number:
+        publish_coalesced(
+            ("doc", "WhatsApp Conversation", doc.contact_number), CONVERSATION_EVENT, update, window
+        )
+    if doc.bulk_message_reference:
+        publish_coalesced(
+            ("doc", "Bulk WhatsApp Message", doc.bulk_message_reference), CAMPAIGN_EVENT, update, window
+        )
+
+
+def publish_coalesced(room, event, update, window):
+    """Publish `update` to `room`, merging it with others inside `window` ms."""
+    if window <= 0:
+        emit(room, event, [update])
+        return
+
+    cache = frappe.cache()
+    room_key = get_room_key(room, event)
+    lock_key = cache.make_key(f"{room_key}|lock")
+    pending_key = cache.make_key(f"{room_key}|pending")
+
+    # leading edge: nothing published for this room within the window
+    if cache.set(lock_key, 1, nx=True, px=window):
+        emit(room, event, [update])
+        return
+
+    pipe = cache.pipeline()
+    pipe.rpush(pending_key, json.dumps(update))
+    pipe.pexpire(pending_key, window * 10)
+    pipe.set(cache.make_key(f"{room_key}|flush"), 1, nx=True, px=window)
+    schedule_flush = pipe.execute()[-1]
+
+    if schedule_flush:
+        frappe.enqueue(
+            "frappe_whatsapp.utils.realtime.flush_room",
+            queue="short",
+            enqueue_after_commit=True,
+            room=list(room),
+            event=event,
+            window=window,
+        )
+
+
+def flush_room(room, event, window):
+    """Trailing edge: wait for the window to close and publish what piled up."""
+    cache = frappe.cache()
+    room_key = get_room_key(room, event)
+    lock_key = cache.make_key(f"{room_key}|lock")
+    pending_key = cache.make_key(f"{room_key}|pending")
+
+    remaining = cache.pttl(lock_key)
+    if remaining and remaining > 0:
+        time.sleep(remaining / 1000)
+
+    pipe = cache.pipeline()
+    pipe.lrange(pending_key, 0, -1)
+    pipe.delete(pending_key)
+    pipe.set(lock_key, 1, px=window)
+    updates = pipe.execute()[0]
+    if updates:
+        emit(tuple(room), event, merge_updates([json.loads(u) for u in updates]))
+
+
+def merge_updates(updates):
+    """Keep the latest update per message, in arrival order."""
+    merged = {}
+    for update in updates:
+        merged.pop(update["name"], None)
+        merged[update["name"]] = update
+    return list(merged.values())
+
+
+def emit(room, event, updates):
+    kind, doctype, docname = room
+    message = {"updates": updates}
+    if kind == "doc":
+        message["counts"] = count_statuses(updates)
+        frappe.publish_realtime(event, message, doctype=doctype, docname=docname, after_commit=True)
+    else:
+        frappe.publish_realtime(event, message, doctype=doctype, after_commit=True)
+
+
+def count_statuses(updates):
+    counts = {}
+    for update in updates:
+        status = update.get("status") or "new"
+        counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+def get_room_key(room, event):
+    kind, doctype, docname = room
+    return f"whatsapp_realtime|{event}|{kind}|{doctype}|{docname or ''}"
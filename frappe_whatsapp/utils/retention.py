@@ -0,0 +1,179 @@
+"""Retention and archival of old WhatsApp messages and logs."""
+import time
+
+import frappe
+from frappe.utils import add_days, cint, now_datetime, strip_html
+
+from frappe_whatsapp.utils.search import remove_from_index
+
+ARCHIVE_FIELDS = [
+    "message_id", "type", "status", "from", "to", "profile_name",
+    "content_type", "message_type", "template", "conversation_id", "attach",
+    "reference_doctype", "reference_name", "bulk_message_reference",
+]
+SUMMARY_LENGTH = 140
+# pause between batches so that other writers can grab the row locks
+BATCH_PAUSE = 0.2
+
+
+def run_retention():
+    """Nightly job: archive old messages and purge old notification logs."""
+    settings = frappe.get_cached_doc("WhatsApp Settings")
+    if not settings.enable_message_archival:
+        return
+
+    deadline = time.monotonic() + 60 * (cint(settings.archive_time_limit) or 30)
+    batch_size = cint(settings.archive_batch_size) or 500
+
+    archive_messages(
+        cint(settings.message_retention_days) or 180, batch_size, deadline
+    )
+    purge_notification_logs(
+        cint(settings.notification_log_retention_days) or 30, batch_size, deadline
+    )
+
+
+def archive_messages(retention_days, batch_size=500, deadline=None):
+    """Move messages older than `retention_days` to WhatsApp Message Archive.
+
+    Every batch is copied and deleted in its own transaction, so locks are
+    held only for `batch_size` rows at a time.
+
+    Args:
+        retention_days: Messages created before this many days are archived
+        batch_size: Number of messages moved per transaction
+        deadline: Optional `time.monotonic()` value after which to stop
+
+    Returns:
+        int: Number of archived messages
+    """
+    cutoff = add_days(now_datetime(), -cint(retention_days))
+    columns = ", ".join(f"`{field}`" for field in ARCHIVE_FIELDS)
+    archived = 0
+
+    while not deadline or time.monotonic() < deadline:
+        rows = frappe.db.sql(
+            f"""SELECT name, creation, message, {columns}
+            FROM `tabWhatsApp Message`
+            WHERE creation < %(cutoff)s
+            ORDER BY creation
+            LIMIT %(limit)s""",
+            {"cutoff": cutoff, "limit": batch_size},
+            as_dict=True,
+        )
+        if not rows:
+            break
+
+        now = now_datetime()
+        values = [
+            (
+                row.name, now, now, "Administrator", "Administrator",
+                row.creation, get_summary(row.message),
+                *(row.get(field) for field in ARCHIVE_FIELDS),
+            )
+            for row in rows
+        ]
+        frappe.db.bulk_insert(
+            "WhatsApp Message Archive",
+            ["name", "creation", "modified", "owner", "modified_by", "sent_on", "summary"]
+            + ARCHIVE_FIELDS,
+            values,
+            ignore_duplicates=True,
+        )
+        frappe.db.delete("WhatsApp Message", {"name": ("in", [row.name for row in rows])})
+        frappe.db.commit()
+        remove_from_index([row.name for row in rows])
+
+        archived += len(rows)
+        if len(rows) < batch_size:
+            break
+        time.sleep(BATCH_PAUSE)
+
+    return archived
+
+
+def purge_notification_logs(retention_days, batch_size=500, deadline=None):
+    """Delete WhatsApp Notification Logs older than `retention_days` in batches.
+
+    Returns:
+        int: Number of deleted logs
+    """
+    cutoff = add_days(now_datetime(), -cint(retention_days))
+    purged = 0
+
+    while not deadline or time.monotonic() < deadline:
+        names = frappe.db.sql_list(
+            """SELECT name FROM `tabWhatsApp Notification Log`
+            WHERE creation < %(cutoff)s
+            ORDER BY creation
+            LIMIT %(limit)s""",
+            {"cutoff": cutoff, "limit": batch_size},
+        )
+        if not names:
+            break
+
+        frappe.db.delete("WhatsApp Notification Log", {"name": ("in", names)})
+        frappe.db.commit()
+
+        purged += len(names)
+        if len(names) < batch_size:
+            break
+        time.sleep(BATCH_PAUSE)
+
+    return purged
+
+
+def get_summary(message):
+    """Short plain text version of a message body."""
+    if not message:
+        return None
+    text = " ".join(strip_html(message).split())
+    if len(text) > SUMMARY_LENGTH:
+        text = text[: SUMMARY_LENGTH - 1] + "…"
+    return text
+
+
+@frappe.whitelist()
+def archive_now():
+    """Run the retention job in the background."""
+    frappe.only_for("System Manager")
+    frappe.enqueue(
+        "frappe_whatsapp.utils.retention.run_retention",
+        queue="long",
+        job_id="whatsapp_retention",
+        deduplicate=True,
+    )
+    return True
+
+
+@frappe.whitelist()
+def get_archive_summary(phone_number=None, from_date=None, to_date=None):
+    """Message counts from the archive grouped by month, direction and status.
+
+    Args:
+        phone_number: Optional filter on sender or recipient
+        from_date: Optional lower bound on the original send time
+        to_date: Optional upper bound on the original send time
+
+    Returns:
+        list: Rows of month, type, status and count
+    """
+    frappe.has_permission("WhatsApp Message Archive", "report", throw=True)
+    conditions = []
+    if phone_number:
+        conditions.append("(`from` = %(phone_number)s OR `to` = %(phone_number)s)")
+    if from_date:
+        conditions.append("sent_on >= %(from_date)s")
+    if to_date:
+        conditions.append("sent_on <= %(to_date)s")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    return frappe.db.sql(
+        f"""SELECT DATE_FORMAT(sent_on, '%%Y-%%m') AS month, type, status, COUNT(*) AS count
+        FROM `tabWhatsApp Message Archive`
+        {where}
+        GROUP BY month, type, status
+        ORDER BY month DESC""",
+        {"phone_number": phone_number, "from_date": from_date, "to_date": to_date},
+        as_dict=True,
+    )
@@ -0,0 +1,207 @@
+"""Scheduled sends and quiet hours.
+
+WhatsApp Messages with a future `send_at`, and the time zone groups of a
+Bulk WhatsApp Message with a Scheduled Time, are kept in one Redis sorted
+set scored by due time. Every minute the due members are popped
+atomically and released to the normal send path, so deferred messages
+cost nothing until then. The database stays the source of truth: an
+hourly job puts back whatever the sorted set lost.
+
+Quiet hours (WhatsApp Settings) move a send to the end of the quiet
+period in the recipient's time zone.
+"""
+import json
+from datetime import datetime, timedelta
+from functools import partial
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import frappe
+from frappe.utils import add_to_date, get_datetime, get_system_timezone, get_time, now_datetime
+
+from frappe_whatsapp.utils.timings import mark_doc
+
+SCHEDULE_KEY = "whatsapp_send_schedule"
+RELEASE_BATCH = 1000
+# members released per tick; the rest are picked up by the next one
+MAX_PER_TICK = 50000
+SEND_CHUNK = 100
+# status of a message claimed by a send job; back to Scheduled if the job
+# died, after longer than any job may run
+SENDING = "Sending"
+STALE_CLAIM_MINUTES = 30
+
+# pops due members atomically, so two schedulers never release one twice
+POP_DUE = """
+local members = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #members > 0 then
+    redis.call('ZREM', KEYS[1], unpack(members))
+end
+return members
+"""
+
+
+def get_zone(time_zone=None):
+    try:
+        return ZoneInfo(time_zone or get_system_timezone())
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(get_system_timezone())
+
+
+def get_quiet_hours():
+    """(start, end) times of the quiet hours, or None."""
+    settings = frappe.get_cached_doc("WhatsApp Settings")
+    if settings.quiet_hours_start and settings.quiet_hours_end:
+        return get_time(settings.quiet_hours_start), get_time(settings.quiet_hours_end)
+    return None
+
+
+def after_quiet_hours(at, start, end):
+    """`at`, or the end of the quiet hours it falls in, in the time zone of `at`."""
+    time = at.time()
+    if start <= end:
+        if not start <= time < end:
+            return at
+        end_date = at.date()
+    else:
+        # e.g. 21:00 to 08:00, across midnight
+        if end <= time < start:
+            return at
+        end_date = at.date() + timedelta(days=1) if time >= start else at.date()
+    return datetime.combine(end_date, end, tzinfo=at.tzinfo)
+
+
+def get_send_time(send_at=None, time_zone=None, local=False, quiet_hours=None):
+    """When to send, as a naive datetime in the system time zone.
+
+    Args:
+        send_at: Requested time, naive, in the system time zone; now if empty
+        time_zone: Time zone of the recipient
+        local: Read `send_at` as wall-clock time in `time_zone`, e.g. 9:00
+            for every recipient
+        quiet_hours: (start, end) times in the recipient's time zone
+    """
+    system_zone = get_zone()
+    zone = get_zone(time_zone)
+    send_at = get_datetime(send_at) if send_at else now_datetime()
+
+    at = send_at.replace(tzinfo=zone if local else system_zone).astimezone(zone)
+    if quiet_hours:
+        at = after_quiet_hours(at, *quiet_hours)
+    return at.astimezone(system_zone).replace(tzinfo=None)
+
+
+def get_timestamp(send_at):
+    return get_datetime(send_at).replace(tzinfo=get_zone()).timestamp()
+
+
+def schedule_send(member, send_at):
+    """Add a "doctype|name[|time zone]" member to the schedule."""
+    cache = frappe.cache()
+    pipe = cache.pipeline(transaction=False)
+    pipe.zadd(cache.make_key(SCHEDULE_KEY), {member: get_timestamp(send_at)})
+    pipe.execute()
+
+
+def schedule_after_commit(member, send_at):
+    # a release before the commit would not find the document yet
+    frappe.db.after_commit.add(partial(schedule_send, member, send_at))
+
+
+def release_due_sends():
+    """Scheduler job: release every scheduled send that is due."""
+    cache = frappe.cache()
+    key = cache.make_key(SCHEDULE_KEY)
+    now = now_datetime().replace(tzinfo=get_zone()).timestamp()
+    released = 0
+
+    while released < MAX_PER_TICK:
+        members = [member.decode() for member in cache.eval(POP_DUE, 1, key, now, RELEASE_BATCH)]
+        messages = []
+        for member in members:
+            doctype, name, *time_zone = member.split("|")
+            if doctype == "WhatsApp Message":
+                messages.append(name)
+            elif doctype == "Bulk WhatsApp Message":
+                frappe.enqueue_doc(
+                    doctype, name, "release_scheduled",
+                    queue="long",
+                    job_id=f"whatsapp_release|{member}",
+                    deduplicate=True,
+                    time_zone=time_zone[0] if time_zone else "",
+                )
+
+        for start in range(0, len(messages), SEND_CHUNK):
+            frappe.enqueue(
+                "frappe_whatsapp.utils.scheduled_send.send_scheduled_messages",
+                names=messages[start:start + SEND_CHUNK],
+            )
+
+        released += len(members)
+        if len(members) < RELEASE_BATCH:
+            break
+
+
+def send_scheduled_messages(names):
+    """Send scheduled messages, each claimed first so it is sent only once.
+
+    A member can be released twice, e.g. when `reschedule_pending` puts it
+    back before its job ran; the second release finds it no longer Scheduled.
+    The claim also sets `modified`, so `reschedule_pending` can tell a job
+    that died mid-send.
+    """
+    for name in names:
+        if frappe.db.get_value("WhatsApp Message", name, "status", for_update=True) != "Scheduled":
+            frappe.db.commit()
+            continue
+        frappe.db.set_value("WhatsApp Message", name, "status", SENDING)
+        frappe.db.commit()
+
+        doc = frappe.get_doc("WhatsApp Message", name)
+        mark_doc(doc, "queued")
+        try:
+            doc.send()
+            if doc.status == SENDING:
+                doc.status = "Queued"
+        except Exception:
+            doc.status = "Failed"
+            frappe.log_error(title=f"Scheduled WhatsApp message {name} failed")
+        doc.db_update()
+        frappe.db.commit()
+
+
+def reschedule_pending():
+    """Hourly job: put scheduled sends the sorted set lost back into it.
+
+    Adding a member again only sets the same score, and a member released
+    twice is sent once, so this is idempotent. Messages whose send job died
+    after claiming them are scheduled again.
+    """
+    stale = frappe.get_all(
+        "WhatsApp Message",
+        filters={
+            "send_at": ("is", "set"),
+            "status": SENDING,
+            "message_id": ("is", "not set"),
+            "modified": ("<", add_to_date(now_datetime(), minutes=-STALE_CLAIM_MINUTES)),
+        },
+        pluck="name",
+    )
+    if stale:
+        frappe.db.set_value("WhatsApp Message", {"name": ("in", stale)}, "status", "Scheduled")
+        frappe.db.commit()
+
+    for message in frappe.get_all(
+        "WhatsApp Message",
+        filters={"send_at": ("is", "set"), "status": "Scheduled"},
+        fields=["name", "send_at"],
+    ):
+        schedule_send(f"WhatsApp Message|{message.name}", message.send_at)
+
+    for bulk in frappe.get_all(
+        "Bulk WhatsApp Message",
+        filters={"docstatus": 1, "status": "Scheduled"},
+        fields=["name", "send_schedule"],
+    ):
+        for time_zone, group in json.loads(bulk.send_schedule).items():
+            if not group.get("released"):
+                schedule_send(f"Bulk WhatsApp Message|{bulk.name}|{time_zone}", group["send_at"])
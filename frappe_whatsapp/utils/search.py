@@ -0,0 +1,240 @@
+"""Full-text search over WhatsApp Message.
+
+A `LIKE '%...%'` over the message column scans the whole table. Message
+text, profile name and number are instead indexed in a SQLite FTS5
+database next to the site config. New messages are pushed to a Redis list
+on insert and indexed in batches every minute; search results are ranked
+with BM25 and read back from WhatsApp Message with the user's permissions.
+
+The index is a file in the site folder of the host that runs the
+scheduler. Setups with several hosts (or a site folder on NFS, where
+SQLite locking is unreliable) get diverging indexes and should keep
+search disabled.
+"""
+import html
+import re
+import sqlite3
+import threading
+
+import frappe
+from frappe.utils import cint, strip_html_tags
+
+from frappe_whatsapp.utils import normalize_number
+
+SEARCH_QUEUE_KEY = "whatsapp_search_queue"
+INDEX_FILE = "whatsapp_message_search.db"
+BATCH_SIZE = 500
+# messages indexed per scheduler run; the rest wait for the next one
+MAX_PER_RUN = 20000
+SNIPPET_START, SNIPPET_END = "\x02", "\x03"
+RESULT_FIELDS = ["name", "type", "from", "to", "contact_number", "profile_name", "content_type", "creation"]
+
+# sqlite connections may only be used by the thread that opened them
+_local = threading.local()
+
+
+def is_enabled():
+    return bool(frappe.get_cached_doc("WhatsApp Settings").enable_message_search)
+
+
+def get_connection():
+    path = frappe.get_site_path(INDEX_FILE)
+    if not hasattr(_local, "connections"):
+        _local.connections = {}
+    conn = _local.connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        create_tables(conn)
+        _local.connections[path] = conn
+    return conn
+
+
+def create_tables(conn):
+    # FTS5 rows are keyed by integer rowid; `documents` maps it to the message name
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS documents (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE,
+            contact_number TEXT,
+            creation TEXT
+        );
+        CREATE INDEX IF NOT EXISTS documents_contact_number ON documents (contact_number, creation);
+        CREATE VIRTUAL TABLE IF NOT EXISTS messages USING fts5(
+            body, profile_name, number, tokenize = 'unicode61 remove_diacritics 2'
+        );
+    """)
+
+
+def queue_message(doc):
+    """Queue a new WhatsApp Message for indexing; called from after_insert."""
+    if is_enabled():
+        frappe.cache().rpush(SEARCH_QUEUE_KEY, doc.name)
+
+
+def index_messages(names):
+    """Add or refresh messages in the index, in one SQLite transaction."""
+    rows = frappe.get_all(
+        "WhatsApp Message",
+        filters={"name": ("in", list(names))},
+        fields=["name", "message", "profile_name", "contact_number", "creation"],
+    )
+    conn = get_connection()
+    with conn:
+        for row in rows:
+            conn.execute(
+                "INSERT OR IGNORE INTO documents (name, contact_number, creation) VALUES (?, ?, ?)",
+                (row.name, row.contact_number, str(row.creation)),
+            )
+            rowid = conn.execute("SELECT id FROM documents WHERE name = ?", (row.name,)).fetchone()[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO messages (rowid, body, profile_name, number) VALUES (?, ?, ?, ?)",
+                (rowid, strip_html_tags(row.message or ""), row.profile_name or "", row.contact_number or ""),
+            )
+    return len(rows)
+
+
+def remove_from_index(names):
+    """Drop messages from the index, e.g. after they were archived."""
+    if not names or not is_enabled():
+        return
+    conn = get_connection()
+    with conn:
+        for name in names:
+            row = conn.execute("SELECT id FROM documents WHERE name = ?", (name,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM messages WHERE rowid = ?", row)
+                conn.execute("DELETE FROM documents WHERE id = ?", row)
+
+
+def index_queued_messages():
+    """Scheduler job: index the messages queued since the last run."""
+    if not is_enabled():
+        return
+
+    cache = frappe.cache()
+    key = cache.make_key(SEARCH_QUEUE_KEY)
+    indexed = 0
+    while indexed < MAX_PER_RUN:
+        names = [name.decode() for name in cache.lrange(key, 0, BATCH_SIZE - 1)]
+        if not names:
+            break
+        index_messages(names)
+        # trimmed only once indexed, so a failed batch is retried next run
+        cache.ltrim(key, len(names), -1)
+        indexed += len(names)
+
+
+@frappe.whitelist()
+def rebuild_search_index():
+    frappe.only_for("System Manager")
+    frappe.enqueue(
+        "frappe_whatsapp.utils.search.build_search_index",
+        queue="long",
+        timeout=4 * 60 * 60,
+        job_id="whatsapp_build_search_index",
+        deduplicate=True,
+    )
+
+
+def build_search_index():
+    """Index every WhatsApp Message, walking the primary key in batches."""
+    conn = get_connection()
+    with conn:
+        conn.execute("DELETE FROM messages")
+        conn.execute("DELETE FROM documents")
+
+    last = ""
+    while True:
+        names = frappe.get_all(
+            "WhatsApp Message",
+            filters={"name": (">", last)},
+            order_by="name asc",
+            limit_page_length=BATCH_SIZE,
+            pluck="name",
+        )
+        if not names:
+            break
+        index_messages(names)
+        last = names[-1]
+
+    with conn:
+        conn.execute("INSERT INTO messages (messages) VALUES ('optimize')")
+
+
+def get_match_query(query):
+    """FTS5 query of a search box text.
+
+    Quoted phrases are kept, every other word is required and the last one
+    matches as a prefix, so results show up while typing. Operators typed
+    by the user are not interpreted.
+    """
+    query = query or ""
+    phrases = [phrase.strip() for phrase in re.findall(r'"([^"]*)"', query) if phrase.strip()]
+    words = re.findall(r"\w+", re.sub(r'"[^"]*"?', " ", query))
+
+    terms = [f'"{phrase}"' for phrase in phrases] + [f'"{word}"' for word in words]
+    if words and not query.rstrip().endswith('"'):
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def get_snippet(snippet):
+    return html.escape(snippet).replace(SNIPPET_START, "<mark>").replace(SNIPPET_END, "</mark>")
+
+
+@frappe.whitelist()
+def search_messages(query, contact_number=None, page=1, page_length=20):
+    """Messages matching a search, best match first.
+
+    Args:
+        query: Words or "quoted phrases" to search for
+        contact_number: Only search the chat with this number
+        page: Page number, from 1
+        page_length: Results per page
+
+    Returns:
+        dict: `results` (WhatsApp Message fields with a highlighted
+            `snippet`) and `has_more`
+    """
+    frappe.has_permission("WhatsApp Message", "read", throw=True)
+    match_query = get_match_query(query)
+    if not match_query:
+        return {"results": [], "has_more": False}
+
+    page_length = min(cint(page_length) or 20, 100)
+    offset = (max(cint(page), 1) - 1) * page_length
+    conditions = ["messages MATCH ?"]
+    values = [match_query]
+    if contact_number:
+        conditions.append("documents.contact_number = ?")
+        values.append(normalize_number(contact_number))
+
+    # body counts more than the profile name, and that more than the number
+    hits = get_connection().execute(
+        f"""SELECT documents.name,
+            snippet(messages, 0, ?, ?, '…', 16)
+        FROM messages JOIN documents ON documents.id = messages.rowid
+        WHERE {" AND ".join(conditions)}
+        ORDER BY bm25(messages, 5.0, 2.0, 1.0)
+        LIMIT ? OFFSET ?""",
+        (SNIPPET_START, SNIPPET_END, *values, page_length + 1, offset),
+    ).fetchall()
+
+    snippets = dict(hits[:page_length])
+    messages = {
+        message.name: message
+        for message in frappe.get_list(
+            "WhatsApp Message", filters={"name": ("in", list(snippets))}, fields=RESULT_FIELDS
+        )
+    } if snippets else {}
+
+    return {
+        "results": [
+            {**messages[name], "snippet": get_snippet(snippet)}
+            for name, snippet in snippets.items()
+            if name in messages
+        ],
+        "has_more": len(hits) > page_length,
+    }
@@ -0,0 +1,184 @@
+"""24-hour customer service window.
+
+Meta only accepts free-form (non-template) messages to a number that has
+messaged us in the last 24 hours. The time of the last inbound message
+of every number is kept in one Redis hash, written by the webhook and
+filled from WhatsApp Conversation on a miss, so senders can check the
+window before making a request that is bound to fail.
+"""
+import time
+
+import frappe
+from frappe import _
+from frappe.utils import get_datetime
+
+from frappe_whatsapp.utils import normalize_number
+
+LAST_INBOUND_KEY = "whatsapp_last_inbound"
+WINDOW_SECONDS = 24 * 60 * 60
+# leave time for the request to reach Meta before the window closes
+WINDOW_MARGIN = 60
+CHUNK_SIZE = 1000
+
+# WhatsApp Settings.outside_window_action
+SEND = "Send"
+REJECT = "Reject"
+SEND_TEMPLATE = "Send Template"
+QUEUE = "Queue"
+
+
+class ServiceWindowClosedError(frappe.ValidationError):
+    pass
+
+
+def get_timestamp(value):
+    return get_datetime(value).timestamp() if value else time.time()
+
+
+def record_inbound(number, at=None):
+    """Open the window of `number`; called for every incoming message."""
+    number = normalize_number(number)
+    if not number:
+        return
+    cache = frappe.cache()
+    pipe = cache.pipeline(transaction=False)
+    pipe.hset(cache.make_key(LAST_INBOUND_KEY), number, get_timestamp(at))
+    pipe.execute()
+
+
+def get_last_inbound(numbers):
+    """Time of the last inbound message of many numbers.
+
+    Args:
+        numbers: Normalized phone numbers
+
+    Returns:
+        dict: {number: epoch seconds, or None if the number never wrote}
+    """
+    numbers = list(dict.fromkeys(filter(None, numbers)))
+    if not numbers:
+        return {}
+
+    cache = frappe.cache()
+    key = cache.make_key(LAST_INBOUND_KEY)
+    # raw values through a pipeline: cache.hget would try to unpickle them
+    pipe = cache.pipeline(transaction=False)
+    for start in range(0, len(numbers), CHUNK_SIZE):
+        pipe.hmget(key, numbers[start:start + CHUNK_SIZE])
+    values = [value for chunk in pipe.execute() for value in chunk]
+
+    result = {}
+    missing = []
+    for number, value in zip(numbers, values):
+        if value is None:
+            missing.append(number)
+        else:
+            result[number] = float(value) or None
+
+    if missing:
+        found = {}
+        for start in range(0, len(missing), CHUNK_SIZE):
+            for row in frappe.get_all(
+                "WhatsApp Conversation",
+                filters={"name": ("in", missing[start:start + CHUNK_SIZE])},
+                fields=["name", "last_inbound_at"],
+            ):
+                if row.last_inbound_at:
+                    found[row.name] = get_timestamp(row.last_inbound_at)
+
+        # hsetnx: never overwrite a newer time written by the webhook meanwhile
+        for number in missing:
+            result[number] = found.get(number)
+            pipe.hsetnx(key, number, found.get(number) or 0)
+        pipe.execute()
+
+    return result
+
+
+def is_open(last_inbound, now=None):
+    return bool(last_inbound) and (now or time.time()) - last_inbound < WINDOW_SECONDS - WINDOW_MARGIN
+
+
+def is_window_open(number):
+    number = normalize_number(number)
+    return is_open(get_last_inbound([number]).get(number))
+
+
+@frappe.whitelist()
+def split_by_window(numbers):
+    """Split recipients of a campaign by whether free-form messages reach them.
+
+    Args:
+        numbers: List (or JSON list) of phone numbers, in any format
+
+    Returns:
+        dict: `open` and `closed` lists of the numbers as given
+    """
+    numbers = frappe.parse_json(numbers) if isinstance(numbers, str) else numbers
+    normalized = {number: normalize_number(number) for number in numbers}
+    last_inbound = get_last_inbound(normalized.values())
+
+    now = time.time()
+    result = {"open": [], "closed": []}
+    for number, normalized_number in normalized.items():
+        result["open" if is_open(last_inbound.get(normalized_number), now) else "closed"].append(number)
+    return result
+
+
+def get_outside_window_action(number):
+    """What to do with a free-form message to `number`.
+
+    Returns:
+        str: None when it can be sent, else Reject, Send Template or Queue
+    """
+    action = frappe.get_cached_doc("WhatsApp Settings").outside_window_action or SEND
+    if action == SEND or is_window_open(number):
+        return None
+    return action
+
+
+def get_window_template():
+    template = frappe.get_cached_doc("WhatsApp Settings").window_template
+    if not template:
+        frappe.throw(
+            _("Set a Window Template in WhatsApp Settings to reach numbers outside the 24 hour window"),
+            exc=ServiceWindowClosedError,
+        )
+    template = frappe.get_cached_doc("WhatsApp Templates", template)
+    if template.sample_values:
+        # checked on save of the settings, but the template may have changed since
+        frappe.throw(
+            _("Window Template {0} must not have body variables").format(template.name),
+            exc=ServiceWindowClosedError,
+        )
+    return template
+
+
+def throw_window_closed(number):
+    frappe.throw(
+        _("{0} has not messaged in the last 24 hours, only template messages can be sent").format(number),
+        exc=ServiceWindowClosedError,
+        title=_("Outside Service Window"),
+    )
+
+
+def get_queued_filters(number):
+    # bulk messages are also created as Queued, but are sent on insert
+    return {"contact_number": number, "type": "Outgoing", "status": "Queued", "message_id": ("is", "not set")}
+
+
+def send_queued_messages(number):
+    """Send the free-form messages queued for `number` now that its window is open."""
+    for name in frappe.get_all(
+        "WhatsApp Message",
+        filters=get_queued_filters(number),
+        order_by="creation asc",
+        pluck="name",
+    ):
+        doc = frappe.get_doc("WhatsApp Message", name)
+        try:
+            doc.send_message()
+        except Exception:
+            frappe.log_error(title=f"Queued WhatsApp message {name} failed")
+        doc.db_update()
+        frappe.db.commit()
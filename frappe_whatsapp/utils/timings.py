@@ -0,0 +1,125 @@
+"""Lifecycle timings of outgoing WhatsApp messages.
+
+Every outgoing message keeps `{stage: unix time}` in its `timings` field.
+Stages up to `api_accepted` use the server clock; `sent`, `delivered`,
+`read` and `failed` use the `timestamp` of the status webhook. A stage
+keeps its first timestamp, so late or repeated webhooks change nothing.
+"""
+import json
+import time
+
+import frappe
+from frappe.utils import add_days, getdate
+
+STAGES = ("triggered", "queued", "api_request", "api_accepted", "sent", "delivered", "read", "failed")
+PERCENTILES = (50, 90, 95, 99)
+GROUP_BY_FIELDS = {
+    "template": "template",
+    "campaign": "bulk_message_reference",
+    "notification": "notification",
+}
+
+
+def now_ts():
+    return round(time.time(), 3)
+
+
+def parse_timings(value):
+    if not value:
+        return {}
+    if isinstance(value, str):
+        return json.loads(value)
+    return dict(value)
+
+
+def dump_timings(timings):
+    return json.dumps(timings, separators=(",", ":"))
+
+
+def mark(timings, stage, ts=None):
+    """Set a stage in a timings dict unless it is already set.
+
+    Returns:
+        bool: True if the stage was added
+    """
+    if stage not in STAGES or stage in timings:
+        return False
+    timings[stage] = round(float(ts), 3) if ts else now_ts()
+    return True
+
+
+def mark_doc(doc, stage, ts=None):
+    """Set a stage in the `timings` field of a WhatsApp Message document."""
+    timings = parse_timings(doc.get("timings"))
+    if mark(timings, stage, ts):
+        doc.timings = dump_timings(timings)
+
+
+@frappe.whitelist()
+def get_latency_stats(from_date=None, to_date=None, group_by="template",
+                      from_stage="queued", to_stage="delivered"):
+    """Latency percentiles between two lifecycle stages.
+
+    Args:
+        from_date: Optional first day of message creation
+        to_date: Optional last day of message creation
+        group_by: template, campaign or notification
+        from_stage: Stage the latency is measured from
+        to_stage: Stage the latency is measured to
+
+    Returns:
+        list: One row per group with the message count and p50, p90,
+            p95, p99 and max latency in seconds, slowest p95 first
+    """
+    frappe.has_permission("WhatsApp Message", throw=True)
+    group_field = GROUP_BY_FIELDS.get(group_by)
+    if not group_field:
+        frappe.throw(f"Cannot group by {group_by}")
+    if from_stage not in STAGES or to_stage not in STAGES:
+        frappe.throw(f"Stages must be one of {', '.join(STAGES)}")
+
+    conditions = ""
+    if from_date:
+        conditions += " AND creation >= %(from_date)s"
+    if to_date:
+        conditions += " AND creation < %(to_date)s"
+
+    # ranked and aggregated in the database: only one row per group comes back
+    percentiles = ",\n".join(
+        f"MAX(CASE WHEN row_rank = GREATEST(CEIL({percentile} / 100 * messages), 1) "
+        f"THEN latency END) AS p{percentile}"
+        for percentile in PERCENTILES
+    )
+    rows = frappe.db.sql(
+        f"""SELECT grp AS `{group_by}`, MAX(messages) AS messages,
+            {percentiles},
+            MAX(latency) AS `max`
+        FROM (
+            SELECT grp, latency,
+                ROW_NUMBER() OVER (PARTITION BY grp ORDER BY latency) AS row_rank,
+                COUNT(*) OVER (PARTITION BY grp) AS messages
+            FROM (
+                SELECT `{group_field}` AS grp,
+                    GREATEST(JSON_EXTRACT(timings, %(to_path)s) - JSON_EXTRACT(timings, %(from_path)s), 0)
+                        AS latency
+                FROM `tabWhatsApp Message`
+                WHERE type = 'Outgoing'
+                    AND JSON_EXTRACT(timings, %(from_path)s) IS NOT NULL
+                    AND JSON_EXTRACT(timings, %(to_path)s) IS NOT NULL
+                    {conditions}
+            ) latencies
+        ) ranked
+        GROUP BY grp
+        ORDER BY p95 DESC""",
+        {
+            "from_path": f"$.{from_stage}",
+            "to_path": f"$.{to_stage}",
+            "from_date": from_date,
+            "to_date": add_days(getdate(to_date), 1) if to_date else None,
+        },
+        as_dict=True,
+    )
+    for row in rows:
+        for field in [f"p{percentile}" for percentile in PERCENTILES] + ["max"]:
+            row[field] = round(float(row[field]), 3)
+    return rows
@@ -3,9 +3,54 @@ import frappe
 import json
 import requests
 import time
+import zlib
 from werkzeug.wrappers import Response
 import frappe.utils
-from datetime import datetime
+from frappe.utils.password import encrypt
+from frappe_whatsapp.utils.payload_store import (
+	get_storage_mode,
+	get_webhook_summary,
+	store_payload,
+)
+from frappe_whatsapp.utils.calling import apply_call_event
+from frappe_whatsapp.utils.message_handlers import MEDIA_TIMEOUT, process_messages
+from frappe_whatsapp.utils.realtime import publish_message
+from frappe_whatsapp.utils.metrics import record_webhook
+from frappe_whatsapp.utils.timings import mark_doc
+from frappe_whatsapp.ingest import (
+	INGEST_CONFIG_KEY,
+	INGEST_FAILED_KEY,
+	INGEST_PENDING_KEY,
+	INGEST_QUEUE_KEY,
+)
+
+# events of one contact go to one lane and are processed in order by its job
+LANE_KEY = "whatsapp_webhook_lane"
+LANE_LOCK_KEY = "whatsapp_webhook_lane_lock"
+# refreshed between payloads and before every media request, so it only
+# has to outlast one request plus the database work of a payload
+LANE_LOCK_TTL = 4 * MEDIA_TIMEOUT
+# the lane lock holds a token of its job, so a job whose lock expired
+# neither extends nor releases the lock a second job took since
+REFRESH_LANE_LOCK = """
+local owner = redis.call('GET', KEYS[1])
+if owner == ARGV[1] or not owner then
+	redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+	return 1
+end
+return 0
+"""
+RELEASE_LANE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+	return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+# lanes the drain job checks for leftovers, whatever the current setting
+MAX_LANES = 64
+
+# a message never goes back to an earlier status, whatever order callbacks arrive in
+STATUS_ORDER = {"sent": 1, "delivered": 2, "read": 3, "failed": 4}
 
 
 @frappe.whitelist(allow_guest=True)
@@ -30,12 +75,112 @@ def get():
 
 def post():
 	"""Post."""
-	data = frappe.local.form_dict
-	frappe.get_doc({
-		"doctype": "WhatsApp Notification Log",
-		"template": "Webhook",
-		"meta_data": json.dumps(data)
-	}).insert(ignore_permissions=True)
+	if get_lane_count():
+		route_payload(frappe.local.form_dict)
+	else:
+		process_payload(frappe.local.form_dict)
+
+def get_lane_count():
+	return min(frappe.get_cached_doc("WhatsApp Settings").webhook_lanes or 0, MAX_LANES)
+
+def get_lane_key(data):
+	"""Contact number of a payload, so a message and its statuses share a lane."""
+	try:
+		value = data["entry"][0]["changes"][0]["value"]
+	except (KeyError, IndexError, TypeError):
+		return ""
+
+	for message in value.get("messages") or []:
+		return message.get("from") or ""
+	for status in value.get("statuses") or []:
+		return status.get("recipient_id") or status.get("id") or ""
+	for call in value.get("calls") or []:
+		return call.get("from") or call.get("id") or ""
+	return str(value.get("message_template_id") or "")
+
+def get_lane(key, lanes):
+	# crc32, unlike hash(), is the same in every process
+	return zlib.crc32(key.encode()) % lanes
+
+def route_payload(data, lanes=None):
+	"""Queue a payload on the lane of its contact and wake the lane.
+
+	Args:
+		data: Payload, or its raw JSON
+		lanes: Number of lanes, from WhatsApp Settings if not given
+	"""
+	raw = data if isinstance(data, (str, bytes)) else json.dumps(data)
+	if not isinstance(data, dict):
+		data = json.loads(raw)
+	lane = get_lane(get_lane_key(data), lanes or get_lane_count())
+	frappe.cache().rpush(f"{LANE_KEY}|{lane}", raw)
+	wake_lane(lane)
+
+def wake_lane(lane):
+	frappe.enqueue(
+		"frappe_whatsapp.utils.webhook.process_lane",
+		queue="short",
+		job_id=f"{LANE_KEY}|{lane}",
+		deduplicate=True,
+		lane=lane,
+	)
+
+def process_lane(lane):
+	"""Process the payloads of one lane in order.
+
+	A lock keeps a second job off the lane. The queue is checked again
+	after the lock is released, as payloads pushed meanwhile did not
+	enqueue a job while this one was running.
+	"""
+	cache = frappe.cache()
+	queue = f"{LANE_KEY}|{lane}"
+	lock = cache.make_key(f"{LANE_LOCK_KEY}|{lane}")
+	token = frappe.generate_hash(length=20)
+
+	while cache.llen(queue):
+		if not cache.set(lock, token, nx=True, ex=LANE_LOCK_TTL):
+			# another job has the lane
+			return
+		frappe.flags.whatsapp_lane_lock = (lock, token)
+		try:
+			while True:
+				raw = cache.lpop(queue)
+				if raw is None:
+					break
+				process_raw_payload(raw)
+				if not refresh_lane_lock():
+					# the lock expired and another job took the lane
+					return
+		finally:
+			frappe.flags.whatsapp_lane_lock = None
+			cache.eval(RELEASE_LANE_LOCK, 1, lock, token)
+
+def refresh_lane_lock():
+	"""Extend the lock of the lane being processed, e.g. before a slow download.
+
+	Returns:
+		bool: False if another job took the lane
+	"""
+	lane_lock = frappe.flags.whatsapp_lane_lock
+	if not lane_lock:
+		return True
+	return bool(frappe.cache().eval(REFRESH_LANE_LOCK, 1, *lane_lock, LANE_LOCK_TTL))
+
+def process_raw_payload(raw):
+	"""Process a queued payload, moving it to the dead letter list if it fails."""
+	cache = frappe.cache()
+	try:
+		process_payload(json.loads(raw))
+		frappe.db.commit()
+	except Exception:
+		frappe.db.rollback()
+		cache.rpush(INGEST_FAILED_KEY, raw)
+		frappe.log_error(title="WhatsApp webhook processing failed")
+
+def process_payload(data):
+	"""Log and process one webhook payload."""
+	log_webhook(data)
+	record_webhook(data)
 
 	messages = []
 	try:
@@ -54,119 +199,7 @@ def post():
 
 
 	if messages:
-		for message in messages:
-			message_type = message['type']
-			is_reply = True if message.get('context') else False
-			reply_to_message_id = message['context']['id'] if is_reply else None
-			if message_type == 'text':
-				frappe.get_doc({
-					"doctype": "WhatsApp Message",
-					"type": "Incoming",
-					"from": message['from'],
-					"message": message['text']['body'],
-					"message_id": message['id'],
-					"reply_to_message_id": reply_to_message_id,
-					"is_reply": is_reply,
-					"content_type":message_type,
-					"profile_name":sender_profile_name
-				}).insert(ignore_permissions=True)
-			elif message_type == 'reaction':
-				frappe.get_doc({
-					"doctype": "WhatsApp Message",
-					"type": "Incoming",
-					"from": message['from'],
-					"message": message['reaction']['emoji'],
-					"reply_to_message_id": message['reaction']['message_id'],
-					"message_id": message['id'],
-					"content_type": "reaction",
-					"profile_name":sender_profile_name
-				}).insert(ignore_permissions=True)
-			elif message_type == 'interactive':
-				frappe.get_doc({
-					"doctype": "WhatsApp Message",
-					"type": "Incoming",
-					"from": message['from'],
-					"message": message['interactive']['nfm_reply']['response_json'],
-					"message_id": message['id'],
-					"content_type": "flow",
-					"profile_name":sender_profile_name
-				}).insert(ignore_permissions=True)
-			elif message_type in ["image", "audio", "video", "document"]:
-				settings = frappe.get_doc(
-							"WhatsApp Settings", "WhatsApp Settings",
-						)
-				token = settings.get_password("token")
-				url = f"{settings.url}/{settings.version}/"
-
-
-				media_id = message[message_type]["id"]
-				headers = {
-					'Authorization': 'Bearer ' + token
-
-				}
-				response = requests.get(f'{url}{media_id}/', headers=headers)
-
-				if response.status_code == 200:
-					media_data = response.json()
-					media_url = media_data.get("url")
-					mime_type = media_data.get("mime_type")
-					file_extension = mime_type.split('/')[1]
-
-					media_response = requests.get(media_url, headers=headers)
-					if media_response.status_code == 200:
-
-						file_data = media_response.content
-						file_name = f"{frappe.generate_hash(length=10)}.{file_extension}"
-
-						message_doc = frappe.get_doc({
-							"doctype": "WhatsApp Message",
-							"type": "Incoming",
-							"from": message['from'],
-							"message_id": message['id'],
-							"reply_to_message_id": reply_to_message_id,
-							"is_reply": is_reply,
-							"message": message[message_type].get("caption",f"/files/{file_name}"),
-							"content_type" : message_type,
-							"profile_name":sender_profile_name
-						}).insert(ignore_permissions=True)
-
-						file = frappe.get_doc(
-							{
-								"doctype": "File",
-								"file_name": file_name,
-								"attached_to_doctype": "WhatsApp Message",
-								"attached_to_name": message_doc.name,
-								"content": file_data,
-								"attached_to_field": "attach"
-							}
-						).save(ignore_permissions=True)
-
-
-						message_doc.attach = file.file_url
-						message_doc.save()
-			elif message_type == "button":
-				frappe.get_doc({
-					"doctype": "WhatsApp Message",
-					"type": "Incoming",
-					"from": message['from'],
-					"message": message['button']['text'],
-					"message_id": message['id'],
-					"reply_to_message_id": reply_to_message_id,
-					"is_reply": is_reply,
-					"content_type": message_type,
-					"profile_name":sender_profile_name
-				}).insert(ignore_permissions=True)
-			else:
-				frappe.get_doc({
-					"doctype": "WhatsApp Message",
-					"type": "Incoming",
-					"from": message['from'],
-					"message_id": message['id'],
-					"message": message[message_type].get(message_type),
-					"content_type" : message_type,
-					"profile_name":sender_profile_name
-				}).insert(ignore_permissions=True)
-
+		process_messages(messages, sender_profile_name)
 	else:
 		changes = None
 		try:
@@ -181,49 +214,94 @@ def post():
 			update_status(changes)
 	return
 
+def publish_ingest_config():
+	"""Copy the webhook secrets to Redis for frappe_whatsapp.ingest.
+
+	The app secret is stored encrypted with the site's encryption key, so
+	access to the cache alone is not enough to sign a webhook.
+	"""
+	settings = frappe.get_cached_doc("WhatsApp Settings")
+	app_secret = settings.get_password("app_secret", raise_exception=False)
+	cache = frappe.cache()
+	cache.set(cache.make_key(INGEST_CONFIG_KEY), json.dumps({
+		"verify_token": settings.webhook_verify_token,
+		"app_secret": encrypt(app_secret) if app_secret else None,
+	}))
+
+def drain_webhook_queue():
+	"""Process the payloads queued by frappe_whatsapp.ingest, oldest first.
+
+	Enqueued by the ingest app and also run every minute as a safety net.
+	With webhook lanes the payloads are only routed to their lane here.
+	Payloads that fail are moved to a dead letter list.
+	"""
+	publish_ingest_config()
+	cache = frappe.cache()
+	# cleared first, so payloads queued from now on wake a new job
+	cache.delete(cache.make_key(INGEST_PENDING_KEY))
+	lanes = get_lane_count()
+
+	while True:
+		# list helpers of frappe.cache() prefix the key themselves
+		raw = cache.lpop(INGEST_QUEUE_KEY)
+		if raw is None:
+			break
+
+		if not lanes:
+			process_raw_payload(raw)
+			continue
+		try:
+			route_payload(raw, lanes)
+		except Exception:
+			cache.rpush(INGEST_FAILED_KEY, raw)
+			frappe.log_error(title="WhatsApp webhook routing failed")
+
+	# lanes left with payloads, e.g. by a worker restart or a smaller lane count
+	pipe = cache.pipeline(transaction=False)
+	for lane in range(MAX_LANES):
+		pipe.llen(cache.make_key(f"{LANE_KEY}|{lane}"))
+	for lane, length in enumerate(pipe.execute()):
+		if length:
+			wake_lane(lane)
+
+def log_webhook(data):
+	"""Log the callback, keeping the raw payload where the settings ask for it."""
+	event_type, key = get_webhook_summary(data)
+	log = {
+		"doctype": "WhatsApp Notification Log",
+		"template": "Webhook",
+		"event_type": event_type,
+		"message_id": key,
+	}
+
+	storage = get_storage_mode()
+	if storage == "Database":
+		log["meta_data"] = json.dumps(data)
+	elif storage == "Compressed Files":
+		log["payload"] = store_payload(key or frappe.generate_hash(length=10), data)
+
+	frappe.get_doc(log).insert(ignore_permissions=True)
+
+def get_call_meta_data(call_data):
+	"""Raw call payload for WhatsApp Call.meta_data, or None when stored elsewhere."""
+	storage = get_storage_mode()
+	if storage == "Database":
+		return json.dumps(call_data)
+	if storage == "Compressed Files":
+		store_payload(call_data.get("id"), call_data, kind="call")
+
 def handle_call_events(data):
 	"""Handle WhatsApp call events."""
 	calls = data.get("calls", [])
 	
 	for call_data in calls:
-		call_id = call_data.get("id")
-		call_status = call_data.get("status")
-		from_number = call_data.get("from")
-		to_number = call_data.get("to")
-		call_type = call_data.get("type", "voice")
-		
-		# Check if call already exists
-		existing_call = frappe.db.get_value("WhatsApp Call", {"call_id": call_id})
-		
-		if existing_call:
-			# Update existing call
-			call_doc = frappe.get_doc("WhatsApp Call", existing_call)
-			call_doc.update_call_status(
-				status=call_status,
-				meta_data=json.dumps(call_data)
-			)
-		else:
-			# Create new call record
-			call_doc = frappe.get_doc({
-				"doctype": "WhatsApp Call",
-				"type": "Incoming",
-				"from_number": from_number,
-				"to_number": to_number,
-				"status": call_status,
-				"call_id": call_id,
-				"meta_data": json.dumps(call_data)
-			})
-			
-			if call_status == "answered":
-				call_doc.started_at = datetime.now()
-			
-			call_doc.insert(ignore_permissions=True)
+		call_name = apply_call_event(call_data, get_call_meta_data(call_data))
 		
 		# Handle call recording if enabled
 		if call_data.get("recording_url") and frappe.db.get_single_value("WhatsApp Settings", "call_recording_enabled"):
-			handle_call_recording(call_doc, call_data.get("recording_url"))
+			handle_call_recording(call_name, call_data.get("recording_url"))
 
-def handle_call_recording(call_doc, recording_url):
+def handle_call_recording(call_name, recording_url):
 	"""Download and save call recording."""
 	try:
 		settings = frappe.get_doc("WhatsApp Settings", "WhatsApp Settings")
@@ -233,22 +311,21 @@ def handle_call_recording(call_doc, recording_url):
 			'Authorization': 'Bearer ' + token
 		}
 		
-		response = requests.get(recording_url, headers=headers)
+		response = requests.get(recording_url, headers=headers, timeout=MEDIA_TIMEOUT)
 		
 		if response.status_code == 200:
-			file_name = f"call_recording_{call_doc.name}.mp3"
+			file_name = f"call_recording_{call_name}.mp3"
 			
 			file_doc = frappe.get_doc({
 				"doctype": "File",
 				"file_name": file_name,
 				"attached_to_doctype": "WhatsApp Call",
-				"attached_to_name": call_doc.name,
+				"attached_to_name": call_name,
 				"content": response.content,
 				"attached_to_field": "recording_url"
 			}).save(ignore_permissions=True)
 			
-			call_doc.recording_url = file_doc.file_url
-			call_doc.save(ignore_permissions=True)
+			frappe.db.set_value("WhatsApp Call", call_name, "recording_url", file_doc.file_url)
 	
 	except Exception as e:
 		frappe.log_error(f"Failed to save call recording: {str(e)}", "WhatsApp Call Recording")
@@ -272,13 +349,35 @@ def update_template_status(data):
 
 def update_message_status(data):
 	"""Update message status."""
-	id = data['statuses'][0]['id']
-	status = data['statuses'][0]['status']
-	conversation = data['statuses'][0].get('conversation', {}).get('id')
+	for status in data['statuses']:
+		apply_message_status(status)
+
+def is_later_status(status, current):
+	return STATUS_ORDER.get(status, 0) >= STATUS_ORDER.get(current, 0)
+
+def apply_message_status(data):
+	"""Apply one status callback; the timing of the stage is kept even if it arrives late."""
+	id = data['id']
+	status = data['status']
+	conversation = data.get('conversation', {}).get('id')
+	timestamp = data.get('timestamp')
 	name = frappe.db.get_value("WhatsApp Message", filters={"message_id": id})
+	if not name:
+		# not sent from this site, e.g. from the WhatsApp Business app;
+		# the other statuses of the payload are still applied
+		return
 
 	doc = frappe.get_doc("WhatsApp Message", name)
-	doc.status = status
+	if is_later_status(status, doc.status):
+		doc.status = status
+	mark_doc(doc, status, timestamp)
+	errors = data.get('errors')
+	if errors:
+		doc.error_message = "; ".join(
+			f"{error.get('code')}: {error.get('error_data', {}).get('details') or error.get('title')}"
+			for error in errors
+		)
 	if conversation:
 		doc.conversation_id = conversation
-	doc.save(ignore_permissions=True)
\ No newline at end of file
+	doc.save(ignore_permissions=True)
+	publish_message(doc, event="status")
\ No newline at end of file